@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+
+import os
+import time
+import threading
+import numpy as np
+
+import turbo as tb
+import turbo.modules as tm
+
+import pytest
+
+
+def _objective(x):
+    if x > 0.8:
+        time.sleep(30)  # hangs
+    elif x < -0.8:
+        raise ValueError('invalid configuration')
+    elif abs(x) < 0.01:
+        np.ones(2**30)  # 8GB
+    return float(x**2)
+
+
+def _fails_at_minus_09(x):
+    if abs(x + 0.9) < 1e-6:
+        raise ValueError('invalid configuration')
+    return float(x**2)
+
+
+@pytest.mark.skipif(not os.path.exists('/proc/self/statm'), reason='requires Linux')
+def test_worker_pool_failures():
+    # the limit applies to virtual memory, which for a forked worker includes that of the parent
+    vm_size = os.sysconf('SC_PAGE_SIZE') * int(open('/proc/self/statm').read().split()[0])
+    xs = [0.5, 0.9, -0.9, 0.0, 0.25, 0.3]
+    opt = tb.Optimiser(_objective, 'min', [('x', -1, 1)], pre_phase_trials=len(xs))
+    opt.pre_phase_select = tm.manual_selector([np.array([[x]]) for x in xs])
+    opt.async_eval = tm.WorkerPoolAsync(num_workers=2, timeout=1, memory_limit=vm_size + 2**30, start_method='fork')
+    rec = tb.Recorder(opt)
+    start = time.time()
+    opt.run(len(xs))
+    opt.async_eval.shutdown()
+
+    assert time.time() - start < 10
+    reasons = {n: t.eval_info['reason'] for n, t in rec.failed_trials.items()}
+    assert reasons == {1: 'timeout', 2: 'exception', 3: 'memory_limit'}
+    assert 'invalid configuration' in rec.failed_trials[2].eval_info['error']
+    assert sorted(rec.trials) == [0, 4, 5]
+    assert opt.rt.failed_trials == 3 and opt.rt.finished_trials == 3
+    assert opt.rt.trial_ys == [rec.trials[n].y for n in opt.rt.trial_nums]
+
+
+def test_failed_pre_phase_trial_counts_towards_quorum():
+    xs = [0.5, -0.9, 0.25]
+    opt = tb.Optimiser(_fails_at_minus_09, 'min', [('x', -1, 1)], pre_phase_trials=len(xs))
+    opt.pre_phase_select = tm.manual_selector([np.array([[x]]) for x in xs])
+    opt.async_eval = tm.WorkerPoolAsync(num_workers=2, start_method='fork')
+    rec = tb.Recorder(opt)
+    opt.run(5)  # would wait forever for the failed trial to finish
+    opt.async_eval.shutdown()
+
+    assert list(rec.failed_trials) == [1]
+    assert sorted(rec.trials) == [0, 2, 3, 4]
+    assert not rec.trials[3].is_pre_phase() and not rec.trials[4].is_pre_phase()
+
+
+def test_every_pre_phase_trial_failing():
+    xs = [-0.9, -0.95]
+    opt = tb.Optimiser(_objective, 'min', [('x', -1, 1)], pre_phase_trials=len(xs))
+    opt.pre_phase_select = tm.manual_selector([np.array([[x]]) for x in xs])
+    opt.async_eval = tm.WorkerPoolAsync(num_workers=2, start_method='fork')
+    with pytest.raises(RuntimeError, match='all 2 trials failed'):
+        opt.run(4)
+    opt.async_eval.shutdown()
+
+
+def test_worker_pool_recorder_saving(tmp_path):
+    filename = str(tmp_path / 'run.pkl.gz')
+    opt = tb.Optimiser(_fails_at_minus_09, 'min', [('x', -1, 1)], pre_phase_trials=3)
+    opt.async_eval = tm.WorkerPoolAsync(num_workers=2, start_method='fork')
+    tb.Recorder(opt, autosave_filename=filename)
+    opt.run(4)  # saved as each trial finishes
+
+    rec = tb.Recorder.load_compressed(filename, quiet=True)
+    assert sorted(rec.trials) == list(range(4))
+    # the loaded pool starts new workers when needed
+    ae = rec.optimiser.async_eval
+    ae.start_trial(0, _fails_at_minus_09, {'x': 0.5})
+    assert ae.get_finished_trials(wait=True) == [(0, 0.25)]
+    ae.shutdown()
+    opt.async_eval.shutdown()
+
+
+_preload_calls = 0
+_worker_state = {}
+
+
+def _preload():
+    global _preload_calls
+    _preload_calls += 1
+    return np.arange(1000.0)
+
+
+def _setup(data):
+    _worker_state['data'] = data
+    _worker_state['setup_calls'] = _worker_state.get('setup_calls', 0) + 1
+
+
+def _warm_objective(x):
+    info = {'pid': os.getpid(), 'setup_calls': _worker_state['setup_calls']}
+    return float(_worker_state['data'][10] + x), info
+
+
+def test_worker_pool_setup():
+    opt = tb.Optimiser(_warm_objective, 'min', [('x', -1, 1)], pre_phase_trials=12)
+    opt.pre_phase_select = tm.random_selector()
+    opt.async_eval = tm.WorkerPoolAsync(num_workers=3, setup=_setup, preload=_preload, start_method='fork')
+    rec = tb.Recorder(opt)
+    opt.run(12)
+    opt.async_eval.shutdown()
+
+    assert _preload_calls == 1
+    infos = [t.eval_info for t in rec.trials.values()]
+    # every trial was evaluated by one of the persistent workers, which each set up once
+    assert len({i['pid'] for i in infos}) <= 3
+    assert all(i['setup_calls'] == 1 for i in infos)
+    assert all(t.y == 10 + t.x[0, 0] for t in rec.trials.values())
+
+
+def test_resource_scheduler():
+    lock = threading.Lock()
+    cores_in_use = [0, 0]  # current, maximum
+    def f(x):
+        cores = 3 if x > 0 else 1
+        with lock:
+            cores_in_use[0] += cores
+            cores_in_use[1] = max(cores_in_use)
+        time.sleep(0.02)
+        with lock:
+            cores_in_use[0] -= cores
+        return float(x)
+    f.resource_requirements = lambda params: {'cores': 3 if params['x'] > 0 else 1}
+
+    opt = tb.Optimiser(f, 'min', [('x', -1, 1)], pre_phase_trials=16)
+    opt.pre_phase_select = tm.random_selector()
+    opt.async_eval = tm.ResourceScheduler(tm.ThreadAsync(4), cores=4)
+    rec = tb.Recorder(opt)
+    opt.run(16)
+    opt.async_eval.shutdown()
+
+    assert cores_in_use[1] <= 4
+    assert len(rec.trials) == 16
+    assert all(t.queue_time is not None and t.queue_time >= 0 for t in rec.trials.values())
+    assert any(t.queue_time > 0.01 for t in rec.trials.values())
+    assert all(t.eval_time < 0.5 for t in rec.trials.values())
+
+    # requests which can never be satisfied fail rather than waiting forever
+    scheduler = tm.ResourceScheduler(tm.ThreadAsync(1), cores=2, requirements={'cores': 4})
+    scheduler.start_trial(0, f, {'x': 0.5})
+    (trial_num, failure), = scheduler.get_finished_trials(wait=True)
+    assert failure.eval_info['reason'] == 'unsatisfiable'
+    scheduler.shutdown()
+
+
+def _straggling_objective(x, marker):
+    if x > 0.9 and not os.path.exists(marker):
+        open(marker, 'w').close()
+        time.sleep(30)  # only the first copy straggles
+    time.sleep(0.05)
+    return float(x)
+
+
+def test_speculative_duplicates(tmp_path):
+    marker = str(tmp_path / 'marker')
+    xs = [0.1, 0.2, 0.3, 0.95, 0.4, 0.5]
+    opt = tb.Optimiser(lambda x: _straggling_objective(x, marker), 'min', [('x', -1, 1)], pre_phase_trials=len(xs))
+    opt.pre_phase_select = tm.manual_selector([np.array([[x]]) for x in xs])
+    opt.async_eval = tm.WorkerPoolAsync(num_workers=3, speculate=True, min_history=3, start_method='fork')
+    rec = tb.Recorder(opt)
+    start = time.time()
+    opt.run(len(xs))
+    opt.async_eval.shutdown()
+
+    assert time.time() - start < 10
+    assert rec.trials[3].eval_info == {'speculation': {'winner': 'duplicate'}}
+    assert all(rec.trials[n].eval_info is None for n in (0, 1, 2, 4, 5))
+
+
+def _failing_then_hanging_objective(x, marker):
+    if x > 0.9:
+        if not os.path.exists(marker):
+            open(marker, 'w').close()
+            time.sleep(0.5)  # the first copy straggles then fails
+            raise ValueError('invalid configuration')
+        time.sleep(30)  # the duplicate hangs
+    time.sleep(0.05)
+    return float(x)
+
+
+def test_speculative_duplicates_time_out(tmp_path):
+    marker = str(tmp_path / 'marker')
+    xs = [0.1, 0.2, 0.3, 0.95, 0.4, 0.5]
+    opt = tb.Optimiser(lambda x: _failing_then_hanging_objective(x, marker), 'min', [('x', -1, 1)],
+                       pre_phase_trials=len(xs))
+    opt.pre_phase_select = tm.manual_selector([np.array([[x]]) for x in xs])
+    opt.async_eval = tm.WorkerPoolAsync(num_workers=3, timeout=2, speculate=True, min_history=3,
+                                        start_method='fork')
+    rec = tb.Recorder(opt)
+    start = time.time()
+    opt.run(len(xs))
+    opt.async_eval.shutdown()
+
+    assert time.time() - start < 10
+    assert rec.failed_trials[3].eval_info['reason'] == 'timeout'
+    assert rec.failed_trials[3].eval_info['speculation'] == {'winner': 'duplicate'}
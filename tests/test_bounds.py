@@ -0,0 +1,41 @@
+#!/usr/bin/env python3
+
+import numpy as np
+
+import turbo as tb
+
+import pytest
+
+
+def test_bounds_arrays():
+    bounds = tb.Bounds([('a', -1, 1), ('b', 10, 20, 'integer'), ('c', ['x', 'y', 'z'])])
+    assert bounds.names == ['a', 'b', 'c']
+    assert bounds.get_param_index('c') == 2
+    with pytest.raises(KeyError):
+        bounds.get_param_index('d')
+    assert bounds.lows == pytest.approx([-1, 10, 0])
+    assert bounds.ranges == pytest.approx([2, 10, 2])
+
+    U = np.random.rand(20, 3)
+    X = bounds.from_unit_cube(U)
+    assert bounds.to_unit_cube(X) == pytest.approx(U)
+    assert bounds.clip(X + 100) == pytest.approx(np.tile(bounds.highs, (20, 1)))
+
+    with pytest.raises(AssertionError):
+        tb.Bounds([('a', 0, 1), ('a', 0, 1)])
+
+
+def test_snap_returns_a_copy():
+    bounds = tb.Bounds([('a', -1, 1), ('b', 0, 1)])
+    point = np.array([[0.25, 0.5]])
+    snapped = bounds.snap(point)
+    snapped[0, 0] = 0
+    assert point[0, 0] == 0.25
+
+
+def test_fixed_parameters():
+    bounds = tb.Bounds([('a', -1, 1), ('b', 3, 3), ('c', ['only'])])
+    X = np.array([[0.0, 3.0, 0.0], [1.0, 3.0, 0.0]])
+    U = bounds.to_unit_cube(X)
+    assert U == pytest.approx(np.array([[0.5, 0, 0], [1, 0, 0]]))
+    assert bounds.from_unit_cube(U) == pytest.approx(X)
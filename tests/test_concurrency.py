@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+
+import turbo as tb
+import turbo.modules as tm
+
+import pytest
+
+
+def test_concurrency_manager_phases():
+    limits = []
+    class RecordingMaximiser(tm.RandomAndQuasiNewton):
+        def __call__(self, latent_bounds, acq):
+            limits.append(tm.get_worker_limit())
+            return super().__call__(latent_bounds, acq)
+
+    opt = tb.Optimiser(lambda x: x**2, 'min', [('x', -1, 1)], pre_phase_trials=3)
+    opt.aux_optimiser = RecordingMaximiser()
+    opt.concurrency = tm.ConcurrencyManager(total_cores=4, phase_workers={'surrogate_fitting': 2})
+    rec = tb.Recorder(opt)
+    opt.run(5)
+
+    assert limits == [1, 1]
+    for n in (3, 4):
+        decisions = {d['phase']: d for d in rec.trials[n].selection_info['concurrency']}
+        fitting, maximisation = decisions['surrogate_fitting'], decisions['acquisition_maximisation']
+        assert fitting['cores'] == 4 and fitting['evaluating'] == 0
+        assert (fitting['workers'], fitting['blas_threads']) == (2, 2)
+        # the maximiser runs in a single worker which gets every core as BLAS threads
+        assert (maximisation['workers'], maximisation['blas_threads']) == (1, 4)
+        assert fitting['duration'] >= 0 and maximisation['duration'] >= 0
+    assert 'concurrency' not in rec.trials[0].selection_info
+
+
+def test_concurrency_manager_reserves_evaluation_cores():
+    opt = tb.Optimiser(lambda x: x**2, 'min', [('x', -1, 1)], pre_phase_trials=3)
+    manager = tm.ConcurrencyManager(total_cores=8, cores_per_evaluation=3)
+    assert manager.get_max_evaluations() == 2
+    opt.rt.started_trials = 2  # both evaluating
+    allocation = manager.allocate(opt, 'surrogate_fitting')
+    # GPy surrogates fit their restarts in parallel by default
+    assert allocation == {'phase': 'surrogate_fitting', 'cores': 2, 'evaluating': 2,
+                          'workers': 2, 'blas_threads': 1}
+    opt.rt.started_trials = 5
+    assert manager.allocate(opt, 'acquisition_maximisation')['cores'] == 1
+
+    with tm.worker_limit(3):
+        assert tm.get_worker_limit() == 3 and tm.get_worker_limit(2) == 2
+    assert tm.get_worker_limit(2) == 2 and tm.get_worker_limit() is None
+
+
+@pytest.mark.skipif(tm.concurrency.threadpoolctl is None, reason='requires threadpoolctl')
+def test_concurrency_manager_limits_blas():
+    threadpoolctl = tm.concurrency.threadpoolctl
+    opt = tb.Optimiser(lambda x: x**2, 'min', [('x', -1, 1)], pre_phase_trials=3)
+    manager = tm.ConcurrencyManager(total_cores=2, phase_workers={'acquisition_maximisation': 1})
+    with manager.phase(opt, 'acquisition_maximisation') as allocation:
+        assert allocation['blas_limited']
+        for info in threadpoolctl.threadpool_info():
+            if info['user_api'] == 'blas':
+                assert info['num_threads'] <= 2
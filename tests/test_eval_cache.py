@@ -0,0 +1,42 @@
+#!/usr/bin/env python3
+
+import numpy as np
+
+import turbo as tb
+import turbo.modules as tm
+
+
+def test_eval_cache(tmp_path):
+    filename = str(tmp_path / 'cache.jsonl')
+    cache = tm.EvalCache(max_size=2, filename=filename, tolerance=1e-6)
+    cache.put({'a': 0.1, 'b': 'x'}, 1.0, {'note': 'first'})
+    assert cache.get({'b': 'x', 'a': 0.1 + 1e-9}) == (1.0, {'note': 'first', 'cache_hit': True})
+    assert cache.get({'a': 0.2, 'b': 'x'}) is None
+
+    # least recently used entries are evicted from memory
+    cache.put({'a': 0.2, 'b': 'x'}, 2.0)
+    cache.put({'a': 0.3, 'b': 'x'}, 3.0)
+    assert len(cache) == 2 and cache.get({'a': 0.1, 'b': 'x'}) is None
+
+    # but persist in the file
+    reloaded = tm.EvalCache(filename=filename, tolerance=1e-6)
+    assert len(reloaded) == 3
+    assert reloaded.get({'a': 0.1, 'b': 'x'}) == (1.0, {'note': 'first', 'cache_hit': True})
+    assert tm.EvalCache(filename=filename, namespace='other').get({'a': 0.2, 'b': 'x'}) is None
+
+
+def test_optimiser_eval_cache():
+    calls = []
+    def f(x, n):
+        calls.append((x, n))
+        return x + n
+
+    points = [np.array([[v, n]]) for v, n in [(0.5, 1), (0.25, 2), (0.5, 1), (0.25, 2)]]
+    opt = tb.Optimiser(f, 'min', [('x', 0, 1), ('n', 0, 3, 'integer')], pre_phase_trials=4)
+    opt.pre_phase_select = tm.manual_selector(points)
+    opt.eval_cache = tm.EvalCache()
+    rec = tb.Recorder(opt)
+    opt.run(4)
+    assert len(calls) == 2
+    assert [t.cache_hit for _, t in rec.get_sorted_trials()] == [False, False, True, True]
+    assert opt.rt.trial_ys == [1.5, 2.25, 1.5, 2.25]
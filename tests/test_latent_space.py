@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+
+import numpy as np
+
+import turbo as tb
+import turbo.modules as tm
+
+import pytest
+
+
+def test_random_embedding():
+    bounds = tb.Bounds([('x{}'.format(i), -5, 10) for i in range(100)])
+    ls = tm.RandomEmbeddingLatentSpace(latent_dims=5, seed=0)
+    ls._set_input_bounds(bounds)
+
+    lb = ls.get_latent_bounds()
+    assert len(lb) == 5
+
+    # the projection is kept between runs
+    A = ls.projection
+    ls._set_input_bounds(bounds)
+    assert ls.projection is A
+
+    Z = tm.random_selector()(50, lb)
+    X = ls.from_latent(Z)
+    assert X.shape == (50, 100)
+    assert np.all(X >= -5) and np.all(X <= 10)
+    # single points keep their shape
+    assert ls.from_latent(Z[0]).shape == (100,)
+    assert ls.from_latent(Z[:1]).shape == (1, 100)
+
+    # points which are not clipped lie in the embedding and so can be recovered
+    z = np.full((1, 5), 0.01)
+    assert ls.to_latent(ls.from_latent(z)) == pytest.approx(z)
+
+
+def test_constant_latent_space_batch():
+    bounds = tb.Bounds([('a', 1e-3, 10), ('b', 50, 100.5), ('c', -1, 1)])
+    ls = tm.ConstantLatentSpace({
+        'a': tm.LogMap(),
+        'b': tm.LinearMap((50, 100.5), (0, 1)),
+        'c': tm.IdentityMap()
+    })
+    ls._set_input_bounds(bounds)
+
+    X = tm.random_selector()(100, bounds)
+    Z = ls.to_latent(X)
+    assert Z.shape == X.shape
+    assert Z[:, 0] == pytest.approx(np.log(X[:, 0]))
+    assert ls.from_latent(Z) == pytest.approx(X)
+    # converting in a batch gives the same result as converting individually
+    assert np.vstack([ls.to_latent(x) for x in X]) == pytest.approx(Z)
+    assert ls.to_latent(X[:1]).shape == (1, 3)
+
+
+def test_one_hot_latent_space():
+    bounds = tb.Bounds([('x', -1, 1), ('n', 0, 5, 'integer'), ('kind', ['a', 'b', 'c'])])
+    ls = tm.OneHotLatentSpace()
+    ls._set_input_bounds(bounds)
+
+    lb = ls.get_latent_bounds()
+    assert len(lb) == 5
+    assert lb.onehot_groups == [['latent_kind_0', 'latent_kind_1', 'latent_kind_2']]
+    assert ls.get_latent_param_names('kind') == lb.onehot_groups[0]
+
+    X = np.array([[0.5, 2, 1], [-0.25, 5, 2]])
+    Z = ls.to_latent(X)
+    assert Z == pytest.approx(np.array([[0.5, 2, 0, 1, 0], [-0.25, 5, 0, 0, 1]]))
+    assert ls.from_latent(Z) == pytest.approx(X)
+
+    # arbitrary latent points snap to valid encodings
+    snapped = ls.snap(np.array([[0.1, 2.7, 0.2, 0.9, 0.3]]))
+    assert snapped == pytest.approx(np.array([[0.1, 3, 0, 1, 0]]))
+    assert [bounds.decode(b[0], v) for b, v in zip(bounds.ordered, ls.from_latent(snapped)[0])] == [0.1, 3, 'b']
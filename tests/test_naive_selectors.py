@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+
+import pickle
+import numpy as np
+
+import turbo as tb
+import turbo.modules as tm
+
+import pytest
+
+
+def test_sobol_resumable():
+    bounds = tb.Bounds([('a', -1, 1), ('b', 0, 10), ('c', 5, 6)])
+    s = tm.sobol_selector(seed=42)
+    first = s(8, bounds)
+    assert np.all(bounds.clip(first) == first)
+
+    # resuming from the pickled state gives the same continuation
+    resumed = pickle.loads(pickle.dumps(s))
+    second = s(8, bounds)
+    assert resumed(8, bounds) == pytest.approx(second)
+
+    # skipping ahead gives the same points as generating them
+    skipped = tm.sobol_selector(seed=42, skip=16)
+    assert skipped(4, bounds) == pytest.approx(s(4, bounds))
+
+    # unscrambled Sobol' starts at the origin
+    assert tm.sobol_selector(scramble=False)(1, bounds) == pytest.approx(bounds.lows.reshape(1, -1))
+
+
+def test_maximin_LHS():
+    np.random.seed(0)
+    n = 30
+    bounds = tb.Bounds([('a', -1, 1), ('b', 0, 10), ('c', 5, 6)])
+    random_lhs = tm.LHS_selector(n)
+    random_lhs(n, bounds)
+    maximin_lhs = tm.LHS_selector(n, criterion='maximin', max_time=1)
+    X = maximin_lhs(n, bounds)
+
+    # still a Latin hypercube: one point in each of the n intervals of each dimension
+    intervals = np.floor(bounds.to_unit_cube(X) * n).astype(int)
+    assert all(sorted(intervals[:, k]) == list(range(n)) for k in range(3))
+    assert maximin_lhs.min_distance > random_lhs.min_distance
+
+
+def test_random_selector_with_tolerance():
+    np.random.seed(0)
+    f = lambda a, b: a + b
+    opt = tb.Optimiser(f, 'min', [('a', 0, 1), ('b', 0, 1)], pre_phase_trials=1)
+    opt.latent_space._set_input_bounds(opt.bounds)
+    for x in np.random.rand(200, 2):
+        opt.rt.add_finished_trial(x.reshape(1, -1), 0.0)
+    opt.rt.pending_trials[200] = np.array([[0.5, 0.5]])
+
+    tolerance = 0.05**2
+    s = tm.random_selector_with_tolerance(opt, close_tolerance=tolerance)
+    X = s(20, opt.bounds)
+    assert X.shape == (20, 2)
+    existing = np.vstack([opt.rt.finished_index.points, [[0.5, 0.5]], X])
+    sq_dists = np.sum((X[:, np.newaxis, :] - existing[np.newaxis, :, :])**2, axis=2)
+    sq_dists[np.arange(20), 201 + np.arange(20)] = np.inf  # distance to self
+    assert np.all(sq_dists > tolerance)
+
+    with pytest.raises(RuntimeError):
+        tm.random_selector_with_tolerance(opt, close_tolerance=1, max_attempts=2)(1, opt.bounds)
+
+
+def test_default_preset_fallback_selector():
+    # random_selector_with_tolerance is opt-in, the default preset is unchanged
+    opt = tb.Optimiser(lambda x: x, 'min', [('x', 0, 1)], pre_phase_trials=1)
+    assert type(opt.fallback.selector) is tm.random_selector
+
+
+def test_grid_selector():
+    bounds = tb.Bounds([('a', 0, 1), ('b', -1, 1)])
+    s = tm.grid_selector([3, 5], shuffle=True, seed=1)
+    first = s(6, bounds)
+    # resuming from the saved position gives the same continuation
+    resumed = pickle.loads(pickle.dumps(s))
+    rest = s(9, bounds)
+    assert resumed(9, bounds) == pytest.approx(rest)
+    # the shuffled traversal visits every cell exactly once
+    X = np.vstack([first, rest])
+    assert sorted(map(tuple, X)) == sorted((a, b) for a in [0, 0.5, 1] for b in [-1, -0.5, 0, 0.5, 1])
+    with pytest.raises(AssertionError):
+        s(1, bounds)
+
+    # points which have already been evaluated are skipped
+    opt = tb.Optimiser(lambda a, b: a + b, 'min', [('a', 0, 1), ('b', -1, 1)], pre_phase_trials=1)
+    opt.rt.add_finished_trial(np.array([[0, -1]]), 0.0)
+    opt.rt.pending_trials[1] = np.array([[0, -0.5]])
+    X = tm.grid_selector([3, 5], optimiser=opt)(2, bounds)
+    assert X == pytest.approx(np.array([[0, 0], [0, 0.5]]))
+
+    # huge grids are never materialised
+    huge = tb.Bounds([('x{}'.format(i), 0, 1) for i in range(9)])
+    X = tm.grid_selector(10, shuffle=True, seed=0)(100, huge)
+    assert len(np.unique(X, axis=0)) == 100
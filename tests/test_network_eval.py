@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+
+import time
+import socket
+import threading
+import numpy as np
+
+import turbo as tb
+import turbo.modules as tm
+from turbo import net
+
+import pytest
+
+
+def test_coordinator_with_local_workers():
+    def f(x):
+        time.sleep(0.01)
+        if x > 0.9:
+            raise ValueError('invalid configuration')
+        return x**2, {'host': 'local'}
+
+    coordinator = tm.CoordinatorAsync(max_workers=3, lease_duration=0.5)
+    host, port = coordinator.address
+    counts = []
+
+    def start_workers():
+        # a worker which takes the first trial and dies without returning it
+        with net.Client((host, port)) as client:
+            while client.request({'type': 'trial_request', 'worker': 'dead'})['type'] != 'trial':
+                time.sleep(0.01)
+        workers = [threading.Thread(target=lambda: counts.append(tm.run_worker(f, host, port, poll_interval=0.05)))
+                   for _ in range(3)]
+        for w in workers:
+            w.start()
+        for w in workers:
+            w.join()
+    starter = threading.Thread(target=start_workers)
+    starter.start()
+
+    xs = [0.5, 0.95, -0.5, 0.2, -0.2, 0.7]
+    opt = tb.Optimiser(f, 'min', [('x', -1, 1)], pre_phase_trials=len(xs))
+    opt.pre_phase_select = tm.manual_selector([np.array([[x]]) for x in xs])
+    opt.fallback = tm.Fallback(planned_fallback=tm.Fallback.planned_with_interval(1), selector=tm.random_selector())
+    opt.async_eval = coordinator
+    rec = tb.Recorder(opt)
+    opt.run(10)
+    coordinator.shutdown()
+    starter.join()
+
+    # every trial was evaluated once by a live worker
+    assert sum(counts) == 10
+    assert sorted(list(rec.trials) + list(rec.failed_trials)) == list(range(10))
+    assert 1 in rec.failed_trials
+    for t in rec.failed_trials.values():
+        assert t.eval_info['reason'] == 'exception' and 'invalid configuration' in t.eval_info['error']
+    for n, t in rec.trials.items():
+        assert t.y == t.x[0, 0]**2
+        assert t.eval_info['host'] == 'local' and t.eval_info['worker'] != 'dead'
+        assert t.eval_info['attempt'] == (2 if n == 0 else 1)
+    assert coordinator.num_requeued == 1
+
+
+def test_coordinator_recorder_saving(tmp_path):
+    filename = str(tmp_path / 'run.pkl.gz')
+    f = lambda x: x**2
+    coordinator = tm.CoordinatorAsync(max_workers=2, lease_duration=0.5)
+    worker = threading.Thread(target=tm.run_worker, args=(f, *coordinator.address), kwargs={'poll_interval': 0.05})
+    worker.start()
+    opt = tb.Optimiser(f, 'min', [('x', -1, 1)], pre_phase_trials=3)
+    opt.async_eval = coordinator
+    tb.Recorder(opt, autosave_filename=filename)
+    opt.run(3)  # saved as each trial finishes
+    coordinator.shutdown()
+    worker.join()
+
+    rec = tb.Recorder.load_compressed(filename, quiet=True)
+    assert sorted(rec.trials) == list(range(3))
+    # the loaded coordinator is shut down
+    loaded = rec.optimiser.async_eval
+    assert loaded.address == coordinator.address and not loaded.has_pending_trials()
+    with pytest.raises(AssertionError, match='shut down'):
+        loaded.start_trial(3, f, {'x': 0.5})
+    loaded.shutdown()
+
+
+def test_binary_messages():
+    a, b = socket.socketpair()
+    with a, b:
+        msg = {'x': np.arange(12.0).reshape(3, 4), 'n': np.int64(3), 'info': [np.zeros(0), 'text', None],
+               'big': np.random.rand(200000).astype(np.float32), 'scalar': np.array(2.5),
+               'strided': np.arange(10)[::2]}
+        sender = threading.Thread(target=net.send_msg, args=(a, msg))
+        sender.start()
+        received = net.recv_msg(b)
+        sender.join()
+        assert received['n'] == 3 and received['info'][1:] == ['text', None]
+        for got, sent in [(received['x'], msg['x']), (received['info'][0], msg['info'][0]),
+                          (received['big'], msg['big']), (received['scalar'], msg['scalar']),
+                          (received['strided'], msg['strided'])]:
+            assert got.dtype == sent.dtype and got.shape == sent.shape and np.array_equal(got, sent)
+
+        # corruption is detected
+        a.sendall(b'\x00\x00\x00\x05\x00\x00\x00\x05\x00\x00\x00\x00hello')
+        with pytest.raises(ValueError):
+            net.recv_msg(b)
+
+
+def test_serve_connection_times_out_partial_messages():
+    a, b = socket.socketpair()
+    with a, b:
+        server = threading.Thread(target=net.serve_connection, args=(b, lambda msg: msg),
+                                  kwargs={'timeout': 0.2})
+        server.start()
+        net.send_msg(a, {'x': np.arange(3.0)})
+        assert np.array_equal(net.recv_msg(a)['x'], np.arange(3.0))
+        # idle connections are kept open, but a client which stops part way through a message is dropped
+        time.sleep(0.5)
+        assert server.is_alive()
+        a.sendall(b'\x00\x00')
+        server.join(5)
+        assert not server.is_alive()
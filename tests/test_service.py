@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+
+import json
+import time
+import threading
+
+import turbo as tb
+import turbo.modules as tm
+
+import pytest
+
+
+def _make_optimiser(objective, pre_phase_trials):
+    opt = tb.Optimiser(objective, 'min', [('x', -1, 1)], pre_phase_trials=pre_phase_trials)
+    opt.fallback = tm.Fallback(planned_fallback=tm.Fallback.planned_with_interval(1), selector=tm.random_selector())
+    return opt
+
+
+def test_service_evaluates_studies_on_shared_pool():
+    lock = threading.Lock()
+    running = set()
+    overlapped = set()
+    def make_objective(name):
+        def f(x):
+            with lock:
+                running.add(name)
+                if len(running) > 1:
+                    overlapped.update(running)
+            time.sleep(0.01)
+            with lock:
+                running.discard(name)
+            return (x - 0.5)**2
+        return f
+
+    service = tb.OptimisationService(num_workers=4)
+    recorders = {}
+    for name in ('a', 'b', 'c'):
+        opt = _make_optimiser(make_objective(name), pre_phase_trials=5)
+        recorders[name] = tb.Recorder(opt)
+        service.add_study(name, opt, max_trials=8, concurrency=2)
+    assert service.wait(timeout=60)
+    service.shutdown()
+
+    # the studies were evaluated alongside each other
+    assert overlapped == {'a', 'b', 'c'}
+    for name, rec in recorders.items():
+        opt = service.get_study(name)
+        assert sorted(opt.rt.trial_nums) == list(range(8))
+        assert not opt.rt.running and not rec.has_unfinished_trials()
+        assert rec.runs[-1].is_finished()
+
+
+def test_service_ask_tell_over_socket(tmp_path):
+    address = str(tmp_path / 'service.sock')
+    state_dir = str(tmp_path / 'state')
+
+    def evaluate(client, name, num_trials):
+        for _ in range(num_trials):
+            res = client.ask(name)
+            assert res['status'] == 'trial'
+            x = res['params']['x']
+            client.tell(name, res['trial_num'], (x - 0.25)**2, {'evaluated_by': 'client'})
+
+    service = tb.OptimisationService(num_workers=2, address=address, state_dir=state_dir)
+    with tb.ServiceClient(address) as client:
+        client.create_study('remote', 'min', [('x', -1, 1)], pre_phase_trials=3, max_trials=6)
+        evaluate(client, 'remote', 4)
+        summary = client.list_studies()['remote']
+        assert summary['started'] == 4 and summary['finished'] == 4 and summary['max_trials'] == 6
+        trial_num, params, y = summary['incumbent']
+        assert y == (params['x'] - 0.25)**2
+    service.shutdown()
+
+    # a new service resumes the study from its saved trials
+    service = tb.OptimisationService(num_workers=2, address=address, state_dir=state_dir)
+    with tb.ServiceClient(address) as client:
+        client.create_study('remote', 'min', [('x', -1, 1)], pre_phase_trials=3, max_trials=6)
+        assert client.list_studies()['remote']['finished'] == 4
+        evaluate(client, 'remote', 2)
+        assert client.ask('remote') == {'status': 'finished'}
+    assert service.wait('remote', timeout=0)
+    service.shutdown()
+
+
+def test_service_surfaces_selection_errors():
+    opt = _make_optimiser(lambda x: x**2, pre_phase_trials=2)
+    def fail(trial_num, trial_type=None):
+        raise ValueError('surrogate failed to fit')
+    opt._select_trial = fail
+    service = tb.OptimisationService(num_workers=2)
+    service.add_study('failing', opt, max_trials=5, concurrency=2)
+    with pytest.raises(RuntimeError, match='surrogate failed to fit'):
+        service.wait(timeout=10)
+    summary = service.list_studies()['failing']
+    assert summary['finished'] == 2 and 'surrogate failed to fit' in summary['error']
+    assert service.get_study('failing').rt.started_trials == 2
+    service.shutdown()
+
+
+def test_service_persists_failed_trials(tmp_path):
+    state_dir = str(tmp_path / 'state')
+    service = tb.OptimisationService(num_workers=2, state_dir=state_dir)
+    service.create_study('s', 'min', [('x', -1, 1)], pre_phase_trials=3, max_trials=5)
+    first, second = service.ask('s'), service.ask('s')
+    service.tell('s', first['trial_num'], None, error='invalid configuration')
+    service.tell('s', second['trial_num'], second['params']['x']**2)
+    service.shutdown()
+
+    service = tb.OptimisationService(num_workers=2, state_dir=state_dir)
+    service.create_study('s', 'min', [('x', -1, 1)], pre_phase_trials=3, max_trials=5)
+    summary = service.list_studies()['s']
+    assert (summary['started'], summary['finished'], summary['failed']) == (2, 1, 1)
+    # the failed trial still counts towards the pre-phase, so only one pre-phase trial remains
+    for _ in range(2):
+        res = service.ask('s')
+        service.tell('s', res['trial_num'], res['params']['x']**2)
+    service.shutdown()
+    with open(str(tmp_path / 'state' / 's.jsonl')) as f:
+        records = [json.loads(line) for line in f]
+    assert [r['type'] == 'pre_phase' for r in records] == [True, True, True, False]
+    assert records[0]['failure']['error'] == 'invalid configuration'
@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+
+import pickle
+import numpy as np
+
+import turbo.modules as tm
+
+import pytest
+
+
+def test_additive_decomposition():
+    np.random.seed(0)
+    X = np.random.uniform(-1, 1, size=(20, 4))
+    y = np.sin(3 * X[:, 0]) * X[:, 1] + X[:, 2]**2 - X[:, 3]
+
+    surrogate = tm.AdditiveGPySurrogate(groups=[[0, 1], [2, 3]], training_iterations=1,
+                                        model_params={'normalizer': False},
+                                        optimise_params={'parallel': False, 'verbose': False})
+    model, fitting_info = surrogate.construct_model(0, X, y)
+    assert fitting_info['groups'] == [[0, 1], [2, 3]]
+
+    # the mean of an additive model is the sum of the means of its components
+    Xs = np.random.uniform(-1, 1, size=(10, 4))
+    group_means = [model.group_model(j).predict(Xs[:, g]) for j, g in enumerate(model.groups)]
+    assert np.sum(group_means, axis=0) == pytest.approx(model.predict(Xs))
+
+
+def test_restart_pool():
+    np.random.seed(0)
+    X = np.random.uniform(-1, 1, size=(15, 2))
+    y = np.sin(3 * X[:, 0]) + X[:, 1]**2
+    pool = tm.RestartPool(num_workers=2, start_method='fork')
+
+    surrogate = tm.GPySurrogate(training_iterations=3, restart_pool=pool,
+                                optimise_params={'parallel': True, 'verbose': False})
+    model, fitting_info = surrogate.construct_model(0, X, y)
+    assert len(fitting_info['restart_objectives']) == 3
+    # the model is set to the best of the restarts
+    assert -model.model.log_likelihood() == pytest.approx(min(fitting_info['restart_objectives']), rel=1e-6)
+    executor = pool._executor
+
+    # the workers persist between trials and are shared between surrogates
+    sk_surrogate = tm.SciKitGPSurrogate(training_iterations=3, restart_pool=pool)
+    model, fitting_info = sk_surrogate.construct_model(1, X, y)
+    log_likelihoods = fitting_info['restart_log_likelihoods']
+    assert len(log_likelihoods) == 3
+    assert model.model.log_marginal_likelihood_value_ == pytest.approx(max(log_likelihoods))
+    assert pool._executor is executor
+
+    # a shared pool is left for its owner to shut down
+    surrogate.shutdown()
+    assert pool._executor is executor
+    pool.shutdown()
+    assert pool._executor is None
+
+    # whereas a pool which the surrogate created is shut down with it
+    surrogate = tm.SciKitGPSurrogate(training_iterations=2, restart_pool=True)
+    model, fitting_info = surrogate.construct_model(0, X, y)
+    assert len(fitting_info['restart_log_likelihoods']) == 2
+    # the pool can be pickled (eg when saving a recorder) and starts again when used
+    loaded = pickle.loads(pickle.dumps(surrogate))
+    assert loaded.restart_pool._executor is None
+    model, fitting_info = loaded.construct_model(1, X, y)
+    assert len(fitting_info['restart_log_likelihoods']) == 2
+    loaded.shutdown()
+    surrogate.shutdown()
+    assert surrogate.restart_pool._executor is None
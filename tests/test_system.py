@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+
+import time
+import asyncio
+import threading
+import numpy as np
+
+import turbo as tb
+import turbo.modules as tm
+
+
+def test_batch_objective():
+    calls = []
+    def f(x, kind):
+        calls.append(len(x))
+        return x**2, [{'kind': k} for k in kind]
+
+    opt = tb.Optimiser(f, 'min', [('x', -1, 1), ('kind', ['a', 'b'])], pre_phase_trials=5, batch_objective='arrays')
+    # every trial after the pre-phase is a fallback, so none depend on the results of the others
+    opt.fallback = tm.Fallback(planned_fallback=tm.Fallback.planned_with_interval(1), selector=tm.random_selector())
+    rec = tb.Recorder(opt)
+    opt.run(8)
+    assert calls == [8]
+    assert [t.selection_info['type'] for n, t in rec.get_sorted_trials()] == ['pre_phase'] * 5 + ['fallback'] * 3
+    # each result is recorded as an individual trial
+    for n, t in rec.trials.items():
+        x, kind = t.x[0, 0], ['a', 'b'][int(np.argmax(t.x[0, 1:]))]
+        assert t.y == x**2 and t.eval_info == {'kind': kind}
+
+    calls = []
+    opt = tb.Optimiser(lambda X: calls.append(X.shape) or X[:, 0], 'min', [('x', -1, 1), ('y', 0, 1)],
+                       pre_phase_trials=4, batch_objective='matrix', max_batch_size=3)
+    opt.run(4)
+    assert calls == [(3, 2), (1, 2)]
+    assert opt.rt.trial_ys == [x[0, 0] for x in opt.rt.trial_xs]
+
+
+def test_async_pre_phase():
+    lock = threading.Lock()
+    running = [0, 0]  # current, maximum
+    def f(x):
+        with lock:
+            running[0] += 1
+            running[1] = max(running)
+        time.sleep(0.01 * np.random.rand())
+        with lock:
+            running[0] -= 1
+        return x**2
+
+    opt = tb.Optimiser(f, 'min', [('x', -1, 1)], pre_phase_trials=12)
+    opt.fallback = tm.Fallback(planned_fallback=tm.Fallback.planned_with_interval(1), selector=tm.random_selector())
+    opt.async_eval = tm.ThreadAsync(4, pre_phase_quorum=0.5)
+    rec = tb.Recorder(opt)
+    opt.run(20)
+    opt.async_eval.shutdown()
+
+    assert running[1] == 4
+    assert sorted(opt.rt.trial_nums) == list(range(20))
+    assert not rec.has_unfinished_trials()
+    for n, t in rec.trials.items():
+        assert t.y == t.x[0, 0]**2
+        assert t.is_pre_phase() == (n < 12)
+    i, x, y = opt.get_incumbent()
+    assert rec.trials[i].y == y
+
+
+def test_zero_pre_phase_quorum():
+    opt = tb.Optimiser(lambda x: x**2, 'min', [('x', -1, 1)], pre_phase_trials=4)
+    opt.fallback = tm.Fallback(planned_fallback=tm.Fallback.planned_with_interval(1), selector=tm.random_selector())
+    opt.async_eval = tm.ThreadAsync(1, pre_phase_quorum=0)
+    rec = tb.Recorder(opt)
+    opt.run(6)
+    opt.async_eval.shutdown()
+    assert [t.is_pre_phase() for _, t in rec.get_sorted_trials()] == [True] * 4 + [False] * 2
+
+
+def test_autosave_with_async_eval(tmp_path):
+    filename = str(tmp_path / 'run.pkl.gz')
+    opt = tb.Optimiser(lambda x: x**2, 'min', [('x', -1, 1)], pre_phase_trials=3)
+    opt.async_eval = tm.ThreadAsync(2)
+    tb.Recorder(opt, autosave_filename=filename)
+    opt.run(5)  # saved as each trial finishes
+    opt.async_eval.shutdown()
+
+    rec = tb.Recorder.load_compressed(filename, quiet=True)
+    assert sorted(rec.trials) == list(range(5))
+    # the loaded evaluator has a new executor
+    assert isinstance(rec.optimiser.async_eval, tm.ThreadAsync) and rec.optimiser.async_eval.get_free_capacity() == 2
+    rec.optimiser.async_eval.shutdown()
+
+
+def test_run_asyncio():
+    running = [0, 0]  # current, maximum
+    async def f(x):
+        running[0] += 1
+        running[1] = max(running)
+        await asyncio.sleep(0.01 * np.random.rand())
+        running[0] -= 1
+        return x**2
+
+    events = []
+    class OrderListener(tm.Listener):
+        def selection_started(self, trial_num):
+            events.append(('selection_started', trial_num))
+        def selection_finished(self, trial_num, x, selection_info):
+            events.append(('selection_finished', trial_num))
+
+    opt = tb.Optimiser(f, 'min', [('x', -1, 1)], pre_phase_trials=8)
+    opt.fallback = tm.Fallback(planned_fallback=tm.Fallback.planned_with_interval(1), selector=tm.random_selector())
+    opt.register_listener(OrderListener())
+    rec = tb.Recorder(opt)
+    asyncio.run(opt.run_asyncio(14, concurrency=4))
+
+    assert running[1] == 4
+    assert sorted(opt.rt.trial_nums) == list(range(14))
+    assert not rec.has_unfinished_trials()
+    for n, t in rec.trials.items():
+        assert t.y == t.x[0, 0]**2
+        assert t.is_pre_phase() == (n < 8)
+    # selections are not interleaved
+    assert events == [(e, n) for n in range(14) for e in ('selection_started', 'selection_finished')]
+
+
+def test_pre_phase_exit():
+    np.random.seed(0)
+    opt = tb.Optimiser(lambda a, b: float(a**2 + b**2), 'min', [('a', -1, 1), ('b', -1, 1)], pre_phase_trials=40)
+    opt.pre_phase_exit = tm.HeldOutErrorExit(min_trials=5, interval=2, window=2)
+    rec = tb.Recorder(opt)
+    opt.run(14)
+    # the surrogate quickly learns a quadratic, so the pre-phase finishes early
+    n = opt.rt.pre_phase_exited_at
+    assert n is not None and n < 14
+    assert [t.is_pre_phase() for _, t in rec.get_sorted_trials()] == [True] * n + [False] * (14 - n)
+    assert len(opt.pre_phase_exit.errors) >= 2
+
+
+def test_pre_phase_exit_interval_equal_to_min_trials():
+    np.random.seed(0)
+    opt = tb.Optimiser(lambda x: float(x**2), 'min', [('x', -1, 1)], pre_phase_trials=8)
+    opt.pre_phase_exit = tm.HeldOutErrorExit(min_trials=2, interval=2, window=10)
+    opt.run(8)
+    # the first model is fitted to the first 2 trials and tested on the next 2
+    assert [n for n, _ in opt.pre_phase_exit.errors] == [4, 6]
+    # the checks leave the state carried between models of the surrogate alone
+    assert opt.surrogate._last_model_params is None
+
+
+def test_locally_penalised_fallback():
+    np.random.seed(0)
+    opt = tb.Optimiser(lambda x: float(x**2), 'min', [('x', -1, 1)], pre_phase_trials=3)
+    opt.pre_phase_select = tm.manual_selector([np.array([[v]]) for v in (0.0, 0.5, -0.5)])
+    opt.fallback = tm.Fallback(close_tolerance=0.1**2, local_penalty_radius=0.3, selector=tm.random_selector())
+    rec = tb.Recorder(opt)
+    opt.run(4)
+    # Bayesian optimisation proposes the incumbent again, which is too close
+    info = rec.trials[3].selection_info
+    assert info['fallback_reason'] == 'too_close_penalised'
+    assert abs(info['bayes_x'][0, 0]) < 0.1
+    assert np.min(np.abs(rec.trials[3].x - np.array([0.0, 0.5, -0.5]))) > 0.1
+
+    # the penalty never makes a point more desirable
+    acq = rec.get_acquisition_function(3)
+    penalised = opt.fallback.penalise(acq, opt.rt.finished_index)
+    X = np.linspace(-1, 1, 21).reshape(-1, 1)
+    assert np.all(penalised(X) <= acq(X))
+    assert penalised(X[10:11])[0] < acq(X[10:11])[0]  # at an existing point
@@ -1,5 +1,7 @@
 #!/usr/bin/env python3
 
+import numpy as np
+
 import turbo.utils
 
 import pytest
@@ -11,3 +13,27 @@ def test_remap():
     bl, bu = (0.5, 1.0)
     assert turbo.utils.remap(23, (al, au), (bl, bu)) == pytest.approx(bl + (bu-bl)/(au-al) * (23-al))
     assert turbo.utils.remap(0.6, (bl, bu), (al, au)) == pytest.approx(al + (au-al)/(bu-bl) * (0.6-bl))
+
+
+def test_spatial_index():
+    np.random.seed(0)
+    index = turbo.utils.SpatialIndex()
+    # add in uneven batches so that several blocks exist
+    for n in (1, 40, 7, 100, 3):
+        index.add(np.random.rand(n, 3))
+    assert len(index) == 151
+
+    Q = np.random.rand(50, 3)
+    sq_dists = np.sum((Q[:, np.newaxis, :] - index.points[np.newaxis, :, :])**2, axis=2)
+    d, i = index.nearest(Q)
+    assert i.tolist() == np.argmin(sq_dists, axis=1).tolist()
+    assert d == pytest.approx(np.sqrt(np.min(sq_dists, axis=1)))
+
+    assert index.any_within(index.points[17], 0)
+    assert index.any_within(Q, 0.1).tolist() == (np.min(sq_dists, axis=1) <= 0.01).tolist()
+    assert turbo.utils.SpatialIndex(num_dims=3).nearest(Q)[1].tolist() == [-1] * 50
+
+
+def test_unique_rows_close():
+    arr = np.array([[0, 0], [1, 1], [0, 1e-3], [1, 1]], dtype=float)
+    assert turbo.utils.unique_rows_close(arr, 1e-4).tolist() == [[0, 0], [1, 1]]
@@ -5,3 +5,4 @@ from .bounds import Bounds
 from .optimiser import Optimiser
 from .optimiser_presets import load_optimiser_preset
 from .recorder import Recorder
+from .service import OptimisationService, ServiceClient
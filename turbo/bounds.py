@@ -1,14 +1,70 @@
 #!/usr/bin/env python3
 
+import numpy as np
+
 
 class Bounds:
-    """ Boundaries of a space """
-    def __init__(self, ordered):
-        #TODO: do checks like duplicates etc
-        #TODO: check that min < max
-        self.ordered = ordered
-        self.params = set([b[0] for b in ordered])
-        self.associative = {b[0]: (b[1], b[2]) for b in ordered}
+    """ Boundaries of a space
+
+    Each parameter is specified by one of the following:
+
+    - `(name, min, max)`: a continuous parameter
+    - `(name, min, max, 'integer')`: an integer parameter
+    - `(name, [category, ...])`: a categorical parameter. Points store the
+      index of the category rather than the category itself (see `decode()`).
+
+    Attributes:
+        ordered: a list of `(name, min, max)` for every parameter. For a
+            categorical parameter the range is that of the category indices.
+        specification: the parameter specifications passed to the constructor
+        onehot_groups: a list of lists of parameter names. Each list is a group
+            of continuous `[0,1]` parameters which together one-hot encode a
+            single categorical parameter (used by latent spaces)
+        names: the parameter names in order
+        lows: (read only) array of the minimum of each parameter
+        highs: (read only) array of the maximum of each parameter
+        ranges: (read only) array of `highs - lows`
+    """
+    def __init__(self, ordered, onehot_groups=None):
+        self.specification = ordered
+        self.ordered = []
+        self.types = {}
+        self.categories = {}
+        for b in ordered:
+            name = b[0]
+            if len(b) == 2:
+                assert len(b[1]) > 0, 'no categories given for parameter {}'.format(name)
+                self.types[name] = 'categorical'
+                self.categories[name] = list(b[1])
+                self.ordered.append((name, 0, len(b[1])-1))
+            elif len(b) == 3:
+                self.types[name] = 'real'
+                self.ordered.append(tuple(b))
+            elif len(b) == 4:
+                assert b[3] == 'integer', 'unknown parameter type: {}'.format(b[3])
+                self.types[name] = 'integer'
+                self.ordered.append((name, b[1], b[2]))
+            else:
+                raise ValueError('invalid parameter specification: {}'.format(b))
+
+        self.params = set([b[0] for b in self.ordered])
+        self.associative = {b[0]: (b[1], b[2]) for b in self.ordered}
+        self.names = [b[0] for b in self.ordered]
+        self._indices = {name: i for i, name in enumerate(self.names)}
+        assert len(self._indices) == len(self.names), 'duplicate parameter names'
+
+        # cached so that the arrays are not rebuilt every time they are needed
+        self.lows = np.array([b[1] for b in self.ordered], dtype=float)
+        self.highs = np.array([b[2] for b in self.ordered], dtype=float)
+        self.ranges = self.highs - self.lows
+        assert np.all(self.lows <= self.highs), 'parameter minimum greater than maximum'
+        # fixed parameters (eg a single category) have a range of 0, which cannot be divided by
+        self._safe_ranges = np.where(self.ranges > 0, self.ranges, 1.0)
+        for arr in (self.lows, self.highs, self.ranges):
+            arr.setflags(write=False)
+        self.onehot_groups = onehot_groups or []
+        assert all(n in self.params for g in self.onehot_groups for n in g), \
+            'unknown parameter in one-hot groups'
 
     def __len__(self):
         return len(self.ordered)
@@ -16,6 +72,18 @@ class Bounds:
     def get(self, param):
         return self.associative[param]
 
+    def get_type(self, param):
+        """ get the type of the given parameter: 'real', 'integer' or 'categorical' """
+        return self.types[param]
+
+    def get_categories(self, param):
+        """ get the list of categories of a categorical parameter """
+        return self.categories[param]
+
+    def is_continuous(self):
+        """ whether every parameter is continuous and independent of the others """
+        return not self.onehot_groups and all(t == 'real' for t in self.types.values())
+
     def get_param_index(self, param):
         """ Get the index within a point where the value for the given parameter
         can be found.
@@ -23,8 +91,54 @@ class Bounds:
         For example, given a point `p`:
         `opt.point_to_config(p)[param] == p[opt.bounds.get_param_index(param)]`
         """
-        for i, b in enumerate(self.ordered):
-            if param == b[0]:
-                return i
-        raise KeyError()
+        return self._indices[param]
+
+    def clip(self, points):
+        """ clip a point or matrix of points (as rows) to lie within the bounds """
+        return np.clip(points, self.lows, self.highs)
+
+    def to_unit_cube(self, points):
+        """ linearly map a point or matrix of points (as rows) from within the
+        bounds to the unit hypercube `[0,1]^d` (fixed parameters map to 0)
+        """
+        return (points - self.lows) / self._safe_ranges
+
+    def from_unit_cube(self, points):
+        """ linearly map a point or matrix of points (as rows) from the unit
+        hypercube `[0,1]^d` to within the bounds
+        """
+        return self.lows + points * self.ranges
+
+    def decode(self, param, value):
+        """ convert the value stored in a point to the value of the parameter
+
+        Integer parameters become ints and categorical parameters become the
+        category that the value indexes.
+        """
+        param_type = self.types[param]
+        if param_type == 'integer':
+            return int(round(value))
+        elif param_type == 'categorical':
+            return self.categories[param][int(round(value))]
+        else:
+            return value
+
+    def snap(self, point):
+        """ move a point or matrix of points (as rows) to the nearest valid point
 
+        Integer and categorical parameters are rounded and each one-hot group
+        is set to the one-hot vector of its greatest element.
+
+        Returns:
+            the snapped point(s) (a copy) with the same shape as `point`
+        """
+        if self.is_continuous():
+            return np.array(point, dtype=float)
+        points = np.array(point, dtype=float, ndmin=2)
+        discrete = [i for i, name in enumerate(self.names) if self.types[name] != 'real']
+        points[:, discrete] = np.clip(np.round(points[:, discrete]), self.lows[discrete], self.highs[discrete])
+        for g in self.onehot_groups:
+            cols = [self.get_param_index(n) for n in g]
+            hot = np.argmax(points[:, cols], axis=1)
+            points[:, cols] = np.eye(len(cols))[hot]
+        return points.reshape(np.shape(point))
@@ -7,4 +7,9 @@ from .auxiliary_optimisers import *
 from .surrogates import *
 from .acquisition_functions import *
 from .latent_space import *
-
+from .pre_phase_exit import *
+from .async_eval import *
+from .eval_cache import *
+from .network_eval import *
+from .concurrency import *
+from .restart_pool import *
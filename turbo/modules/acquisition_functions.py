@@ -52,7 +52,14 @@ class AcquisitionFunction:
 
         A single AcquisitionFunction instance is specialised to the current
         iteration and a new instance will be generated next iteration.
+
+        Attributes:
+            additive: whether, for an additive surrogate model, the acquisition
+                function can be maximised one group at a time by replacing
+                `model` with the model of each group (see `AdditiveMaximiser`)
         """
+        additive = False
+
         def __init__(self, model, desired_extremum):
             """
             Args:
@@ -113,7 +120,17 @@ class UCB(AcquisitionFunction):
             acquisition function, the name UCB is more common in the literature and
             so used over something more generic like 'confidence_bound' for
             simplicity.
+
+        Note:
+            UCB is treated as additive, although for an additive model only the
+            mean is exactly a sum over the groups. Maximising each group
+            separately uses `mean_j + beta * std_dev_j` for each group, which
+            drops the posterior covariances between the groups and sums the
+            standard deviations rather than the variances, so it approximates
+            the UCB of the whole model.
         """
+        additive = True
+
         def __init__(self, model, desired_extremum, beta):
             """
             Args:
@@ -0,0 +1,581 @@
+#!/usr/bin/env python3
+""" Evaluating several trials of the objective function concurrently """
+
+import os
+import time
+import traceback
+import multiprocessing
+import multiprocessing.connection
+import numpy as np
+import concurrent.futures
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+try:
+    import resource
+except ImportError:
+    resource = None  # Unix only, not required if memory limits are not used
+
+
+class Async:
+    """ A strategy for evaluating trials of the objective function concurrently
+
+    Assigning an `Async` object to `Optimiser.async_eval` causes
+    `Optimiser.run()` to keep up to `get_free_capacity()` trials evaluating at
+    once. The remaining pre-phase trials are selected up front and dispatched
+    together, and Bayesian optimisation trials are only started once enough
+    of the pre-phase results have arrived.
+
+    Note:
+        there is no parallel strategy for Bayesian optimisation trials yet.
+        Each is selected using the finished trials only, and a selection which
+        is too close to a pending trial is replaced with a fallback trial.
+
+    Attributes:
+        pre_phase_quorum: the fraction of the pre-phase trials which must have
+            finished before any Bayesian optimisation trials are started. At
+            least one result is always required, so 0 starts Bayesian
+            optimisation as soon as the first pre-phase trial finishes.
+    """
+    def __init__(self, pre_phase_quorum=1.0):
+        assert 0 <= pre_phase_quorum <= 1
+        self.pre_phase_quorum = pre_phase_quorum
+
+    def get_free_capacity(self):
+        """ the number of trials which can be started right now """
+        raise NotImplementedError()
+
+    def start_trial(self, trial_num, objective, params):
+        """ start evaluating `objective(**params)` for the given trial """
+        raise NotImplementedError()
+
+    def has_pending_trials(self):
+        """ whether any started trials have not been returned by `get_finished_trials()` """
+        raise NotImplementedError()
+
+    def get_finished_trials(self, wait):
+        """ collect the trials which have finished since the last call
+
+        Args:
+            wait: whether to wait until at least one pending trial has finished,
+                or return immediately with the finished trials currently available.
+
+        Returns:
+            a list of `(trial_num, result)` where `result` is the return value
+            of the objective function, or a `TrialFailure` if the trial failed
+
+        Raises:
+            the exception raised by the objective function (if any)
+        """
+        raise NotImplementedError()
+
+    def shutdown(self):
+        """ release any resources held (pending trials are waited for) """
+        pass
+
+
+class ExecutorAsync(Async):
+    """ evaluate trials using a `concurrent.futures.Executor` """
+    def __init__(self, executor, max_workers, pre_phase_quorum=1.0):
+        """
+        Args:
+            executor: the executor to submit trials to
+            max_workers: the maximum number of trials to have pending at once
+                (usually the number of workers of the executor)
+        """
+        super().__init__(pre_phase_quorum)
+        assert max_workers > 0
+        self.executor = executor
+        self.max_workers = max_workers
+        self._futures = {}  # future to trial_num
+
+    def get_free_capacity(self):
+        return self.max_workers - len(self._futures)
+
+    def start_trial(self, trial_num, objective, params):
+        assert self.get_free_capacity() > 0, 'no free capacity'
+        future = self.executor.submit(objective, **params)
+        self._futures[future] = trial_num
+
+    def has_pending_trials(self):
+        return len(self._futures) > 0
+
+    def get_finished_trials(self, wait):
+        if wait and self._futures:
+            concurrent.futures.wait(self._futures, return_when=concurrent.futures.FIRST_COMPLETED)
+        done = [f for f in self._futures if f.done()]
+        finished = []
+        for f in done:
+            trial_num = self._futures.pop(f)
+            finished.append((trial_num, f.result()))
+        return sorted(finished, key=lambda t: t[0])
+
+    def shutdown(self):
+        self.executor.shutdown(wait=True)
+
+    def __getstate__(self):
+        # executors cannot be pickled (eg when saving a `Recorder`), pending trials are not saved
+        state = self.__dict__.copy()
+        state['executor'] = None
+        state['_futures'] = {}
+        return state
+
+
+class ThreadAsync(ExecutorAsync):
+    """ evaluate trials in a pool of threads
+
+    Suitable for objective functions which release the GIL, such as those
+    which wait on an external process or perform large numpy operations.
+    """
+    def __init__(self, num_threads, pre_phase_quorum=1.0):
+        super().__init__(ThreadPoolExecutor(num_threads), num_threads, pre_phase_quorum)
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.executor = ThreadPoolExecutor(self.max_workers)
+
+
+class ProcessAsync(ExecutorAsync):
+    """ evaluate trials in a pool of processes
+
+    Note:
+        the objective function, its arguments and return value must be picklable
+    """
+    def __init__(self, num_processes=None, pre_phase_quorum=1.0):
+        num_processes = num_processes or os.cpu_count() or 1
+        super().__init__(ProcessPoolExecutor(num_processes), num_processes, pre_phase_quorum)
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.executor = ProcessPoolExecutor(self.max_workers)
+
+
+class TrialFailure:
+    """ returned by `Async.get_finished_trials()` in place of the result of a
+    trial which failed to produce a result (eg it was killed for exceeding a
+    resource limit)
+
+    Attributes:
+        eval_info (dict): information about the failure, including `'failed':
+            True`, the `'reason'` and an `'error'` message
+    """
+    def __init__(self, reason, error=None, **extra):
+        self.eval_info = dict(extra, failed=True, reason=reason, error=error)
+
+    def __repr__(self):
+        return 'TrialFailure({})'.format(self.eval_info)
+
+
+def _add_to_eval_info(result, **entries):
+    """ add entries to the eval_info of a result returned by the objective
+    function (or of a `TrialFailure`)
+
+    Returns:
+        the result, as a tuple of `(y, eval_info)` unless it is a `TrialFailure`.
+        An eval_info which is not a dictionary is moved to the `'eval_info'` entry.
+    """
+    if isinstance(result, TrialFailure):
+        result.eval_info.update(entries)
+        return result
+    y, eval_info = result if isinstance(result, tuple) else (result, None)
+    if eval_info is None:
+        eval_info = dict(entries)
+    elif isinstance(eval_info, dict):
+        eval_info = dict(eval_info, **entries)
+    else:
+        eval_info = dict(entries, eval_info=eval_info)
+    return y, eval_info
+
+
+def _worker_main(conn, objective, memory_limit, setup, preloaded):
+    """ the main loop of a `WorkerPoolAsync` worker process """
+    if memory_limit is not None:
+        resource.setrlimit(resource.RLIMIT_AS, (memory_limit, memory_limit))
+    setup_error = None
+    if setup is not None:
+        try:
+            setup() if preloaded is None else setup(preloaded)
+        except Exception:
+            setup_error = traceback.format_exc()
+    conn.send(('ready',))
+    while True:
+        msg = conn.recv()
+        if msg is None:
+            break
+        trial_num, params = msg
+        if setup_error is not None:
+            conn.send(('result', trial_num, False, ('setup_failed', setup_error)))
+            continue
+        try:
+            conn.send(('result', trial_num, True, objective(**params)))
+        except MemoryError:
+            conn.send(('result', trial_num, False, ('memory_limit', 'MemoryError')))
+        except Exception:
+            conn.send(('result', trial_num, False, ('exception', traceback.format_exc())))
+
+
+class WorkerPoolAsync(Async):
+    """ evaluate trials in a pool of persistent, supervised worker processes
+
+    The workers are started together when the first trial is started and
+    persist (across runs) until `shutdown()`, so any start up cost is only
+    paid once per worker rather than once per trial:
+
+    - `preload()` is called once in this process and its return value is given
+      to every worker. With the 'fork' start method it is inherited without
+      copying (copy-on-write), which suits large read-only state such as
+      datasets. Otherwise it is pickled to each worker.
+    - `setup()` (or `setup(preloaded)`) is called once in each worker before
+      it evaluates any trials, for example to import heavy libraries or fill
+      module level caches used by the objective function.
+
+    The objective function is still called as `objective(**params)`.
+
+    Each worker evaluates one trial at a time. A trial which exceeds the
+    timeout is killed along with its worker, which is replaced. Such trials,
+    along with those which raise an exception, run out of memory or crash the
+    worker, are returned as a `TrialFailure` rather than stopping the
+    optimisation.
+
+    Even with a single worker this is useful for isolating the optimiser from
+    an objective function which may hang or crash.
+
+    Straggler mitigation (opt-in, for idempotent objective functions only):
+    while the optimiser is waiting for results with workers left idle (such as
+    at the end of the pre-phase or of a run), a trial which has been running
+    for more than `straggler_factor` times the median duration of the previous
+    trials is also started on an idle worker. Whichever copy finishes first is
+    used and the other is cancelled (its worker is replaced). The eval_info of
+    such a trial has a `'speculation'` entry recording which copy won.
+
+    Note:
+        with the 'spawn' and 'forkserver' start methods, the objective function
+        and its arguments and return value must be picklable
+    """
+    def __init__(self, num_workers=1, timeout=None, memory_limit=None, start_method=None,
+                 setup=None, preload=None, speculate=False, straggler_factor=3.0, min_history=5,
+                 pre_phase_quorum=1.0):
+        """
+        Args:
+            num_workers: the number of worker processes
+            timeout: the maximum time in seconds for each trial (None for no
+                limit). Time spent in `setup()` is not included.
+            memory_limit: the maximum virtual memory in bytes for each worker
+                process (None for no limit). Requires the `resource` module
+                (Unix only).
+            start_method: the `multiprocessing` start method for the workers
+                (None for the default)
+            setup: a function to call once in each worker when it starts. If
+                it raises an exception, every trial given to that worker fails.
+            preload: a function to call once in this process, whose return
+                value is passed to `setup`
+            speculate: whether to start duplicates of straggling trials
+            straggler_factor: how many times longer than the median duration
+                a trial must have been running to be considered a straggler
+            min_history: the number of successful trials required before
+                detecting stragglers
+        """
+        super().__init__(pre_phase_quorum)
+        assert num_workers > 0
+        assert memory_limit is None or resource is not None, 'memory limits require the resource module'
+        assert preload is None or setup is not None, 'the preloaded value is passed to setup'
+        self.num_workers = num_workers
+        self.timeout = timeout
+        self.memory_limit = memory_limit
+        self.setup = setup
+        self.preload = preload
+        self.speculate = speculate
+        self.straggler_factor = straggler_factor
+        self.min_history = min_history
+        self._durations = []  # of the most recent successful trials
+        self.start_method = start_method
+        self._context = multiprocessing.get_context(start_method)
+        self._preloaded = None
+        self._objective = None
+        self._workers = []  # list of _Worker
+        self._finished = []  # (trial_num, result) waiting to be collected
+
+    class _Worker:
+        def __init__(self, process, conn):
+            self.process = process
+            self.conn = conn
+            self.ready = False  # whether setup has finished
+            self.trial_num = None  # the trial being evaluated, if any
+            self.params = None  # the parameters of the trial being evaluated
+            self.start_time = None  # when the trial started (once the worker is ready)
+            self.speculative = False  # whether evaluating a duplicate of a straggling trial
+
+    def _start_worker(self):
+        parent_conn, child_conn = self._context.Pipe()
+        args = (child_conn, self._objective, self.memory_limit, self.setup, self._preloaded)
+        process = self._context.Process(target=_worker_main, args=args, daemon=True)
+        process.start()
+        child_conn.close()
+        self._workers.append(WorkerPoolAsync._Worker(process, parent_conn))
+
+    def _stop_worker(self, worker, kill):
+        if kill:
+            worker.process.kill()
+        else:
+            try:
+                worker.conn.send(None)
+            except (OSError, BrokenPipeError):
+                pass
+        worker.process.join(timeout=None if not kill else 5)
+        worker.conn.close()
+        self._workers.remove(worker)
+
+    def get_free_capacity(self):
+        busy = sum(1 for w in self._workers if w.trial_num is not None)
+        return self.num_workers - busy
+
+    def start_trial(self, trial_num, objective, params):
+        assert self.get_free_capacity() > 0, 'no free capacity'
+        if objective is not self._objective:
+            # the objective is given to the workers when they start
+            for w in list(self._workers):
+                assert w.trial_num is None, 'cannot change the objective while trials are pending'
+                self._stop_worker(w, kill=False)
+            self._objective = objective
+        if self.preload is not None and self._preloaded is None:
+            self._preloaded = self.preload()
+        # start every worker at once so that they set up concurrently
+        while len(self._workers) < self.num_workers:
+            self._start_worker()
+
+        worker = next(w for w in self._workers if w.trial_num is None)
+        self._assign(worker, trial_num, params)
+
+    def _assign(self, worker, trial_num, params, speculative=False):
+        worker.trial_num = trial_num
+        worker.params = params
+        worker.start_time = time.time() if worker.ready else None
+        worker.speculative = speculative
+        worker.conn.send((trial_num, params))
+
+    def _release(self, worker, kill):
+        worker.trial_num = None
+        worker.params = None
+        worker.start_time = None
+        worker.speculative = False
+        if kill:
+            self._stop_worker(worker, kill=True)
+            self._start_worker()  # keep the pool warm
+
+    def has_pending_trials(self):
+        return bool(self._finished) or any(w.trial_num is not None for w in self._workers)
+
+    def _finish(self, worker, result, kill=False):
+        trial_num = worker.trial_num
+        copies = [w for w in self._workers if w is not worker and w.trial_num == trial_num]
+        failed = isinstance(result, TrialFailure)
+        if failed and copies and result.eval_info['reason'] != 'timeout':
+            self._release(worker, kill)  # the other copy may still succeed
+            return
+
+        elapsed = None if worker.start_time is None else time.time() - worker.start_time
+        if failed and elapsed is not None:
+            result.eval_info['elapsed'] = elapsed
+        if not failed and elapsed is not None and not worker.speculative:
+            self._durations = self._durations[-99:] + [elapsed]
+        if copies or worker.speculative:
+            result = _add_to_eval_info(result, speculation={'winner': 'duplicate' if worker.speculative else 'original'})
+        for w in copies:
+            self._release(w, kill=True)  # cancel
+        self._finished.append((trial_num, result))
+        self._release(worker, kill)
+
+    def _start_duplicates(self):
+        """ start duplicates of straggling trials on idle workers
+
+        Returns:
+            the time at which the next trial would become a straggler, or None
+        """
+        if not self.speculate or len(self._durations) < self.min_history:
+            return None
+        idle = [w for w in self._workers if w.ready and w.trial_num is None]
+        if not idle:
+            return None
+        duplicated = {w.trial_num for w in self._workers if w.speculative}
+        threshold = self.straggler_factor * np.median(self._durations)
+        now = time.time()
+        next_straggler = None
+        for w in list(self._workers):
+            if w.trial_num is None or w.speculative or w.start_time is None or w.trial_num in duplicated:
+                continue
+            due = w.start_time + threshold
+            if due > now:
+                next_straggler = due if next_straggler is None else min(next_straggler, due)
+            elif idle:
+                self._assign(idle.pop(), w.trial_num, w.params, speculative=True)
+        return next_straggler if idle else None
+
+    def _poll(self, timeout):
+        """ wait up to `timeout` seconds for any worker to become ready, or for
+        any busy worker to finish, crash or exceed its time limit
+        """
+        waiting = [w for w in self._workers if w.trial_num is not None or not w.ready]
+        if not waiting:
+            return
+        started = [w.start_time for w in waiting if w.start_time is not None]
+        if self.timeout is not None and started:
+            remaining = min(started) + self.timeout - time.time()
+            timeout = max(0, remaining if timeout is None else min(timeout, remaining))
+        ready = multiprocessing.connection.wait([w.conn for w in waiting] + [w.process.sentinel for w in waiting], timeout)
+
+        for w in waiting:
+            if w not in self._workers:
+                continue  # cancelled while handling another worker
+            if w.conn in ready:
+                try:
+                    msg = w.conn.recv()
+                except (EOFError, OSError):
+                    msg = None
+                if msg is None:
+                    self._crashed(w)
+                elif msg[0] == 'ready':
+                    w.ready = True
+                    if w.trial_num is not None:
+                        w.start_time = time.time()
+                else:
+                    _, trial_num, success, res = msg
+                    if success:
+                        self._finish(w, res)
+                    else:
+                        reason, error = res
+                        # a worker which ran out of memory may be left in a bad state
+                        self._finish(w, TrialFailure(reason, error), kill=(reason == 'memory_limit'))
+            elif w.process.sentinel in ready:
+                self._crashed(w)
+            elif (self.timeout is not None and w.start_time is not None and
+                  time.time() - w.start_time >= self.timeout):
+                # duplicates are timed too, in case the other copies have failed
+                self._finish(w, TrialFailure('timeout', 'exceeded {} seconds'.format(self.timeout)), kill=True)
+
+    def _crashed(self, worker):
+        worker.process.join(timeout=5)
+        error = 'exit code {}'.format(worker.process.exitcode)
+        if worker.trial_num is None:
+            # crashed during setup: replace the worker
+            self._stop_worker(worker, kill=True)
+            self._start_worker()
+        else:
+            self._finish(worker, TrialFailure('crashed', error), kill=True)
+
+    def get_finished_trials(self, wait):
+        self._poll(timeout=0)
+        while wait and not self._finished and self.has_pending_trials():
+            next_straggler = self._start_duplicates()
+            self._poll(timeout=None if next_straggler is None else max(0, next_straggler - time.time()))
+        finished, self._finished = self._finished, []
+        return sorted(finished, key=lambda t: t[0])
+
+    def shutdown(self):
+        for w in list(self._workers):
+            self._stop_worker(w, kill=w.trial_num is not None)
+        self._objective = None
+
+    def __getstate__(self):
+        # the workers cannot be pickled (eg when saving a `Recorder`), they are
+        # started again when needed (and pending trials are not saved)
+        state = self.__dict__.copy()
+        state.update(_context=None, _workers=[], _objective=None, _preloaded=None)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._context = multiprocessing.get_context(self.start_method)
+
+
+class ResourceScheduler(Async):
+    """ schedule trials onto another `Async` within a fixed budget of cores and memory
+
+    Each trial requests some number of cores and some amount of memory, either
+    from `requirements`, or from the `resource_requirements` attribute of the
+    objective function. A trial only starts when its request fits within what
+    is left of the budget, so the machine is never oversubscribed. Until then
+    it waits in a queue, and no more trials are accepted (so that trials are
+    not selected long before they can start).
+
+    The time spent waiting in the queue is added to the eval_info of each
+    trial as `'queue_time'` (see `Recorder.Trial.queue_time`).
+    """
+    def __init__(self, async_eval, cores, memory=None, requirements=None, pre_phase_quorum=1.0):
+        """
+        Args:
+            async_eval: the `Async` to start trials with once resources are
+                available. It should have enough capacity for the budget (eg
+                a worker for each core).
+            cores: the number of cores available in total
+            memory: the memory available in total (in the same units as the
+                requests) or None for no limit
+            requirements: a dictionary with optional `'cores'` (default 1) and
+                `'memory'` (default 0) entries, or a function which takes the
+                parameters of a trial and returns such a dictionary. If None,
+                the `resource_requirements` attribute of the objective function
+                is used if present.
+        """
+        super().__init__(pre_phase_quorum)
+        assert cores > 0 and (memory is None or memory > 0)
+        self.async_eval = async_eval
+        self.cores = cores
+        self.memory = memory
+        self.requirements = requirements
+        self._queue = []  # (trial_num, objective, params, (cores, memory), queued_at)
+        self._running = {}  # trial_num to ((cores, memory), queue_time)
+        self._finished = []  # (trial_num, result) waiting to be collected
+
+    def get_requirements(self, objective, params):
+        """ get the `(cores, memory)` requested by a trial """
+        req = self.requirements
+        if req is None:
+            req = getattr(objective, 'resource_requirements', None)
+        if callable(req):
+            req = req(params)
+        req = req or {}
+        return req.get('cores', 1), req.get('memory', 0)
+
+    def _get_used(self):
+        used = [needs for needs, _ in self._running.values()]
+        return sum(c for c, m in used), sum(m for c, m in used)
+
+    def _fits(self, needs):
+        used_cores, used_memory = self._get_used()
+        return (used_cores + needs[0] <= self.cores and
+                (self.memory is None or used_memory + needs[1] <= self.memory))
+
+    def _dispatch(self):
+        """ start queued trials (in order) while they fit """
+        while self._queue and self.async_eval.get_free_capacity() > 0 and self._fits(self._queue[0][3]):
+            trial_num, objective, params, needs, queued_at = self._queue.pop(0)
+            self._running[trial_num] = (needs, time.time() - queued_at)
+            self.async_eval.start_trial(trial_num, objective, params)
+
+    def get_free_capacity(self):
+        if self._queue:
+            return 0
+        free_cores = self.cores - self._get_used()[0]
+        return max(0, min(self.async_eval.get_free_capacity(), int(np.ceil(free_cores))))
+
+    def start_trial(self, trial_num, objective, params):
+        needs = self.get_requirements(objective, params)
+        if needs[0] > self.cores or (self.memory is not None and needs[1] > self.memory):
+            error = 'requested {} cores and {} memory, which exceeds the budget'.format(*needs)
+            self._finished.append((trial_num, TrialFailure('unsatisfiable', error, queue_time=0.0)))
+            return
+        self._queue.append((trial_num, objective, params, needs, time.time()))
+        self._dispatch()
+
+    def has_pending_trials(self):
+        return bool(self._queue or self._running or self._finished)
+
+    def get_finished_trials(self, wait):
+        wait = wait and not self._finished and bool(self._running)
+        for trial_num, result in self.async_eval.get_finished_trials(wait):
+            _, queue_time = self._running.pop(trial_num)
+            self._finished.append((trial_num, _add_to_eval_info(result, queue_time=queue_time)))
+        self._dispatch()
+        finished, self._finished = self._finished, []
+        return sorted(finished, key=lambda t: t[0])
+
+    def shutdown(self):
+        self.async_eval.shutdown()
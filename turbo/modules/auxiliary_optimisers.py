@@ -1,20 +1,25 @@
 #!/usr/bin/env python3
 
 import numpy as np
+import itertools
 try:
     from math import inf
 except ImportError:
     inf = float('inf')
 import warnings
+import copy
 import scipy.optimize
+from concurrent.futures import ThreadPoolExecutor
 
 # local modules
 from .naive_selectors import random_selector
+from .concurrency import get_worker_limit
+from turbo.bounds import Bounds
 from turbo.utils import row_2d
 
 
 class RandomAndQuasiNewton:
-    def __init__(self, num_random=1000, grad_restarts=10, start_from_best=2):
+    def __init__(self, num_random=1000, grad_restarts=10, start_from_best=2, candidate_selector=None):
         """
         Args:
             num_random: number of random points to sample to search for the
@@ -25,11 +30,15 @@ class RandomAndQuasiNewton:
                 as starting points in the gradient-based stage. Included in the
                 grad_restarts total, the remaining points will be chosen at
                 random. should be <= num_random and <= grad_restarts
+            candidate_selector: the naive selector used to generate the points
+                for the random stage, for example `sobol_selector()` for
+                better coverage. Defaults to `random_selector()`.
         """
         self.num_random = num_random
         self.grad_restarts = grad_restarts
         self.start_from_best = start_from_best
         self.gen_random = random_selector()
+        self.gen_candidates = candidate_selector or self.gen_random
         assert start_from_best <= num_random
         assert start_from_best <= grad_restarts
 
@@ -45,7 +54,7 @@ class RandomAndQuasiNewton:
         # negating the results at the end. This is necessary because scipy only
         # offers a gradient based minimiser.
 
-        bounds = [(lb[1], lb[2]) for lb in latent_bounds.ordered]
+        bounds = list(zip(latent_bounds.lows, latent_bounds.highs))
         all_warnings = []
 
         # keep track of the current best
@@ -57,7 +66,7 @@ class RandomAndQuasiNewton:
 
         # minimise by random sampling
         if self.num_random > 0:
-            random_x = self.gen_random(self.num_random, latent_bounds)
+            random_x = self.gen_candidates(self.num_random, latent_bounds)
             random_y = -acq(random_x)
 
             best_ids = np.argsort(random_y, axis=0).flatten()  # sorted indices
@@ -78,7 +87,7 @@ class RandomAndQuasiNewton:
                 starting_points = self.gen_random(self.grad_restarts, latent_bounds)
 
             def bfgs(j):
-                starting_point = row_2d(starting_points[j])
+                starting_point = starting_points[j].flatten()
                 # the minimiser passes x as (num_attribs,) but f wants (1,num_attribs)
                 neg_f = lambda x: -acq(row_2d(x))
 
@@ -120,10 +129,180 @@ class RandomAndQuasiNewton:
             best_x = row_2d(best_x) # shape=(1, num_attribs)
             # ensure that the chosen value lies within the bounds (which may not
             # be the case due to floating point error)
-            low_bounds, high_bounds = zip(*bounds)
-            best_x = np.clip(best_x, low_bounds, high_bounds)
-            best_y = -np.asscalar(best_y) # undo negation
+            best_x = latent_bounds.clip(best_x)
+            best_y = -float(best_y) # undo negation
 
         maximisation_info.update({'max_acq': best_y})
 
         return best_x, maximisation_info
+
+
+class DiscreteRandomAndQuasiNewton:
+    """Maximise the acquisition function over a latent space containing
+    discrete dimensions (integer parameters and one-hot groups).
+
+    Rather than optimising a continuous relaxation and rounding the result
+    (which wastes evaluations on rounded duplicates), the discrete dimensions
+    are fixed to each combination of their possible values in turn:
+
+    1. the combinations are enumerated (or sampled if there are too many)
+    2. every combination is scored by the best acquisition value over a batch
+       of random continuous samples (evaluated in a single call)
+    3. the continuous dimensions of the best few combinations are refined with
+       `continuous_optimiser`.
+
+    If the latent space is entirely continuous then `continuous_optimiser` is
+    used directly.
+    """
+    def __init__(self, max_combinations=256, num_random=50, refine_best=4, continuous_optimiser=None):
+        """
+        Args:
+            max_combinations: the maximum number of combinations of the
+                discrete dimensions to consider. Beyond this the combinations
+                are sampled at random.
+            num_random: the number of random samples of the continuous
+                dimensions used to score each combination.
+            refine_best: the number of the highest scoring combinations to
+                refine with the continuous optimiser.
+            continuous_optimiser: the auxiliary optimiser used for the
+                continuous dimensions. Defaults to `RandomAndQuasiNewton()`.
+        """
+        self.max_combinations = max_combinations
+        self.num_random = num_random
+        self.refine_best = refine_best
+        self.continuous_optimiser = continuous_optimiser or RandomAndQuasiNewton()
+        self.gen_random = random_selector()
+
+    @staticmethod
+    def _get_discrete_blocks(latent_bounds):
+        """
+        Returns:
+            (continuous, blocks) where continuous is a list of the indices of
+            the continuous dimensions and blocks is a list of (indices, choices)
+            where choices is a matrix with a row for each possible value of
+            those dimensions.
+        """
+        onehot = [[latent_bounds.get_param_index(n) for n in g] for g in latent_bounds.onehot_groups]
+        blocks = [(g, np.eye(len(g))) for g in onehot]
+        in_group = set(i for g in onehot for i in g)
+        continuous = []
+        for i, (name, pmin, pmax) in enumerate(latent_bounds.ordered):
+            if i in in_group:
+                continue
+            elif latent_bounds.get_type(name) == 'real':
+                continuous.append(i)
+            else:  # integer or categorical index
+                values = np.arange(np.ceil(pmin), np.floor(pmax)+1)
+                blocks.append(([i], values.reshape(-1, 1)))
+        return continuous, blocks
+
+    def _get_combinations(self, blocks):
+        """
+        Returns:
+            (indices, combinations) where combinations is a matrix with a row
+            for the values of the discrete dimensions `indices` for each combination
+        """
+        sizes = [len(choices) for _, choices in blocks]
+        if np.prod(sizes, dtype=float) <= self.max_combinations:
+            choice_ids = np.array(list(itertools.product(*[range(s) for s in sizes])))
+        else:
+            choice_ids = np.column_stack([np.random.randint(s, size=self.max_combinations) for s in sizes])
+            choice_ids = np.unique(choice_ids, axis=0)
+        indices = [i for block_indices, _ in blocks for i in block_indices]
+        combinations = np.hstack([choices[choice_ids[:, b]] for b, (_, choices) in enumerate(blocks)])
+        return indices, combinations
+
+    def __call__(self, latent_bounds, acq):
+        continuous, blocks = self._get_discrete_blocks(latent_bounds)
+        if not blocks:
+            return self.continuous_optimiser(latent_bounds, acq)
+
+        discrete, combinations = self._get_combinations(blocks)
+        num_combinations = combinations.shape[0]
+        num_dims = len(latent_bounds)
+        # score every combination at once, using random samples of the continuous dimensions
+        samples_per = self.num_random if continuous else 1
+        X = np.empty((num_combinations * samples_per, num_dims))
+        X[:, discrete] = np.repeat(combinations, samples_per, axis=0)
+        if continuous:
+            continuous_bounds = Bounds([latent_bounds.ordered[i] for i in continuous])
+            X[:, continuous] = self.gen_random(X.shape[0], continuous_bounds)
+        ys = acq(X)
+        best_i = int(np.argmax(ys))
+        best_x, best_y = row_2d(X[best_i]), float(ys[best_i])
+        maximisation_info = {'num_combinations': num_combinations}
+
+        if continuous:
+            scores = np.max(ys.reshape(num_combinations, samples_per), axis=1)
+            all_warnings = []
+            for c in np.argsort(-scores)[:self.refine_best]:
+                fixed = combinations[c]
+                def combination_acq(Xc, fixed=fixed):
+                    full = np.empty((Xc.shape[0], num_dims))
+                    full[:, discrete] = fixed
+                    full[:, continuous] = Xc
+                    return acq(full)
+                x, info = self.continuous_optimiser(continuous_bounds, combination_acq)
+                all_warnings.extend(info.get('warnings', []))
+                if x is not None and info['max_acq'] > best_y:
+                    best_x = np.empty((1, num_dims))
+                    best_x[0, discrete] = fixed
+                    best_x[0, continuous] = x.flatten()
+                    best_y = info['max_acq']
+            if all_warnings:
+                maximisation_info.update({'warnings': all_warnings})
+
+        maximisation_info.update({'max_acq': best_y})
+        return best_x, maximisation_info
+
+class AdditiveMaximiser:
+    """Maximise the acquisition function of an additive surrogate model one
+    group of dimensions at a time.
+
+    When the surrogate is additive (see `AdditiveGPySurrogate`) and the
+    acquisition function is treated as a sum over the groups (such as UCB),
+    each group can be maximised independently (and concurrently), turning one
+    high dimensional maximisation into several low dimensional ones. For UCB
+    this is an approximation: the mean decomposes exactly, but the
+    uncertainty of each group is taken on its own, dropping the covariance
+    terms between the groups.
+
+    Acquisition functions which are not additive (such as those penalised by
+    `Fallback`) are maximised over every dimension at once by the group
+    optimiser instead.
+    """
+    def __init__(self, group_optimiser=None, num_threads=None):
+        """
+        Args:
+            group_optimiser: the auxiliary optimiser used for each group.
+                Defaults to `RandomAndQuasiNewton()`.
+            num_threads (int): the number of groups to maximise concurrently.
+                None to use the default for `concurrent.futures.ThreadPoolExecutor`.
+        """
+        self.group_optimiser = group_optimiser or RandomAndQuasiNewton()
+        self.num_threads = num_threads
+
+    def __call__(self, latent_bounds, acq):
+        groups = getattr(acq.model, 'groups', None)
+        assert groups is not None, 'AdditiveMaximiser requires an additive surrogate model'
+        if not acq.additive:
+            return self.group_optimiser(latent_bounds, acq)
+
+        def maximise_group(j):
+            group_bounds = Bounds([latent_bounds.ordered[i] for i in groups[j]])
+            group_acq = copy.copy(acq)
+            group_acq.model = acq.model.group_model(j)
+            return self.group_optimiser(group_bounds, group_acq)
+
+        with ThreadPoolExecutor(get_worker_limit(self.num_threads)) as pool:
+            results = list(pool.map(maximise_group, range(len(groups))))
+
+        best_x = np.empty((1, len(latent_bounds)))
+        for g, (x, info) in zip(groups, results):
+            if x is None:
+                return None, {'max_acq': -inf, 'group_info': [info for _, info in results]}
+            best_x[0, g] = x.flatten()
+
+        maximisation_info = {'max_acq': float(acq(best_x)[0]),
+                             'group_info': [info for _, info in results]}
+        return best_x, maximisation_info
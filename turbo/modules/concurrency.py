@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+""" Budgeting the cores used while selecting and evaluating trials """
+
+import os
+import time
+import threading
+import contextlib
+
+try:
+    import threadpoolctl
+except ImportError:
+    threadpoolctl = None  # not required, BLAS thread limits are not applied without it
+
+
+_local = threading.local()
+
+
+def get_worker_limit(default=None):
+    """ the number of workers (threads or processes) that a module may use in
+    the current thread (see `ConcurrencyManager` and `worker_limit()`)
+
+    Args:
+        default: the number of workers the module would otherwise use (None
+            for the module's own default)
+
+    Returns:
+        `default` if no limit is in effect, otherwise the limit (or `default`
+        if that is smaller)
+    """
+    limit = getattr(_local, 'worker_limit', None)
+    if limit is None:
+        return default
+    return limit if default is None else min(limit, default)
+
+
+@contextlib.contextmanager
+def worker_limit(limit):
+    """ limit the number of workers that modules may use in this thread (None for no limit) """
+    previous = getattr(_local, 'worker_limit', None)
+    _local.worker_limit = limit
+    try:
+        yield
+    finally:
+        _local.worker_limit = previous
+
+
+def _is_parallel(module):
+    """ whether a module spreads its work over several workers (and so should
+    be given several single-threaded workers rather than one multi-threaded one)
+    """
+    return hasattr(module, 'num_threads') or bool(getattr(module, 'optimise_params', {}).get('parallel'))
+
+
+class ConcurrencyManager:
+    """ A budget of cores shared between the phases of selecting a trial and
+    the evaluations which are in progress
+
+    Assigning a `ConcurrencyManager` to `Optimiser.concurrency` limits the
+    surrogate fitting and acquisition maximisation phases of each Bayesian
+    optimisation trial to the cores which are not reserved for evaluations in
+    progress (`cores_per_evaluation` each, leaving at least one core). Within
+    a phase, the cores are either split between several single-threaded
+    workers (for modules which parallelise their work, such as GPy surrogates
+    with parallel restarts or modules with a `num_threads` attribute) or given
+    to a single worker as BLAS threads. `phase_workers` overrides the number of
+    workers for a phase.
+
+    Modules read their worker limit with `get_worker_limit()`. BLAS (and
+    OpenMP) thread limits are applied with `threadpoolctl` if it is installed.
+
+    The decision for each phase is added to the selection_info of the trial
+    as a list under `'concurrency'`, each with the `'phase'`, the `'cores'`
+    available, the number `'evaluating'`, the `'workers'` and `'blas_threads'`
+    assigned, whether the BLAS limit was applied and the `'duration'` of the
+    phase in seconds.
+
+    Note:
+        BLAS thread limits apply to the whole process, so evaluations running
+        in threads of the same process are also limited during the phase. Use
+        `apply_evaluation_limits()` (eg as the `setup` of a `WorkerPoolAsync`)
+        to limit evaluation workers to their share.
+    """
+    PHASES = ('surrogate_fitting', 'acquisition_maximisation')
+
+    def __init__(self, total_cores=None, cores_per_evaluation=1, phase_workers=None, limit_blas=True):
+        """
+        Args:
+            total_cores: the number of cores to share (None for every core)
+            cores_per_evaluation: the number of cores reserved for each
+                evaluation in progress
+            phase_workers: a dictionary of phase name to the maximum number of
+                workers for that phase, for phases which should not use the default
+            limit_blas: whether to limit the number of BLAS threads in each phase
+        """
+        self.total_cores = total_cores or os.cpu_count() or 1
+        assert self.total_cores >= 1 and cores_per_evaluation >= 1
+        self.cores_per_evaluation = cores_per_evaluation
+        self.phase_workers = phase_workers or {}
+        assert all(p in ConcurrencyManager.PHASES for p in self.phase_workers), 'unknown phase'
+        self.limit_blas = limit_blas
+
+    def get_max_evaluations(self):
+        """ the number of evaluations which fit in the budget at once (eg for sizing an `Async` pool) """
+        return max(1, self.total_cores // self.cores_per_evaluation)
+
+    def apply_evaluation_limits(self, *args):
+        """ limit the number of BLAS threads of this process to `cores_per_evaluation`
+
+        Intended for evaluation worker processes. Any arguments are ignored so
+        that this can be used as a `WorkerPoolAsync` setup function.
+        """
+        if threadpoolctl is not None:
+            threadpoolctl.threadpool_limits(self.cores_per_evaluation)
+
+    def allocate(self, optimiser, phase):
+        """ decide the budget for a phase of selecting a trial
+
+        Returns:
+            a dictionary describing the allocation (see the class documentation)
+        """
+        assert phase in ConcurrencyManager.PHASES, 'unknown phase: {}'.format(phase)
+        rt = optimiser.rt
+        evaluating = rt.started_trials - rt.finished_trials - rt.failed_trials
+        cores = max(1, self.total_cores - evaluating * self.cores_per_evaluation)
+
+        if phase in self.phase_workers:
+            workers = self.phase_workers[phase]
+        else:
+            module = optimiser.surrogate if phase == 'surrogate_fitting' else optimiser.aux_optimiser
+            workers = cores if _is_parallel(module) else 1
+        workers = max(1, min(cores, workers))
+        return {'phase': phase, 'cores': cores, 'evaluating': evaluating,
+                'workers': workers, 'blas_threads': max(1, cores // workers)}
+
+    @contextlib.contextmanager
+    def phase(self, optimiser, phase):
+        """ apply the budget for a phase of selecting a trial in this thread
+
+        Yields:
+            the allocation (see `allocate()`), to which the `'duration'` is
+            added once the phase has finished
+        """
+        allocation = self.allocate(optimiser, phase)
+        allocation['blas_limited'] = self.limit_blas and threadpoolctl is not None
+        start = time.perf_counter()
+        try:
+            with contextlib.ExitStack() as stack:
+                if allocation['blas_limited']:
+                    stack.enter_context(threadpoolctl.threadpool_limits(allocation['blas_threads']))
+                stack.enter_context(worker_limit(allocation['workers']))
+                yield allocation
+        finally:
+            allocation['duration'] = time.perf_counter() - start
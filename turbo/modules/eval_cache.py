@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+""" Memoisation of objective function evaluations """
+
+import os
+import json
+import hashlib
+import numbers
+from collections import OrderedDict
+
+
+def mark_cache_hit(eval_info):
+    """ annotate the eval_info of a cached evaluation to show that it was a cache hit
+
+    Returns:
+        a dictionary with `'cache_hit': True`. If `eval_info` is a dictionary
+        then it is copied and annotated, otherwise it is stored under the key
+        `'eval_info'`.
+    """
+    if eval_info is None:
+        return {'cache_hit': True}
+    elif isinstance(eval_info, dict):
+        return dict(eval_info, cache_hit=True)
+    else:
+        return {'cache_hit': True, 'eval_info': eval_info}
+
+
+def is_cache_hit(eval_info):
+    """ whether the given eval_info was annotated by `mark_cache_hit()` """
+    return isinstance(eval_info, dict) and eval_info.get('cache_hit', False) is True
+
+
+class EvalCache:
+    """ A cache of objective function results, keyed on the parameters passed
+    to the objective function (in the input space)
+
+    Assigning an `EvalCache` to `Optimiser.eval_cache` causes the optimiser to
+    look up every trial before evaluating it. A cache hit is used as the result
+    of the trial (without calling the objective function) and its eval_info is
+    annotated using `mark_cache_hit()`.
+
+    The most recently used `max_size` entries are kept in memory. If a filename
+    is given, every new result is also appended to that file (as a line of
+    JSON) so that it persists across runs and processes. The file is read when
+    the cache is constructed.
+
+    Note:
+        real-valued parameters are rounded to a multiple of `tolerance` before
+        hashing, so values which are much closer than `tolerance` usually share
+        an entry. Values either side of a rounding boundary do not.
+
+    Note:
+        eval_info is only written to the file if it can be serialised to JSON
+    """
+    def __init__(self, max_size=100000, filename=None, tolerance=1e-9, namespace=''):
+        """
+        Args:
+            max_size: the maximum number of entries to keep in memory
+            filename: the file to persist the entries to, or None to only cache in memory
+            tolerance: the resolution of real-valued parameters when matching
+                (0 for exact matching)
+            namespace (str): included in every key, so that several objective
+                functions can share a file without colliding
+        """
+        assert max_size > 0 and tolerance >= 0
+        self.max_size = max_size
+        self.filename = filename
+        self.tolerance = tolerance
+        self.namespace = namespace
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # key to (y, eval_info), least recently used first
+        if filename is not None and os.path.exists(filename):
+            self._load()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _canonical(self, value):
+        if isinstance(value, (bool, numbers.Integral)):
+            return int(value)
+        elif isinstance(value, numbers.Real):
+            value = float(value)
+            return value if self.tolerance == 0 else int(round(value / self.tolerance))
+        elif isinstance(value, str):
+            return value
+        else:
+            return repr(value)
+
+    def get_key(self, params):
+        """ get the key for a dictionary of parameter names to values """
+        canonical = [self.namespace] + [[name, self._canonical(params[name])] for name in sorted(params)]
+        return hashlib.sha1(json.dumps(canonical).encode('utf-8')).hexdigest()
+
+    def get(self, params):
+        """ look up the result for the given parameters
+
+        Returns:
+            `(y, eval_info)` with eval_info annotated by `mark_cache_hit()`, or
+            None if the parameters are not in the cache
+        """
+        key = self.get_key(params)
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._entries.move_to_end(key)
+        y, eval_info = entry
+        return y, mark_cache_hit(eval_info)
+
+    def put(self, params, y, eval_info=None):
+        """ store the result of evaluating the objective function with the given parameters """
+        if is_cache_hit(eval_info):
+            return  # already stored
+        key = self.get_key(params)
+        self._store(key, y, eval_info)
+        if self.filename is not None:
+            record = {'key': key, 'y': y, 'eval_info': eval_info}
+            try:
+                line = json.dumps(record)
+            except TypeError:
+                record['eval_info'] = None
+                line = json.dumps(record)
+            with open(self.filename, 'a') as f:
+                f.write(line + '\n')
+
+    def _store(self, key, y, eval_info):
+        self._entries[key] = (y, eval_info)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def _load(self):
+        with open(self.filename, 'r') as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue  # a partially written line from an interrupted process
+                self._store(record['key'], record['y'], record['eval_info'])
@@ -2,7 +2,8 @@
 
 import numpy as np
 
-from turbo.utils import close_to_any
+from turbo.utils import row_2d
+
 
 
 class Fallback:
@@ -20,21 +21,36 @@ class Fallback:
             helper functions are provided: `Fallback.planned_with_probability()`
             and `Fallback.planned_with_interval()` for easily constructing these
             functions.
-        close_tolerance: the maximum Euclidean distance considered 'too close',
-            causing a Bayesian optimisation trial to be discarded and the
-            fallback method used instead (not planned) (<0 to disable)
+        close_tolerance: the maximum squared Euclidean distance considered 'too
+            close', causing a Bayesian optimisation trial to be discarded and
+            the fallback method used instead (not planned) (<0 to disable)
         selector: the selector to use during fallback. If None then the `pre_phase_selector` is used
+        local_penalty_radius: when a Bayesian optimisation trial is too close,
+            first try maximising the acquisition function again, multiplied by
+            a penalty which is 0 at the existing points and rises linearly to 1
+            (no penalty) at this Euclidean distance (in the latent space) from
+            them. The selector is only used if the new point is also too
+            close. (None to disable)
     """
-    def __init__(self, planned_fallback=None, close_tolerance=1e-10, selector=None):
+    def __init__(self, planned_fallback=None, close_tolerance=1e-10, selector=None, local_penalty_radius=None):
         self.planned_fallback = planned_fallback
         self.close_tolerance = close_tolerance
         self.selector = selector
+        assert local_penalty_radius is None or local_penalty_radius > 0
+        self.local_penalty_radius = local_penalty_radius
         self._last_planned_fallback = -1
+        self._last_decision = None  # (trial_num, planned)
 
     def fallback_is_planned(self, trial_num):
-        """ whether a fallback is planned for this trial (queried before performing Bayesian optimisation) """
+        """ whether a fallback is planned for this trial (queried before performing Bayesian optimisation)
+
+        Note:
+            querying the same trial again gives the same answer
+        """
         if self.planned_fallback is None:
             return False
+        elif self._last_decision is not None and self._last_decision[0] == trial_num:
+            return self._last_decision[1]
         else:
             if self._last_planned_fallback == -1:
                 # on the first Bayesian optimisation trial, behave like a fallback
@@ -44,14 +60,24 @@ class Fallback:
             planned = self.planned_fallback(trial_num, self._last_planned_fallback)
             if planned:
                 self._last_planned_fallback = trial_num
+            self._last_decision = (trial_num, planned)
             return planned
 
-    def point_too_close(self, x, X):
-        """ whether the trial point x is too close to any of the points in X """
+    def point_too_close(self, x, finished_index):
+        """ whether the trial point x is too close to any of the points in the
+        given `SpatialIndex` (usually `optimiser.rt.finished_index`)
+        """
         if self.close_tolerance < 0:
             return False
         else:
-            return close_to_any(x, X, tol=self.close_tolerance)
+            return bool(finished_index.any_within(row_2d(x), np.sqrt(self.close_tolerance))[0])
+
+    def penalise(self, acq, index):
+        """ wrap the acquisition function `acq` with a local penalty around the
+        points of the given `SpatialIndex` (see `local_penalty_radius`)
+        """
+        assert self.local_penalty_radius is not None
+        return LocallyPenalised(acq, index, self.local_penalty_radius)
 
     def select_trial(self, optimiser, trial_num): # TODO: unused argument
         """ select a trial using the fallback method """
@@ -74,3 +100,30 @@ class Fallback:
         """ pass to Fallback constructor to use fallback once every `interval` iterations """
         return lambda trial_num, last_planned_fallback: trial_num - last_planned_fallback >= interval
 
+
+class LocallyPenalised:
+    """ An acquisition function multiplied by a penalty `p` in `[0,1]` which
+    vanishes at the points of a `SpatialIndex`
+
+    Since the acquisition function may be negative, the penalised value is
+    `a*p` where `a >= 0` and `a/p` otherwise, so that the penalty always makes
+    a point less desirable.
+    """
+    additive = False
+
+    def __init__(self, acq, index, radius):
+        self.acq = acq
+        self.model = acq.model
+        self.desired_extremum = acq.desired_extremum
+        self.index = index
+        self.radius = radius
+
+    def get_name(self):
+        return 'penalised {}'.format(self.acq.get_name())
+
+    def __call__(self, X):
+        a = self.acq(X)
+        dists, _ = self.index.nearest(X, max_distance=self.radius)
+        # the minimum prevents dividing by zero at the existing points
+        p = np.clip(dists / self.radius, 1e-12, 1)
+        return np.where(a >= 0, a * p, a / p)
@@ -60,17 +60,23 @@ class LatentSpace:
         """
         raise NotImplementedError()
     def param_to_latent(self, param_name, param_val):
-        """ convert a value for the given parameter from input space to latent space """
+        """ convert a value (or array of values) for the given parameter from input space to latent space """
         raise NotImplementedError()
     def param_from_latent(self, param_name, param_val):
-        """ convert a value for the given parameter from latent space to input space """
+        """ convert a value (or array of values) for the given parameter from latent space to input space """
         raise NotImplementedError()
     def to_latent(self, point):
-        """ convert a point from input space to latent space """
+        """ convert a point (or matrix of points as rows) from input space to latent space """
         raise NotImplementedError()
     def from_latent(self, point):
-        """ convert a point from latent space to input space """
+        """ convert a point (or matrix of points as rows) from latent space to input space """
         raise NotImplementedError()
+    def snap(self, point):
+        """ move a latent point (or matrix of points as rows) to the nearest
+        latent point which corresponds exactly to a point in the input space
+        (for example by rounding integer parameters)
+        """
+        return self.get_latent_bounds().snap(point)
 
     def linear_latent_range(self, param, divisions):
         """Get a range of values evenly spaced in the latent space spanning the
@@ -104,6 +110,9 @@ class LatentSpace:
 class ConstantMap:
     """A mapping for a single parameter between the latent and input spaces
     which does not change throughout the optimisation.
+
+    The mappings accept either a single value or an array of values, so that
+    many points can be converted in a single numpy operation.
     """
     def input_to_latent(self, param): raise NotImplementedError()
     def latent_to_input(self, param): raise NotImplementedError()
@@ -158,11 +167,11 @@ class LogMap(ConstantMap):
         self.zero_point = zero_point
 
     def input_to_latent(self, param):
-        assert self.zero_point < param, 'point {} outside valid range ]{}, infinity]'.format(param, self.zero_point)
-        return math.log(param - self.zero_point)
+        assert np.all(self.zero_point < param), 'point {} outside valid range ]{}, infinity]'.format(param, self.zero_point)
+        return np.log(np.subtract(param, self.zero_point))
 
     def latent_to_input(self, param):
-        return math.exp(param) + self.zero_point
+        return np.exp(param) + self.zero_point
 
 
 class LinearMap(ConstantMap):
@@ -183,11 +192,11 @@ class LinearMap(ConstantMap):
         self.latent_range = latent_space_range
 
     def input_to_latent(self, param):
-        assert self.input_range[0] <= param <= self.input_range[1], 'point outside valid range'
+        assert np.all((self.input_range[0] <= param) & (param <= self.input_range[1])), 'point outside valid range'
         return remap(param, self.input_range, self.latent_range)
 
     def latent_to_input(self, param):
-        assert self.latent_range[0] <= param <= self.latent_range[1], 'point outside valid range'
+        assert np.all((self.latent_range[0] <= param) & (param <= self.latent_range[1])), 'point outside valid range'
         return remap(param, self.latent_range, self.input_range)
 
 #TODO: make helper functions which generate constant latent spaces mapping to hypercubes centered at the origin or over the range [0,1]
@@ -218,6 +227,8 @@ class ConstantLatentSpace(LatentSpace):
             'parameters with mappings differs from those of the bounds.'
         assert all(isinstance(m, ConstantMap) for m in self.mappings.values()), \
             'mappings of ConstantLatentSpace must be constant.'
+        assert input_bounds.is_continuous(), \
+            'ConstantLatentSpace only supports continuous parameters, see OneHotLatentSpace'
         self.input_bounds = input_bounds
 
         latent_bounds = []
@@ -236,20 +247,26 @@ class ConstantLatentSpace(LatentSpace):
         return ['latent_' + param_name]
 
     def _transform_point(self, point, to_latent):
-        """Convert a point to or from the latent space
+        """Convert a point or matrix of points (as rows) to or from the latent space
+
+        Each parameter is converted for every point at once, so the cost of
+        converting many points is a numpy operation per parameter rather than a
+        Python call per element.
 
         Args:
             to_latent (bool): True/False to determine the mapping direction. False => from_latent
+
+        Returns:
+            the converted point(s) with the same shape as `point`
         """
         num_params = len(self.input_bounds)
-        assert point.shape == (num_params,) or point.shape == (1, num_params), \
+        assert point.shape[-1] == num_params and point.ndim <= 2, \
             'invalid point shape: {}'.format(point.shape)
-        point = point.flatten() # makes a copy
-        for i in range(num_params):
-            name = self.input_bounds.ordered[i][0]
-            point[i] = self.param_to_latent(name, point[i]) if to_latent \
-                else self.param_from_latent(name, point[i])
-        return point
+        points = np.array(point, dtype=float, ndmin=2) # makes a copy
+        for i, name in enumerate(self.input_bounds.names):
+            points[:, i] = self.param_to_latent(name, points[:, i]) if to_latent \
+                else self.param_from_latent(name, points[:, i])
+        return points.reshape(point.shape)
 
     def param_to_latent(self, param_name, param_val):
         return self.mappings[param_name].input_to_latent(param_val)
@@ -258,11 +275,204 @@ class ConstantLatentSpace(LatentSpace):
         return self.mappings[param_name].latent_to_input(param_val)
 
     def to_latent(self, point):
-        """ transform the point from the input space to the latent space """
+        """ transform the point or rows of points from the input space to the latent space """
         return self._transform_point(point, to_latent=True)
 
     def from_latent(self, point):
-        """ transform the point from the latent space to the input space """
+        """ transform the point or rows of points from the latent space to the input space """
         return self._transform_point(point, to_latent=False)
 
 
+
+
+class OneHotLatentSpace(LatentSpace):
+    """ A latent space which supports integer and categorical parameters
+
+    - continuous parameters are mapped with a `ConstantMap` (identity by default)
+    - integer parameters are left unchanged, but marked as integer in the latent
+      bounds so that the auxiliary optimiser can treat them as discrete.
+    - categorical parameters with `k` categories are one-hot encoded using `k`
+      latent parameters in the range `[0,1]`. Converting back to the input
+      space chooses the category with the greatest latent value.
+
+    Use with `DiscreteRandomAndQuasiNewton` so that the acquisition function is
+    only maximised over valid points in the latent space.
+    """
+    def __init__(self, mappings=None):
+        """
+        Args:
+            mappings (dict): a dictionary of param_name to ConstantMap for any
+                of the continuous parameters. The remaining continuous
+                parameters use `IdentityMap`.
+        """
+        super().__init__()
+        self.mappings = mappings or {}
+        self.latent_bounds = None
+        self._latent_names = None
+
+    def _set_input_bounds(self, input_bounds):
+        assert all(input_bounds.get_type(name) == 'real' for name in self.mappings.keys()), \
+            'mappings are only supported for continuous parameters'
+        assert all(isinstance(m, ConstantMap) for m in self.mappings.values()), \
+            'mappings of OneHotLatentSpace must be constant.'
+        self.input_bounds = input_bounds
+
+        latent_bounds = []
+        onehot_groups = []
+        self._latent_names = {}
+        for name, pmin, pmax in input_bounds.ordered:
+            param_type = input_bounds.get_type(name)
+            if param_type == 'categorical':
+                names = ['latent_{}_{}'.format(name, i) for i in range(int(pmax)+1)]
+                latent_bounds.extend((n, 0, 1) for n in names)
+                onehot_groups.append(names)
+            elif param_type == 'integer':
+                names = ['latent_' + name]
+                latent_bounds.append((names[0], pmin, pmax, 'integer'))
+            else:
+                names = ['latent_' + name]
+                latent_bounds.append((names[0], self.param_to_latent(name, pmin), self.param_to_latent(name, pmax)))
+            self._latent_names[name] = names
+
+        self.latent_bounds = Bounds(latent_bounds, onehot_groups=onehot_groups)
+        self._latent_indices = [[self.latent_bounds.get_param_index(n) for n in self._latent_names[b[0]]]
+                                for b in input_bounds.ordered]
+
+    def get_latent_bounds(self):
+        return self.latent_bounds
+
+    def get_latent_param_names(self, param_name):
+        return self._latent_names[param_name]
+
+    def param_to_latent(self, param_name, param_val):
+        param_type = self.input_bounds.get_type(param_name)
+        assert param_type != 'categorical', 'categorical parameters map to several latent parameters'
+        if param_type == 'integer':
+            return np.round(param_val)
+        return self.mappings.get(param_name, IdentityMap()).input_to_latent(param_val)
+
+    def param_from_latent(self, param_name, param_val):
+        param_type = self.input_bounds.get_type(param_name)
+        assert param_type != 'categorical', 'categorical parameters map to several latent parameters'
+        if param_type == 'integer':
+            return np.round(param_val)
+        return self.mappings.get(param_name, IdentityMap()).latent_to_input(param_val)
+
+    def to_latent(self, point):
+        """ transform the point or rows of points from the input space to the latent space """
+        X = np.array(point, dtype=float, ndmin=2)
+        assert X.shape[1] == len(self.input_bounds), 'invalid point shape: {}'.format(point.shape)
+        Z = np.empty((X.shape[0], len(self.latent_bounds)))
+        for i, (name, pmin, pmax) in enumerate(self.input_bounds.ordered):
+            cols = self._latent_indices[i]
+            if self.input_bounds.get_type(name) == 'categorical':
+                Z[:, cols] = np.eye(len(cols))[np.round(X[:, i]).astype(int)]
+            else:
+                Z[:, cols[0]] = self.param_to_latent(name, X[:, i])
+        return Z.reshape(-1) if np.ndim(point) == 1 else Z
+
+    def from_latent(self, point):
+        """ transform the point or rows of points from the latent space to the input space """
+        Z = np.array(point, dtype=float, ndmin=2)
+        assert Z.shape[1] == len(self.latent_bounds), 'invalid point shape: {}'.format(point.shape)
+        X = np.empty((Z.shape[0], len(self.input_bounds)))
+        for i, (name, pmin, pmax) in enumerate(self.input_bounds.ordered):
+            cols = self._latent_indices[i]
+            if self.input_bounds.get_type(name) == 'categorical':
+                X[:, i] = np.argmax(Z[:, cols], axis=1)
+            else:
+                X[:, i] = self.param_from_latent(name, Z[:, cols[0]])
+        return X.reshape(-1) if np.ndim(point) == 1 else X
+
+class RandomEmbeddingLatentSpace(LatentSpace):
+    r"""A latent space of (much) lower dimensionality than the input space,
+    connected to the input space by a random linear embedding (REMBO).
+
+    If only a few directions of the input space have a significant effect on
+    the objective function, then with high probability a random subspace of
+    sufficient dimensionality contains the optimum, and so the search can be
+    performed in that subspace instead. The surrogate and acquisition function
+    then operate on `latent_dims` dimensions rather than one per parameter.
+
+    The input space is normalised to :math:`[-1,1]^D` and a point
+    :math:`\mathbf z` in the latent box :math:`[-\sqrt d, \sqrt d]^d` maps to
+    the (normalised) input space as :math:`clip(A\mathbf z, -1, 1)` where the
+    entries of :math:`A` are drawn from :math:`\mathcal N(0, 1)`.
+
+    Note:
+        the mapping from input to latent space is not invertible (many latent
+        points are clipped to the same input point), so `to_latent()` uses the
+        least squares solution which is exact only for input points that lie
+        within the embedding.
+
+    Note:
+        since every input parameter depends on every latent parameter, the
+        single parameter conversions (`param_to_latent()` etc) are not
+        available, and so neither are the single parameter plots.
+
+    See: Wang et al., "Bayesian Optimization in a Billion Dimensions via Random
+    Embeddings", JAIR 2016
+    """
+    def __init__(self, latent_dims, seed=None):
+        """
+        Args:
+            latent_dims (int): the number of dimensions of the latent space.
+                Should be at least the number of 'effective' dimensions of
+                the objective function.
+            seed (int): the seed for generating the random projection, or None
+                to use the global numpy random state.
+        """
+        super().__init__()
+        assert latent_dims > 0, 'invalid number of latent dimensions'
+        self.latent_dims = latent_dims
+        self.seed = seed
+        self.projection = None  # A: shape=(input_dims, latent_dims)
+        self.latent_bounds = None
+
+    def _set_input_bounds(self, input_bounds):
+        assert input_bounds.is_continuous(), \
+            'RandomEmbeddingLatentSpace only supports continuous parameters'
+        self.input_bounds = input_bounds
+        input_dims = len(input_bounds)
+        # the projection must stay fixed between runs, otherwise the latent
+        # points of the previous trials would no longer be meaningful
+        if self.projection is None or self.projection.shape != (input_dims, self.latent_dims):
+            rand = np.random if self.seed is None else np.random.RandomState(self.seed)
+            self.projection = rand.normal(size=(input_dims, self.latent_dims))
+        self._projection_pinv = np.linalg.pinv(self.projection)
+
+        half_width = math.sqrt(self.latent_dims)
+        self.latent_bounds = Bounds([('latent_{}'.format(i), -half_width, half_width)
+                                     for i in range(self.latent_dims)])
+
+    def get_latent_bounds(self):
+        return self.latent_bounds
+
+    def get_latent_param_names(self, param_name):
+        # every input space parameter depends on every latent space parameter
+        return self.latent_bounds.names
+
+    def param_to_latent(self, param_name, param_val):
+        raise NotImplementedError('a random embedding does not map parameters individually')
+
+    def param_from_latent(self, param_name, param_val):
+        raise NotImplementedError('a random embedding does not map parameters individually')
+
+    def linear_latent_range(self, param, divisions):
+        raise NotImplementedError('a random embedding does not map parameters individually')
+
+    def to_latent(self, point):
+        """ transform the point or rows of points from the input space to the latent space """
+        X = np.atleast_2d(point)
+        assert X.shape[1] == len(self.input_bounds), 'invalid point shape: {}'.format(point.shape)
+        U = 2 * self.input_bounds.to_unit_cube(X) - 1  # normalise to [-1, 1]
+        Z = self.latent_bounds.clip(U.dot(self._projection_pinv.T))
+        return Z.reshape(-1) if np.ndim(point) == 1 else Z
+
+    def from_latent(self, point):
+        """ transform the point or rows of points from the latent space to the input space """
+        Z = np.atleast_2d(point)
+        assert Z.shape[1] == self.latent_dims, 'invalid point shape: {}'.format(point.shape)
+        U = np.clip(Z.dot(self.projection.T), -1, 1)
+        X = self.input_bounds.from_unit_cube((U + 1) / 2)
+        return X.reshape(-1) if np.ndim(point) == 1 else X
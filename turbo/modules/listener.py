@@ -11,7 +11,7 @@ class Listener:
                 - acquisition_maximised (possibly)
             - selection_finished
             - evaluation_started
-        - evaluation_finished (some time later, others may have started in the meantime)
+        - evaluation_finished or evaluation_failed (some time later, others may have started in the meantime)
         - run_finished
         - unregistered
 
@@ -77,6 +77,17 @@ class Listener:
         """
         pass
 
+    def evaluation_failed(self, trial_num, eval_info):
+        """ Called instead of `evaluation_finished` when the evaluation for the
+        given trial failed to produce a result (eg it exceeded a time limit)
+
+        Args:
+            trial_num: the trial that failed
+            eval_info (dict): information about the failure, see
+                `turbo.modules.TrialFailure`
+        """
+        pass
+
     def run_finished(self):
         """ Called when `Optimiser.run()` exits """
         pass
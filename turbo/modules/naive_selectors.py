@@ -7,12 +7,20 @@ The interface is designed such that each call will generate the next N items in
 a sequence. Any persistent data required to keep track of the sequence should be
 handled internally by the module.
 """
+import time
+import warnings
 import numpy as np
 
+from turbo.utils import SpatialIndex
+
+try:
+    import scipy.stats.qmc as qmc
+except ImportError:
+    qmc = None  # requires scipy >= 1.7, not required if not used
+
 #TODO: manual selector in input space and with dictionaries, get the conversion to latent space from the optimiser
 #TODO: is convention in turbo that points should be rows?
 #TODO: interactive manual selector which doesn't have a sequence preloaded, but instead prompts the user each time
-#TODO: implement grid selector
 
 
 #TODO: stop using __call__ and rename to be camel case
@@ -39,47 +47,366 @@ class manual_selector:
 class random_selector:
     """ select points uniform-randomly in the latent space """
     def __call__(self, num_points, latent_bounds):
-        # generate values for each parameter
-        cols = []
-        for name, pmin, pmax in latent_bounds.ordered:
-            cols.append(np.random.uniform(pmin, pmax, size=(num_points, 1)))
-        return np.hstack(cols)
+        # rand is uniform random over [0,1)
+        return latent_bounds.from_unit_cube(np.random.rand(num_points, len(latent_bounds)))
+
+
+class sobol_selector:
+    """ select points from a (scrambled) Sobol' low-discrepancy sequence in the latent space
+
+    Points are generated in bulk by scipy's (vectorised) Sobol' engine. The
+    position in the sequence is stored in `index`, which along with the seed is
+    all that is required to resume the sequence (eg after loading a checkpoint)
+    since the engine can jump directly to any position.
+
+    Note:
+        the balance properties of Sobol' sequences are best when drawing a
+        power of 2 number of points at a time.
+    """
+    def __init__(self, scramble=True, seed=None, skip=0):
+        """
+        Args:
+            scramble (bool): whether to randomly scramble the sequence (Owen
+                type scrambling). An unscrambled sequence always starts at the
+                origin.
+            seed (int): the seed for the scrambling. If None then a seed is
+                chosen using the global numpy random state (so that the
+                sequence can still be resumed).
+            skip (int): the number of points to skip from the start of the sequence
+        """
+        assert qmc is not None, 'failed to import scipy.stats.qmc (requires scipy >= 1.7).'
+        self.scramble = scramble
+        self.seed = np.random.randint(2**31) if seed is None else seed
+        self.index = skip  # index into the sequence
+        self._engine = None
+
+    def __getstate__(self):
+        # the engine can be reconstructed from the seed and index
+        state = self.__dict__.copy()
+        state['_engine'] = None
+        return state
+
+    def skip(self, num_points):
+        """ skip ahead in the sequence without generating the points """
+        self.index += num_points
+
+    def _get_engine(self, dims):
+        e = self._engine
+        if e is None or e.d != dims or e.num_generated != self.index:
+            try:
+                e = qmc.Sobol(dims, scramble=self.scramble, rng=self.seed)
+            except TypeError:  # scipy < 1.15
+                e = qmc.Sobol(dims, scramble=self.scramble, seed=self.seed)
+            if self.index > 0:
+                e.fast_forward(self.index)
+            self._engine = e
+        return e
+
+    def __call__(self, num_points, latent_bounds):
+        engine = self._get_engine(len(latent_bounds))
+        with warnings.catch_warnings():
+            warnings.filterwarnings('ignore', '.*balance properties.*')
+            samples = engine.random(num_points)
+        self.index += num_points
+        return latent_bounds.from_unit_cube(samples)
 
 
 class random_selector_with_tolerance:
-    def __init__(self, optimiser, close_tolerance=1e-8):
+    """ select points uniform-randomly in the latent space, rejecting any which
+    are too close to a finished or pending trial of the optimiser (or to each other)
+
+    Candidates are drawn and checked against the finished trials in large
+    batches, using the optimiser's spatial index of the finished trials.
+
+    Opt-in (the default preset uses `random_selector`), for example:
+    `opt.fallback = tm.Fallback(selector=tm.random_selector_with_tolerance(opt))`
+    """
+    def __init__(self, optimiser, close_tolerance=1e-8, batch_size=1000, max_attempts=100):
+        """
+        Args:
+            optimiser: the optimiser whose trials should be avoided
+            close_tolerance: the maximum squared Euclidean distance considered
+                'too close' (like `Fallback.close_tolerance`)
+            batch_size: the number of candidates to draw at once
+            max_attempts: the maximum number of batches to draw before giving up
+        """
+        self.optimiser = optimiser
+        self.close_tolerance = close_tolerance
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+
+    def __call__(self, num_points, latent_bounds):
+        rt = self.optimiser.rt
+        radius = np.sqrt(self.close_tolerance)
+        # the pending trials and the points chosen so far
+        avoid = SpatialIndex(num_dims=len(latent_bounds))
+        if rt.pending_trials:
+            avoid.add(np.vstack(list(rt.pending_trials.values())))
+
+        chosen = []
+        for _ in range(self.max_attempts):
+            candidates = latent_bounds.from_unit_cube(np.random.rand(self.batch_size, len(latent_bounds)))
+            candidates = candidates[~rt.finished_index.any_within(candidates, radius)]
+            for c in candidates:
+                if not avoid.any_within(c, radius):
+                    avoid.add(c)
+                    chosen.append(c)
+                    if len(chosen) == num_points:
+                        return np.vstack(chosen)
+        raise RuntimeError('failed to find {} points further than the tolerance from existing trials after {} attempts'.format(
+            num_points, self.max_attempts * self.batch_size))
+
+
+class grid_selector:
+    """ select points from a Cartesian grid over the latent space
+
+    The grid is never materialised: each point is computed from its cell
+    index by mixed radix arithmetic, so grids with billions of cells can be
+    used. The traversal order is either the natural (C) order of the cells, or
+    a pseudo-random permutation of them which is also computed on the fly
+    (rather than by shuffling a list of every cell).
+
+    The position in the traversal is stored in `index`, which along with the
+    seed is all that is required to resume (eg after loading a checkpoint).
+    """
+    def __init__(self, divisions, shuffle=False, seed=None, optimiser=None, close_tolerance=1e-8):
+        """
+        Args:
+            divisions: the number of grid points along each latent dimension,
+                either an int for every dimension or a list with an int for
+                each dimension. With 1 division, the midpoint is used.
+            shuffle (bool): whether to traverse the grid in a pseudo-random order
+            seed (int): the seed of the traversal order when shuffling. If None
+                then a seed is chosen using the global numpy random state.
+            optimiser: if given, grid points which are within `close_tolerance`
+                of a finished or pending trial of this optimiser are skipped.
+            close_tolerance: the maximum squared Euclidean distance for a grid
+                point to be considered already evaluated
+        """
+        self.divisions = divisions
+        self.shuffle = shuffle
+        self.seed = np.random.randint(2**31) if seed is None else seed
         self.optimiser = optimiser
         self.close_tolerance = close_tolerance
+        self.index = 0  # the number of cells visited so far (including those skipped)
+
+    def _get_divisions(self, latent_bounds):
+        dims = len(latent_bounds)
+        divisions = [self.divisions] * dims if np.isscalar(self.divisions) else list(self.divisions)
+        assert len(divisions) == dims and all(d > 0 for d in divisions), 'invalid divisions: {}'.format(divisions)
+        return divisions
+
+    def get_num_cells(self, latent_bounds):
+        """ the number of points in the grid """
+        return int(np.prod(self._get_divisions(latent_bounds), dtype=object))
+
+    def _permute(self, positions, num_cells):
+        """ map positions in the traversal to cell indices with a pseudo-random permutation
+
+        A small Feistel network is a bijection on the integers `[0, 2^bits)`.
+        Applying it repeatedly until the value lies within the grid (cycle
+        walking) gives a bijection on `[0, num_cells)`.
+        """
+        half = max(1, (int(num_cells - 1).bit_length() + 1) // 2)
+        mask = np.uint64((1 << half) - 1)
+        keys = np.random.RandomState(self.seed).randint(1, 2**31, size=4).astype(np.uint64)
+
+        def feistel(x):
+            left, right = x >> np.uint64(half), x & mask
+            for k in keys:
+                f = ((right * np.uint64(0x9E3779B97F4A7C15) + k) >> np.uint64(17)) & mask
+                left, right = right, left ^ f
+            return (left << np.uint64(half)) | right
+
+        cells = feistel(positions.astype(np.uint64))
+        outside = cells >= num_cells
+        while np.any(outside):
+            cells[outside] = feistel(cells[outside])
+            outside = cells >= num_cells
+        return cells.astype(np.int64)
+
+    def _cells_to_points(self, cells, divisions, latent_bounds):
+        """ convert cell indices to points in the latent space (C order) """
+        unit = np.empty((len(cells), len(divisions)))
+        remaining = cells.copy()
+        for i in reversed(range(len(divisions))):
+            d = divisions[i]
+            unit[:, i] = 0.5 if d == 1 else (remaining % d) / (d - 1)
+            remaining //= d
+        return latent_bounds.from_unit_cube(unit)
 
     def __call__(self, num_points, latent_bounds):
-        pass#TODO
+        divisions = self._get_divisions(latent_bounds)
+        num_cells = self.get_num_cells(latent_bounds)
+        assert num_cells < 2**62, 'grid too large'
+        radius = np.sqrt(self.close_tolerance)
+        pending = None
+        if self.optimiser is not None and self.optimiser.rt.pending_trials:
+            pending = SpatialIndex(np.vstack(list(self.optimiser.rt.pending_trials.values())))
+
+        chosen = []
+        num_chosen = 0
+        while num_chosen < num_points:
+            assert self.index < num_cells, 'grid exhausted'
+            # take a few extra in case some have already been evaluated
+            batch = min(2 * (num_points - num_chosen) + 16, num_cells - self.index)
+            positions = np.arange(self.index, self.index + batch, dtype=np.int64)
+            cells = self._permute(positions, num_cells) if self.shuffle else positions
+            points = self._cells_to_points(cells, divisions, latent_bounds)
+
+            keep = np.ones(batch, dtype=bool)
+            if self.optimiser is not None:
+                keep &= ~self.optimiser.rt.finished_index.any_within(points, radius)
+                if pending is not None:
+                    keep &= ~pending.any_within(points, radius)
+            # only consume the positions up to the last point required
+            kept = np.flatnonzero(keep)[:num_points - num_chosen]
+            self.index += batch if len(kept) < num_points - num_chosen else int(kept[-1]) + 1
+            chosen.append(points[kept])
+            num_chosen += len(kept)
+        return np.vstack(chosen)
 
 
 class LHS_selector:
-    """Latin Hypercube sampling selector """
-    def __init__(self, num_total):
+    r"""Latin Hypercube sampling selector
+
+    By default a single random Latin hypercube is used. With
+    `criterion='maximin'` the design is optimised to spread the points out
+    (maximising the minimum distance between any two points) which avoids the
+    clustering which can occur with a random design:
+
+    1. many random candidate designs are generated and scored at once, keeping
+       the best.
+    2. the best candidate is improved by simulated annealing, where each step
+       swaps two elements within a column (which preserves the Latin hypercube
+       property). Only the distances to the two swapped points are updated
+       each step.
+
+    The annealing uses the Morris-Mitchell criterion :math:`\phi_p`, a smooth
+    alternative to the minimum distance which also accounts for the other
+    small distances.
+
+    See: Morris and Mitchell, "Exploratory Designs for Computational
+    Experiments", 1995
+    """
+    def __init__(self, num_total, criterion=None, num_candidates=100, iterations=10000, max_time=5):
+        """
+        Args:
+            num_total: the length of the sequence
+            criterion: None for a random Latin hypercube or 'maximin' to
+                optimise the design
+            num_candidates: (maximin) the number of random designs to choose between
+            iterations: (maximin) the maximum number of annealing steps
+            max_time: (maximin) the maximum number of seconds to spend optimising
+        """
+        assert criterion in (None, 'maximin'), 'unknown criterion: {}'.format(criterion)
         self.num_total = num_total
+        self.criterion = criterion
+        self.num_candidates = num_candidates
+        self.iterations = iterations
+        self.max_time = max_time
         self.sequence = None
+        self.min_distance = None  # the minimum distance between points of the design (unit cube)
         self.index = 0  # index into the sequence
 
+    @staticmethod
+    def _random_designs(num_designs, n, dims):
+        """ generate random Latin hypercubes in the unit cube `shape=(num_designs, n, dims)`
+
+        fills points uniformly in each interval, then shuffles each dimension of each design
+        """
+        # sorting random keys gives an independent permutation for each column
+        perms = np.argsort(np.random.rand(num_designs, n, dims), axis=1)
+        return (perms + np.random.rand(num_designs, n, dims)) / n
+
+    @staticmethod
+    def _sq_distances(designs):
+        """ squared distances between every pair of points for each design `shape=(num_designs, n, n)` """
+        diffs = designs[:, :, np.newaxis, :] - designs[:, np.newaxis, :, :]
+        return np.sum(diffs**2, axis=3)
+
+    def _best_candidate(self, n, dims, deadline):
+        """ generate random designs and return the one with the greatest minimum distance """
+        # limit the memory used for the pairwise distances
+        chunk = max(1, min(self.num_candidates, int(2e7 // (n * n * dims))))
+        best, best_d = None, -np.inf
+        generated = 0
+        while generated < self.num_candidates and (best is None or time.time() < deadline):
+            designs = self._random_designs(min(chunk, self.num_candidates - generated), n, dims)
+            sq_dists = self._sq_distances(designs)
+            sq_dists[:, np.arange(n), np.arange(n)] = np.inf
+            min_dists = np.min(sq_dists, axis=(1, 2))
+            i = int(np.argmax(min_dists))
+            if min_dists[i] > best_d:
+                best, best_d = designs[i], min_dists[i]
+            generated += designs.shape[0]
+        return best
+
+    def _anneal(self, design, deadline, p=50, initial_temperature=0.01, cooling=0.999):
+        """ improve the design by swapping elements within columns """
+        n, dims = design.shape
+        sq_dists = self._sq_distances(design[np.newaxis])[0]
+        np.fill_diagonal(sq_dists, np.inf)
+        # scale the distances so that the terms of phi_p don't overflow
+        scale = np.min(sq_dists)
+        terms = (sq_dists / scale) ** (-p / 2)  # zero on the diagonal
+        phi = np.sum(terms) / 2
+
+        best, best_phi = design.copy(), phi
+        temperature = initial_temperature
+        for it in range(self.iterations):
+            if it % 100 == 0:
+                if time.time() > deadline:
+                    break
+                phi = np.sum(terms) / 2  # prevent rounding errors from accumulating
+            i, j = np.random.choice(n, size=2, replace=False)
+            k = np.random.randint(dims)
+            design[[i, j], k] = design[[j, i], k]
+
+            # only the distances to points i and j change (and not between i and j)
+            new_rows = np.sum((design[[i, j], np.newaxis, :] - design[np.newaxis, :, :])**2, axis=2)
+            new_rows[:, [i, j]] = np.inf
+            new_terms = (new_rows / scale) ** (-p / 2)
+            delta = np.sum(new_terms) - np.sum(terms[[i, j]]) + 2 * terms[i, j]
+
+            if delta < 0 or np.random.rand() < np.exp(-delta / (temperature * phi + 1e-300)):
+                ij_term = terms[i, j]
+                sq_dists[[i, j], :] = new_rows
+                sq_dists[:, [i, j]] = new_rows.T
+                sq_dists[i, j] = sq_dists[j, i] = np.sum((design[i] - design[j])**2)
+                terms[[i, j], :] = new_terms
+                terms[:, [i, j]] = new_terms.T
+                terms[i, j] = terms[j, i] = ij_term
+                phi += delta
+                if phi < best_phi:
+                    best, best_phi = design.copy(), phi
+            else:
+                design[[i, j], k] = design[[j, i], k]  # undo
+            temperature *= cooling
+        return best
+
+    def _generate(self, latent_bounds):
+        n = self.num_total  # length of the sequence
+        dims = len(latent_bounds)
+        if self.criterion is None or n < 2:
+            design = self._random_designs(1, n, dims)[0]
+        else:
+            deadline = time.time() + self.max_time
+            design = self._best_candidate(n, dims, deadline)
+            design = self._anneal(design, deadline)
+        if n > 1:
+            sq_dists = self._sq_distances(design[np.newaxis])[0]
+            np.fill_diagonal(sq_dists, np.inf)
+            self.min_distance = float(np.sqrt(np.min(sq_dists)))
+        # each row of sequence is a sample
+        return latent_bounds.from_unit_cube(design)
+
     def __call__(self, num_points, latent_bounds):
         if self.sequence is None:
             # first call, generate the sequence
-            # fills points uniformly in each interval
-            lower_bounds = np.array([b[1] for b in latent_bounds.ordered])
-            ranges = np.array([b[2]-b[1] for b in latent_bounds.ordered])
-            n = self.num_total  # length of the sequence
-            dims = len(latent_bounds)
-            # rand is uniform random over [0,1)
-            # each row of sequence is a sample
-            self.sequence = lower_bounds + ranges * (np.arange(n).reshape(-1, 1) + np.random.rand(n, dims)) / n
-            # shuffle each dimension
-            for i in range(dims):
-                self.sequence[:, i] = np.random.permutation(self.sequence[:, i])
+            self.sequence = self._generate(latent_bounds)
 
         assert self.index + num_points <= len(self.sequence), 'LHS sequence exhausted!'
         samples = self.sequence[self.index:self.index+num_points, :]
         self.index += num_points
         return samples
-
-
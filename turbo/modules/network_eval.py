@@ -0,0 +1,299 @@
+#!/usr/bin/env python3
+""" Evaluating trials on worker processes which connect over TCP """
+
+import os
+import time
+import uuid
+import socket
+import threading
+import traceback
+import socketserver
+from collections import deque
+
+from .. import net
+from .async_eval import Async, TrialFailure, _add_to_eval_info
+
+
+class _Server(socketserver.ThreadingTCPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+
+
+class CoordinatorAsync(Async):
+    """ hand trials out to worker processes (see `run_worker()`) which connect
+    over TCP, possibly from other hosts
+
+    The coordinator listens as soon as it is constructed. Workers pull trials
+    from a queue, evaluate them using their own copy of the objective function
+    and send back the result. The objective function passed to `start_trial()`
+    is ignored.
+
+    A trial is leased to the worker which pulled it. The worker renews the
+    lease with heartbeats while it evaluates the trial. If the lease expires
+    (eg the worker died or lost its connection) the trial is re-queued at the
+    front of the queue, up to `max_attempts` times before it is returned as a
+    `TrialFailure`. The first result to arrive for a trial is used. The
+    eval_info of each result records the `'worker'` and `'attempt'`.
+
+    Note:
+        the parameters, results and eval_info must be serialisable to JSON,
+        except that they may contain numpy arrays (sent as raw buffers)
+
+    Note:
+        a coordinator which has been pickled (eg as part of a saved `Recorder`)
+        is loaded shut down, since it cannot take over the address
+
+    Attributes:
+        address: `(host, port)` that the coordinator is listening on
+        num_requeued: the number of leases which have expired
+    """
+    def __init__(self, max_workers, host='127.0.0.1', port=0, lease_duration=30.0, max_attempts=3,
+                 pre_phase_quorum=1.0):
+        """
+        Args:
+            max_workers: the maximum number of trials to have queued or leased
+                at once (usually the number of workers)
+            host: the interface to listen on ('' or '0.0.0.0' for every interface)
+            port: the port to listen on (0 to pick a free port, see `address`)
+            lease_duration: the time in seconds that a worker holds a trial for
+                without a heartbeat
+            max_attempts: the number of times a trial may be leased
+        """
+        super().__init__(pre_phase_quorum)
+        assert max_workers > 0 and lease_duration > 0 and max_attempts > 0
+        self.max_workers = max_workers
+        self.lease_duration = lease_duration
+        self.max_attempts = max_attempts
+        self.num_requeued = 0
+        self._changed = threading.Condition()  # guards the state below
+        self._params = {}  # trial_num to params, for every queued or leased trial
+        self._attempts = {}  # trial_num to the number of times it has been leased
+        self._queue = deque()  # trial_num waiting to be leased
+        self._leases = {}  # trial_num to (worker, expiry time)
+        self._finished = []  # (trial_num, result) waiting to be collected
+        self._last_seen = {}  # worker to the last time it made a request
+        self._stopping = False
+        self._told_to_stop = set()  # workers which have been told to stop
+
+        coordinator = self
+
+        class Handler(socketserver.BaseRequestHandler):
+            def handle(self):
+                net.serve_connection(self.request, coordinator._handle)
+
+        self._server = _Server((host, port), Handler)
+        self.address = self._server.server_address[:2]
+        self._thread = threading.Thread(target=self._server.serve_forever, kwargs={'poll_interval': 0.1},
+                                        daemon=True)
+        self._thread.start()
+
+    def _handle(self, msg):
+        """ handle a request from a worker
+
+        Returns:
+            the response
+        """
+        worker = msg['worker']
+        with self._changed:
+            now = time.time()
+            self._last_seen[worker] = now
+            self._expire_leases(now)
+
+            if msg['type'] == 'trial_request':
+                if self._stopping:
+                    self._told_to_stop.add(worker)
+                    self._changed.notify_all()
+                    return {'type': 'stop'}
+                if not self._queue:
+                    return {'type': 'no_trial'}
+                trial_num = self._queue.popleft()
+                self._attempts[trial_num] += 1
+                self._leases[trial_num] = (worker, now + self.lease_duration)
+                return {'type': 'trial', 'trial_num': trial_num, 'params': self._params[trial_num],
+                        'lease_duration': self.lease_duration}
+
+            elif msg['type'] == 'heartbeat':
+                trial_num = msg['trial_num']
+                holder = self._leases.get(trial_num, (None, None))[0]
+                if holder == worker:
+                    self._leases[trial_num] = (worker, now + self.lease_duration)
+                return {'type': 'ack', 'lease_valid': holder == worker}
+
+            elif msg['type'] == 'result':
+                trial_num = msg['trial_num']
+                if trial_num in self._params:  # otherwise another attempt finished first
+                    if msg['success']:
+                        result = (msg['y'], msg['eval_info'])
+                    else:
+                        result = TrialFailure('exception', msg['error'])
+                    result = _add_to_eval_info(result, worker=worker, attempt=self._attempts[trial_num])
+                    self._finish(trial_num, result)
+                return {'type': 'ack'}
+
+            else:
+                raise ValueError('unknown request type: {}'.format(msg['type']))
+
+    def _expire_leases(self, now):
+        for trial_num, (worker, expiry) in list(self._leases.items()):
+            if expiry >= now:
+                continue
+            del self._leases[trial_num]
+            self.num_requeued += 1
+            if self._attempts[trial_num] >= self.max_attempts:
+                self._finish(trial_num, TrialFailure('lease_expired', 'the lease expired {} times'.format(
+                    self._attempts[trial_num]), worker=worker, attempt=self._attempts[trial_num]))
+            else:
+                self._queue.appendleft(trial_num)
+
+    def _finish(self, trial_num, result):
+        del self._params[trial_num]
+        del self._attempts[trial_num]
+        self._leases.pop(trial_num, None)
+        if trial_num in self._queue:
+            self._queue.remove(trial_num)
+        self._finished.append((trial_num, result))
+        self._changed.notify_all()
+
+    def get_free_capacity(self):
+        with self._changed:
+            return self.max_workers - len(self._params)
+
+    def start_trial(self, trial_num, objective, params):
+        with self._changed:
+            assert self.max_workers - len(self._params) > 0, 'no free capacity'
+            assert not self._stopping, 'the coordinator has been shut down (or was loaded from a file)'
+            self._params[trial_num] = params
+            self._attempts[trial_num] = 0
+            self._queue.append(trial_num)
+
+    def has_pending_trials(self):
+        with self._changed:
+            return len(self._params) > 0 or len(self._finished) > 0
+
+    def get_finished_trials(self, wait):
+        with self._changed:
+            while True:
+                self._expire_leases(time.time())
+                if self._finished or not wait or not self._params:
+                    break
+                # wake up in time to expire the next lease
+                expiries = [expiry for _, expiry in self._leases.values()]
+                timeout = self.lease_duration if not expiries else max(0, min(expiries) - time.time())
+                self._changed.wait(timeout + 0.01)
+            finished, self._finished = self._finished, []
+        return sorted(finished, key=lambda t: t[0])
+
+    def get_num_workers(self):
+        """ the number of workers which have made a request within the last `lease_duration` """
+        now = time.time()
+        with self._changed:
+            return sum(1 for t in self._last_seen.values() if now - t <= self.lease_duration)
+
+    def shutdown(self):
+        """ tell the workers to stop, then stop listening
+
+        Workers which have made a request within the last `lease_duration`
+        are told to stop when they next ask for a trial. This waits up to
+        `lease_duration` seconds for them to do so.
+        """
+        with self._changed:
+            self._stopping = True
+            give_up = time.time() + self.lease_duration
+            while time.time() < give_up:
+                now = time.time()
+                active = {w for w, t in self._last_seen.items() if now - t <= self.lease_duration}
+                if active <= self._told_to_stop:
+                    break
+                self._changed.wait(give_up - now)
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._thread.join()
+            self._server = None
+
+    def __getstate__(self):
+        # the server, its thread and the lock cannot be pickled (eg when saving
+        # a `Recorder`). A loaded coordinator does not listen and cannot start
+        # trials, pending trials are not saved.
+        state = self.__dict__.copy()
+        state.update(_changed=None, _server=None, _thread=None, _params={}, _attempts={}, _queue=deque(),
+                     _leases={}, _finished=[], _last_seen={}, _stopping=True, _told_to_stop=set())
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._changed = threading.Condition()
+
+
+def _default_worker_id():
+    return '{}:{}:{}'.format(socket.gethostname(), os.getpid(), uuid.uuid4().hex[:8])
+
+
+def run_worker(objective, host, port, worker_id=None, max_trials=None, poll_interval=0.5,
+               retry_time=60.0, should_stop=None):
+    """ evaluate trials handed out by a `CoordinatorAsync` until it tells the
+    worker to stop (or becomes unreachable)
+
+    The objective function is called as `objective(**params)`. If it raises an
+    exception then the trial fails (the traceback is sent to the coordinator)
+    and the worker carries on. A heartbeat is sent every third of the lease
+    duration while a trial is being evaluated.
+
+    Args:
+        objective: the objective function
+        host: the host of the coordinator
+        port: the port of the coordinator
+        worker_id: a unique name for this worker (generated if None)
+        max_trials: the maximum number of trials to evaluate (None for no limit)
+        poll_interval: the time to wait before asking again when no trial is available
+        retry_time: how long to keep trying to reach the coordinator in seconds
+            before giving up
+        should_stop: a function which returns whether to stop before pulling
+            the next trial (None to only stop when told to)
+
+    Returns:
+        the number of trials that this worker evaluated
+    """
+    worker_id = worker_id or _default_worker_id()
+    # heartbeats are sent from another thread, so use a separate connection
+    with net.Client((host, port), retry_time) as client, net.Client((host, port)) as beat_client:
+        return _worker_loop(objective, client, beat_client, worker_id, max_trials, poll_interval, should_stop)
+
+
+def _worker_loop(objective, client, beat_client, worker_id, max_trials, poll_interval, should_stop):
+    num_evaluated = 0
+    while max_trials is None or num_evaluated < max_trials:
+        if should_stop is not None and should_stop():
+            break
+        msg = client.request({'type': 'trial_request', 'worker': worker_id})
+        if msg is None or msg['type'] == 'stop':
+            break
+        elif msg['type'] == 'no_trial':
+            time.sleep(poll_interval)
+            continue
+
+        trial_num = msg['trial_num']
+        heartbeat = {'type': 'heartbeat', 'worker': worker_id, 'trial_num': trial_num}
+        finished = threading.Event()
+
+        def beat():
+            while not finished.wait(msg['lease_duration'] / 3):
+                beat_client.request(heartbeat)  # failures are tolerated until the lease expires
+
+        beat_thread = threading.Thread(target=beat, daemon=True)
+        beat_thread.start()
+        result = {'type': 'result', 'worker': worker_id, 'trial_num': trial_num}
+        try:
+            res = objective(**msg['params'])
+            y, eval_info = res if isinstance(res, tuple) else (res, None)
+            result.update(success=True, y=y, eval_info=eval_info)
+        except Exception:
+            result.update(success=False, error=traceback.format_exc())
+        finally:
+            finished.set()
+            beat_thread.join()
+
+        # a lost result is recovered by the lease expiring, so keep trying for a while
+        client.request(result)
+        num_evaluated += 1
+    return num_evaluated
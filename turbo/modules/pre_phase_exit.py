@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+""" Criteria for finishing the pre-phase early """
+
+import copy
+import numpy as np
+
+
+class PrePhaseExit:
+    """ A criterion for moving from the pre-phase to Bayesian optimisation
+    before `Optimiser.pre_phase_trials` (which becomes a maximum) is reached
+
+    The criterion is queried as each pre-phase trial is about to be selected.
+    Once it returns True, every remaining trial uses Bayesian optimisation.
+
+    Note:
+        when the whole pre-phase is selected up front (batch objectives), the
+        criterion cannot prevent the remaining pre-phase trials from being
+        evaluated. With asynchronous evaluation, the remaining pre-phase trials
+        which have not yet been dispatched are discarded.
+    """
+    def should_exit(self, optimiser, trial_num):
+        """ whether the pre-phase should finish before the given trial
+
+        Args:
+            optimiser: the optimiser, from which the finished trials can be read
+            trial_num: the trial which is about to be selected
+        """
+        raise NotImplementedError()
+
+
+class HeldOutErrorExit(PrePhaseExit):
+    """ finish the pre-phase once the surrogate predicts new results well and
+    consistently
+
+    Every `interval` finished trials, the surrogate is fitted to the trials
+    which finished before the last check and used to predict the trials which
+    finished since. The error is the standardised mean squared error (1 is no
+    better than predicting the mean). The pre-phase is exited once the last
+    `window` errors are all below `max_error` and lie within `tolerance` of one
+    another. The first check is made once at least `min_trials` trials and at
+    least `interval` trials after the first 2 have finished.
+
+    Attributes:
+        errors: a list of `(num_finished, error)` for each check so far
+    """
+    def __init__(self, min_trials=5, interval=2, window=3, tolerance=0.1, max_error=0.5):
+        """
+        Args:
+            min_trials: the number of finished trials required before fitting
+                the first model
+            interval: the number of newly finished trials between checks
+            window: the number of consecutive checks required to be stable
+            tolerance: the maximum difference between the errors in the window
+            max_error: the maximum standardised mean squared error in the window
+        """
+        assert min_trials >= 2 and interval >= 1 and window >= 1
+        self.min_trials = min_trials
+        self.interval = interval
+        self.window = window
+        self.tolerance = tolerance
+        self.max_error = max_error
+        self.errors = []
+        self._last_checked = None  # the number of finished trials at the last check
+
+    def should_exit(self, optimiser, trial_num):
+        rt = optimiser.rt
+        n = rt.finished_trials
+        if self._last_checked is None:
+            if n < self.min_trials:
+                return False
+            # fit the first model to at least 2 trials
+            self._last_checked = max(2, n - self.interval)
+        if n - self._last_checked < self.interval:
+            return False
+
+        X, y = np.vstack(rt.trial_xs), np.array(rt.trial_ys)
+        seen = self._last_checked
+        self._last_checked = n
+        var = np.var(y)
+        if var == 0:
+            return False  # no signal yet
+        # fit a copy so that the state carried between models of the surrogate is left alone
+        surrogate = copy.copy(optimiser.surrogate)
+        model, _ = surrogate.construct_model(trial_num, X[:seen], y[:seen])
+        error = np.mean((model.predict(X[seen:]) - y[seen:])**2) / var
+        self.errors.append((n, float(error)))
+
+        recent = [e for _, e in self.errors[-self.window:]]
+        return (len(recent) == self.window and
+                max(recent) <= self.max_error and
+                max(recent) - min(recent) <= self.tolerance)
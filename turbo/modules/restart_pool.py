@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+""" A persistent pool of processes for the restarts of hyperparameter optimisation """
+
+import os
+import contextlib
+import multiprocessing
+import concurrent.futures
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+from . import concurrency
+from .concurrency import get_worker_limit
+
+
+_attached = {}  # in a worker: name to the block of shared memory which is attached
+
+
+def _init_worker():
+    if concurrency.threadpoolctl is not None:
+        # the workers run concurrently, so each uses a single BLAS thread
+        concurrency.threadpoolctl.threadpool_limits(1)
+
+
+def get_shared_arrays(spec):
+    """ get the arrays shared with `RestartPool.share()` (from within a worker)
+
+    The block of shared memory stays attached until a different block is
+    requested, so each trial's data is only attached once per worker.
+
+    Args:
+        spec: the value yielded by `RestartPool.share()`
+
+    Returns:
+        a list of read only arrays backed by the shared memory
+    """
+    name, shapes = spec
+    shm = _attached.get(name)
+    if shm is None:
+        for old in _attached.values():
+            old.close()
+        _attached.clear()
+        shm = _attached[name] = shared_memory.SharedMemory(name=name)
+    arrays = []
+    offset = 0
+    for shape in shapes:
+        arr = np.ndarray(shape, dtype=np.float64, buffer=shm.buf, offset=offset)
+        arr.setflags(write=False)
+        arrays.append(arr)
+        offset += arr.nbytes
+    return arrays
+
+
+class RestartPool:
+    """ A long-lived pool of worker processes for running the restarts of a
+    surrogate's hyperparameter optimisation concurrently
+
+    Pass a `RestartPool` to `GPySurrogate` or `SciKitGPSurrogate` (several
+    surrogates, and so several optimisers, may share one pool). The training
+    data of each trial is copied once into shared memory which the workers
+    attach to, rather than being sent with every restart. The workers are
+    started when first needed and persist until `shutdown()`. A pool which has
+    been shut down starts again if it is used again.
+
+    A pool which is passed to a surrogate is left for the caller to shut down
+    (once every optimiser using it has finished), since `shutdown()` must not
+    be called while another thread is in `map()`. A pool which a surrogate
+    creates for itself (with `restart_pool=True`) is shut down by
+    `Optimiser.shutdown()`.
+
+    The number of restarts running at once is limited by `get_worker_limit()`
+    (see `ConcurrencyManager`). Each worker uses a single BLAS thread (if
+    `threadpoolctl` is installed).
+
+    Note:
+        the restart functions and their arguments must be picklable
+    """
+    def __init__(self, num_workers=None, start_method=None):
+        """
+        Args:
+            num_workers: the number of worker processes (None for the number of cores)
+            start_method: the `multiprocessing` start method for the workers
+                (None for the default)
+        """
+        self.num_workers = num_workers or os.cpu_count() or 1
+        self.start_method = start_method
+        self._executor = None
+
+    def _get_executor(self):
+        if self._executor is None:
+            context = multiprocessing.get_context(self.start_method)
+            self._executor = ProcessPoolExecutor(self.num_workers, mp_context=context, initializer=_init_worker)
+        return self._executor
+
+    @contextlib.contextmanager
+    def share(self, *arrays):
+        """ copy arrays (as float64) into a new block of shared memory for the
+        duration of the context
+
+        Yields:
+            a specification to pass to the workers, from which they can get the
+            arrays with `get_shared_arrays()`
+        """
+        arrays = [np.ascontiguousarray(a, dtype=np.float64) for a in arrays]
+        shm = shared_memory.SharedMemory(create=True, size=max(1, sum(a.nbytes for a in arrays)))
+        try:
+            offset = 0
+            for a in arrays:
+                np.ndarray(a.shape, dtype=np.float64, buffer=shm.buf, offset=offset)[...] = a
+                offset += a.nbytes
+            yield shm.name, [a.shape for a in arrays]
+        finally:
+            shm.close()
+            shm.unlink()
+
+    def map(self, function, *iterables):
+        """ call `function` with the arguments taken from each of the iterables
+        (like the builtin `map`) concurrently in the workers
+
+        Returns:
+            a list of the results in order
+
+        Raises:
+            the first exception raised by a call (after every call has finished)
+        """
+        executor = self._get_executor()
+        limit = get_worker_limit(self.num_workers)
+        calls = list(zip(*iterables))
+        futures = {}  # future to index
+        for i, args in enumerate(calls):
+            while len(futures) - sum(1 for f in futures if f.done()) >= limit:
+                concurrent.futures.wait([f for f in futures if not f.done()],
+                                        return_when=concurrent.futures.FIRST_COMPLETED)
+            futures[executor.submit(function, *args)] = i
+        concurrent.futures.wait(futures)
+        results = [None] * len(calls)
+        for f, i in futures.items():
+            results[i] = f.result()
+        return results
+
+    def shutdown(self):
+        """ stop the workers (they start again if the pool is used again) """
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+    def __getstate__(self):
+        # the executor cannot be pickled (eg when saving a `Recorder`), it is created again when needed
+        state = self.__dict__.copy()
+        state['_executor'] = None
+        return state
@@ -3,6 +3,7 @@
 import warnings
 import numpy as np
 import copy
+from concurrent.futures import ThreadPoolExecutor
 
 try:
     import sklearn.gaussian_process as sk_gp
@@ -15,6 +16,8 @@ except ImportError:
     GPy = None  # not required if not used
 
 import turbo as tb
+from .concurrency import get_worker_limit, worker_limit
+from .restart_pool import RestartPool, get_shared_arrays
 
 #TODO: MCMC?
 
@@ -38,6 +41,10 @@ class Surrogate:
         """
         raise NotImplementedError()
 
+    def shutdown(self):
+        """ release any resources held (such as worker pools) """
+        pass
+
     class ModelInstance:
         """An instance of the surrogate model which is trained on the data set
         for a particular trial.
@@ -81,6 +88,75 @@ class Surrogate:
             raise NotImplementedError()
 
 
+def _build_gpy_model(sparse, X, y, model_params, initial_params):
+    """ construct a GPy model with the given hyperparameters (None to leave
+    them at their default values), without optimising them
+
+    Args:
+        y: the targets as a column vector
+    """
+    model_class = GPy.models.SparseGPRegression if sparse else GPy.models.GPRegression
+
+    # don't initialise the model until the initial hyperparameters have been set
+    # will always raise RuntimeWarning("Don't forget to initialize by self.initialize_parameter()!")
+    with warnings.catch_warnings():
+        warnings.filterwarnings('ignore', '.*initialize_parameter.*')
+        model = model_class(X, y, initialize=False, **model_params)
+
+    # these steps for initialising a model from stored parameters are from https://github.com/SheffieldML/GPy
+    model.update_model(False)  # prevents the GP from fitting to the data until we are ready to enable it manually
+    model.initialize_parameter()  # initialises the hyperparameter objects
+    if initial_params is not None:
+        model[:] = initial_params
+    model.update_model(True)
+    return model
+
+
+def _gpy_restart(data, sparse, model_params, initial_params, seed, optimise_params, robust):
+    """ run a single restart of the hyperparameter optimisation of a GPy model
+    (in a `RestartPool` worker)
+
+    Args:
+        data: the shared `(X, y)` (see `RestartPool.share()`)
+        seed: the seed for randomising the starting parameters, or None to
+            start from `initial_params`
+
+    Returns:
+        `(objective, optimizer_array)` for the optimised model, or None if the
+        optimisation failed and `robust` is True
+    """
+    X, y = get_shared_arrays(data)
+    model = _build_gpy_model(sparse, X, y, model_params, initial_params)
+    if seed is not None:
+        np.random.seed(seed)
+        model.randomize()
+    try:
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore')
+            model.optimize(**optimise_params)
+    except Exception:
+        if robust:
+            return None
+        raise
+    return model.optimization_runs[-1].f_opt, model.optimizer_array.copy()
+
+
+def _sklearn_restart(data, model_params, theta):
+    """ fit a scikit learn GP with the optimiser starting from the given
+    (log-transformed) kernel hyperparameters (in a `RestartPool` worker)
+
+    Returns:
+        `(log_marginal_likelihood, theta)` of the fitted model
+    """
+    X, y = get_shared_arrays(data)
+    model_params = dict(model_params, kernel=model_params['kernel'].clone_with_theta(theta), n_restarts_optimizer=0)
+    model = sk_gp.GaussianProcessRegressor(**model_params)
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        model.fit(X, y)
+    return model.log_marginal_likelihood_value_, model.kernel_.theta
+
+
 class GPySurrogate(Surrogate):
     """A surrogate model which uses GPy for Gaussian process regression
 
@@ -99,7 +175,7 @@ class GPySurrogate(Surrogate):
     default_optimise_params = {'parallel': True, 'verbose': False}
 
     def __init__(self, model_params=None, optimise_params=None,
-                 training_iterations=10, param_continuity=True, sparse=False):
+                 training_iterations=10, param_continuity=True, sparse=False, restart_pool=None):
         """
         Args:
             model_params (dict): arguments to pass to the model constructor
@@ -131,6 +207,12 @@ class GPySurrogate(Surrogate):
                 next model (otherwise chosen randomly).
             sparse (bool): whether to use SparseGPRegression instead of
                 GPRegression as the model (see GPy documentation)
+            restart_pool (RestartPool or bool): a pool to run the restarts in
+                (instead of `optimize_restarts()`, so the `'parallel'` optimise
+                parameter is ignored). True to create a pool which belongs to
+                this surrogate and is shut down with it. A pool which is passed
+                in may be shared and is left for the caller to shut down. None
+                to use `optimize_restarts()`.
         """
         assert GPy is not None, 'failed to import GPy.'
         self.model_params = model_params or self.default_model_params
@@ -140,6 +222,8 @@ class GPySurrogate(Surrogate):
             'cannot specify num_restarts and training_iterations at the same time'
         self.param_continuity = param_continuity
         self.sparse = sparse
+        self._owns_restart_pool = restart_pool is True
+        self.restart_pool = RestartPool() if restart_pool is True else restart_pool
         if self.sparse:
             assert 'kernel' in self.model_params, \
                 'sparse GP does not specify a kernel by default, so must be specified manually!'
@@ -159,36 +243,47 @@ class GPySurrogate(Surrogate):
 
     def construct_model(self, trial_num, X, y):
         iterations = self._get_training_iterations(trial_num)
+        initial_params = self._last_model_params if self.param_continuity else None
+        model, fitting_info = self._fit_model(X, y, self.model_params, iterations, initial_params)
+        if iterations > 0:
+            self._last_model_params = model.param_array[:]
+        return GPySurrogate.ModelInstance(model), fitting_info
+
+    def _fit_model(self, X, y, model_params, iterations, initial_params=None):
+        """ construct and train a GPy model
+
+        Args:
+            model_params (dict): arguments to pass to the model constructor
+            iterations (int): the number of optimiser iterations to perform
+            initial_params: the starting hyperparameters, or None to leave
+                them at their default values
+
+        Returns: (model, fitting_info) where model is a GPy model
+        """
         fitting_info = {'iterations': iterations}
 
         # the kernel parameters are altered by the model, so give a copy each
         # time. Also kernels cause pickling issues once they have been passed to
         # a model.
-        model_params = copy.deepcopy(self.model_params)
+        model_params = copy.deepcopy(model_params)
 
-        model_class = GPy.models.SparseGPRegression if self.sparse else GPy.models.GPRegression
-
-        # don't initialise the model until the initial hyperparameters have been set
-        # will always raise RuntimeWarning("Don't forget to initialize by self.initialize_parameter()!")
-        with warnings.catch_warnings():
-            warnings.filterwarnings('ignore', '.*initialize_parameter.*')
-            model = model_class(X, tb.utils.col_2d(y), initialize=False, **model_params)
-
-        # these steps for initialising a model from stored parameters are from https://github.com/SheffieldML/GPy
-        model.update_model(False)  # prevents the GP from fitting to the data until we are ready to enable it manually
-        model.initialize_parameter()  # initialises the hyperparameter objects
-        if self.param_continuity and self._last_model_params is not None:
-            model[:] = self._last_model_params
-        model.update_model(True)
+        model = _build_gpy_model(self.sparse, X, tb.utils.col_2d(y), model_params, initial_params)
 
         if iterations == 0:  # fixed
             fitting_info.update({'fixed': model[:]})
+        elif self.restart_pool is not None:
+            fitting_info.update(self._optimise_in_pool(model, X, y, model_params, iterations))
         else:
             # the current parameters are used as one of the starting locations (as of the time of writing)
             # https://github.com/sods/paramz/blob/master/paramz/model.py
             optimise_params = self.optimise_params.copy()
             # for this function restarts == iterations (whereas with scikit learn restarts = iterations-1)
             optimise_params['num_restarts'] = iterations
+            limit = get_worker_limit()
+            if optimise_params.get('parallel') and limit is not None:
+                # a process for each restart, up to the limit
+                optimise_params['num_processes'] = min(limit, iterations)
+                optimise_params['parallel'] = optimise_params['num_processes'] > 1
 
             with warnings.catch_warnings(record=True) as ws:
                 model.optimize_restarts(**optimise_params)
@@ -196,9 +291,36 @@ class GPySurrogate(Surrogate):
             if len(ws) > 0:
                 fitting_info.update({'warnings': [w.message for w in ws]})
 
-            self._last_model_params = model.param_array[:]
+        return model, fitting_info
 
-        return GPySurrogate.ModelInstance(model), fitting_info
+    def _optimise_in_pool(self, model, X, y, model_params, iterations):
+        """ optimise the hyperparameters of the model with each restart in a
+        worker of `restart_pool`, setting the model to the best result
+
+        The first restart starts from the current parameters of the model and
+        the others from random parameters (like `optimize_restarts()`).
+
+        Returns:
+            fitting info
+        """
+        optimise_params = {k: v for k, v in self.optimise_params.items()
+                           if k not in ('num_restarts', 'parallel', 'num_processes', 'robust', 'verbose')}
+        robust = self.optimise_params.get('robust', False)
+        seeds = [None] + np.random.randint(2**31, size=iterations - 1).tolist()
+        n = len(seeds)
+        with self.restart_pool.share(X, tb.utils.col_2d(y)) as data:
+            results = self.restart_pool.map(_gpy_restart, [data] * n, [self.sparse] * n, [model_params] * n,
+                                            [model[:].copy()] * n, seeds, [optimise_params] * n, [robust] * n)
+        objectives = [None if r is None else r[0] for r in results]
+        succeeded = [i for i, r in enumerate(results) if r is not None]
+        if succeeded:  # otherwise leave the parameters as they were (like `optimize_restarts()`)
+            best = min(succeeded, key=lambda i: objectives[i])
+            model.optimizer_array = results[best][1]
+        return {'restart_objectives': objectives}
+
+    def shutdown(self):
+        if self._owns_restart_pool:
+            self.restart_pool.shutdown()  # a pool which was passed in may be in use by others
 
     class ModelInstance(Surrogate.ModelInstance):
         def __init__(self, model):
@@ -222,6 +344,168 @@ class GPySurrogate(Surrogate):
             return self.model.log_likelihood()
 
 
+class AdditiveGPySurrogate(GPySurrogate):
+    r"""A GPy Gaussian process with an additive kernel over groups of dimensions
+
+    For objective functions which decompose into weakly interacting groups of
+    parameters, the kernel is a sum of kernels which each act on a single
+    group:
+
+    .. math::
+        k(\mathbf x, \mathbf x')=\sum_j k_j(\mathbf x^{(j)}, \mathbf x'^{(j)})
+
+    The posterior of each component can be queried separately (see
+    `ModelInstance.group_model()`) which allows suitable acquisition functions
+    to be maximised one group at a time with `AdditiveMaximiser`.
+
+    The partition of the dimensions can either be specified, or learned from
+    the data by fitting models to several random partitions and keeping the
+    one with the greatest data log likelihood.
+
+    See: Kandasamy et al., "High Dimensional Bayesian Optimisation and Bandits
+    via Additive Models", ICML 2015
+    """
+
+    def __init__(self, groups=None, num_groups=None, partition_samples=5,
+                 kernel_factory=None, num_threads=None, **kwargs):
+        """
+        Args:
+            groups (list): a list of lists of latent space dimension indices,
+                partitioning the dimensions into groups. None to learn the
+                partition from the data.
+            num_groups (int): when learning the partition, the number of groups
+                to split the dimensions into.
+            partition_samples (int): when learning the partition, the number of
+                random partitions to try each trial (in addition to the last
+                chosen partition).
+            kernel_factory: a function which takes `(input_dim, active_dims)`
+                and returns a GPy kernel for a single group. Defaults to an ARD
+                Matern 5/2 kernel.
+            num_threads (int): the number of threads to use when fitting the
+                models for the candidate partitions. None to use the default for
+                `concurrent.futures.ThreadPoolExecutor`.
+            kwargs: passed to `GPySurrogate`
+        """
+        super().__init__(**kwargs)
+        assert 'kernel' not in self.model_params, \
+            'the kernel of an additive surrogate is constructed from kernel_factory'
+        assert not self.sparse, 'sparse additive models are not supported'
+        assert (groups is None) != (num_groups is None), \
+            'must specify either groups or num_groups'
+        self.groups = groups
+        self.num_groups = num_groups
+        self.partition_samples = partition_samples
+        self.kernel_factory = kernel_factory or (lambda input_dim, active_dims:
+            GPy.kern.Matern52(input_dim, active_dims=active_dims, ARD=True))
+        self.num_threads = num_threads
+        self._last_groups = None
+
+    def _random_partition(self, num_dims):
+        perm = np.random.permutation(num_dims)
+        num_groups = min(self.num_groups, num_dims)
+        return [sorted(g.tolist()) for g in np.array_split(perm, num_groups)]
+
+    def _get_candidate_partitions(self, num_dims):
+        if self.groups is not None:
+            assert sorted(i for g in self.groups for i in g) == list(range(num_dims)), \
+                'groups must partition the {} dimensions'.format(num_dims)
+            return [self.groups]
+        candidates = [self._random_partition(num_dims) for _ in range(self.partition_samples)]
+        if self._last_groups is not None:
+            candidates.insert(0, self._last_groups)
+        return candidates
+
+    def construct_model(self, trial_num, X, y):
+        iterations = self._get_training_iterations(trial_num)
+
+        def fit(groups):
+            model_params = self.model_params.copy()
+            kernels = [self.kernel_factory(len(g), g) for g in groups]
+            model_params['kernel'] = GPy.kern.Add(kernels) if len(kernels) > 1 else kernels[0]
+            # the previous hyperparameters are only meaningful for the same partition
+            continuous = self.param_continuity and groups == self._last_groups
+            initial_params = self._last_model_params if continuous else None
+            return self._fit_model(X, y, model_params, iterations, initial_params)
+
+        candidates = self._get_candidate_partitions(X.shape[1])
+        if len(candidates) == 1:
+            fitted = [fit(candidates[0])]
+        else:
+            # the candidate models are independent and so can be fitted concurrently
+            limit = get_worker_limit()
+            num_threads = get_worker_limit(self.num_threads)
+            # the worker limit is shared between the threads
+            inner_limit = None if limit is None else max(1, limit // min(num_threads, len(candidates)))
+
+            def fit_limited(groups):
+                with worker_limit(inner_limit):
+                    return fit(groups)
+            with ThreadPoolExecutor(num_threads) as pool:
+                fitted = list(pool.map(fit_limited, candidates))
+
+        log_likelihoods = [m.log_likelihood() for m, _ in fitted]
+        best = int(np.argmax(log_likelihoods))
+        model, fitting_info = fitted[best]
+        groups = candidates[best]
+        fitting_info.update({'groups': groups})
+        if len(candidates) > 1:
+            fitting_info.update({'partition_log_likelihoods': log_likelihoods})
+
+        self._last_groups = groups
+        if iterations > 0:
+            self._last_model_params = model.param_array[:]
+        return AdditiveGPySurrogate.ModelInstance(model, groups), fitting_info
+
+    class ModelInstance(GPySurrogate.ModelInstance):
+        """
+        Attributes:
+            groups: the partition of the dimensions used by the additive kernel
+        """
+        def __init__(self, model, groups):
+            super().__init__(model)
+            self.groups = groups
+
+        def _component(self, group_index):
+            kern = self.model.kern
+            return kern.parts[group_index] if len(self.groups) > 1 else kern
+
+        def predict_group(self, X, group_index, return_std_dev=False):
+            """ predict the contribution of a single group to the objective function
+
+            Args:
+                X: a point or matrix of points (as rows) in the full latent space.
+                    Only the dimensions belonging to the group are used.
+                group_index: the index into `self.groups`
+            """
+            kern = self._component(group_index)
+            mean, var = self.model.predict(X, kern=kern, include_likelihood=False)
+            if return_std_dev:
+                return mean.flatten(), np.sqrt(np.clip(var, 0, None)).flatten()
+            else:
+                return mean.flatten()
+
+        def group_model(self, group_index):
+            """ a model instance for a single group which takes points with
+            only the dimensions belonging to that group
+            """
+            return AdditiveGPySurrogate.GroupModelInstance(self, group_index)
+
+    class GroupModelInstance(Surrogate.ModelInstance):
+        """ A view of a single component of an additive model """
+        def __init__(self, additive_model, group_index):
+            self.additive_model = additive_model
+            self.group_index = group_index
+            self.group = additive_model.groups[group_index]
+            self.num_dims = sum(len(g) for g in additive_model.groups)
+
+        def predict(self, X, return_std_dev=False):
+            X = np.atleast_2d(X)
+            # the other dimensions are ignored by the component kernel
+            full_X = np.zeros((X.shape[0], self.num_dims))
+            full_X[:, self.group] = X
+            return self.additive_model.predict_group(full_X, self.group_index, return_std_dev)
+
+
 class SciKitGPSurrogate(Surrogate):
     """A surrogate model which uses a `GaussianProcessRegressor` from scikit learn
 
@@ -242,7 +526,7 @@ class SciKitGPSurrogate(Surrogate):
             'normalize_y' : True
         }
 
-    def __init__(self, model_params=None, training_iterations=None, param_continuity=True):
+    def __init__(self, model_params=None, training_iterations=None, param_continuity=True, restart_pool=None):
         """
         Args:
             model_params (dict): parameters to pass to the `GaussianProcessRegressor` constructor
@@ -270,6 +554,12 @@ class SciKitGPSurrogate(Surrogate):
             param_continuity (bool): whether to use the trained hyper parameters
                 from the previous model as a starting point when training the
                 next model (otherwise chosen randomly).
+            restart_pool (RestartPool or bool): a pool to run the restarts in
+                (each restart being a single iteration). True to create a pool
+                which belongs to this surrogate and is shut down with it. A pool
+                which is passed in may be shared and is left for the caller to
+                shut down. None to run the restarts in this process with
+                `n_restarts_optimizer`.
         """
         assert sk_gp is not None, 'failed to import sklearn.'
         self.model_params = model_params or self.default_model_params
@@ -277,6 +567,8 @@ class SciKitGPSurrogate(Surrogate):
         assert training_iterations is None or self.model_params.get('n_restarts_optimizer') is None, \
             'cannot specify n_restarts_optimizer and training_iterations at the same time'
         self.param_continuity = param_continuity
+        self._owns_restart_pool = restart_pool is True
+        self.restart_pool = RestartPool() if restart_pool is True else restart_pool
 
         self._last_model_params = None
 
@@ -308,6 +600,20 @@ class SciKitGPSurrogate(Surrogate):
             model_params['optimizer'] = None
             model_params['n_restarts_optimizer'] = 0
             fitting_info.update({'fixed': model.kernel.theta})
+        elif self.restart_pool is not None:
+            # the first restart starts from the current hyperparameters, the others from random ones (like scikit)
+            kernel = model_params['kernel']
+            bounds = kernel.bounds
+            thetas = [kernel.theta] + [np.random.uniform(bounds[:, 0], bounds[:, 1]) for _ in range(iterations - 1)]
+            n = len(thetas)
+            with self.restart_pool.share(X, y) as data:
+                results = self.restart_pool.map(_sklearn_restart, [data] * n, [model_params] * n, thetas)
+            log_likelihoods = [r[0] for r in results]
+            fitting_info.update({'restart_log_likelihoods': log_likelihoods})
+            # fit the model with the best hyperparameters fixed
+            model_params['kernel'] = kernel.clone_with_theta(results[int(np.argmax(log_likelihoods))][1])
+            model_params['optimizer'] = None
+            model_params['n_restarts_optimizer'] = 0
         else:
             # for scikit: 0 restarts => 1 iteration
             model_params['n_restarts_optimizer'] = iterations - 1
@@ -325,6 +631,10 @@ class SciKitGPSurrogate(Surrogate):
 
         return SciKitGPSurrogate.ModelInstance(model), fitting_info
 
+    def shutdown(self):
+        if self._owns_restart_pool:
+            self.restart_pool.shutdown()  # a pool which was passed in may be in use by others
+
     class ModelInstance(Surrogate.ModelInstance):
         def __init__(self, model):
             self.model = model
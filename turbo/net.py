@@ -0,0 +1,244 @@
+#!/usr/bin/env python3
+""" Networking utilities for distributing trials to remote workers
+
+A message is a JSON serialisable object which may also contain numpy arrays.
+The arrays are sent as raw buffers after a small JSON header rather than being
+encoded as text. A message is framed as
+
+    [4:header length | 4:header length | 4:header CRC32 | *:header | *:array buffers]
+
+where the header lists the dtype, shape and CRC32 of each buffer. Arrays are
+received directly into newly allocated arrays with `recv_into` so the payload
+is never copied through intermediate bytes objects.
+
+Connections are persistent: a `Client` sends any number of requests over one
+connection (reconnecting if it breaks) and a server handles requests from a
+connection with `serve_connection()` until the client disconnects.
+"""
+
+import time
+import json
+import zlib
+import struct
+import socket
+import numpy as np
+
+
+# to prevent deadlock if the server stops responding part way through a message
+LAST_RESORT_TIMEOUT = 25.0  # seconds
+# a larger header is assumed to be corrupt (arrays do not count towards the header)
+MAX_HEADER_SIZE = 16 * 1024 * 1024  # bytes
+
+_PREFIX = struct.Struct('!III')
+
+
+def _extract_arrays(obj, arrays):
+    """ replace the numpy arrays in obj with placeholders, appending them to `arrays` """
+    if isinstance(obj, np.ndarray):
+        assert not obj.dtype.hasobject, 'arrays of python objects cannot be sent'
+        # not `np.ascontiguousarray()` since that turns 0-d arrays into 1-d
+        arrays.append(obj if obj.flags.c_contiguous else obj.copy(order='C'))
+        return {'__array__': len(arrays) - 1}
+    elif isinstance(obj, np.generic):
+        return obj.item()
+    elif isinstance(obj, dict):
+        return {k: _extract_arrays(v, arrays) for k, v in obj.items()}
+    elif isinstance(obj, (list, tuple)):
+        return [_extract_arrays(v, arrays) for v in obj]
+    return obj
+
+
+def _insert_arrays(obj, arrays):
+    """ the inverse of `_extract_arrays()` """
+    if isinstance(obj, dict):
+        if len(obj) == 1 and '__array__' in obj:
+            return arrays[obj['__array__']]
+        return {k: _insert_arrays(v, arrays) for k, v in obj.items()}
+    elif isinstance(obj, list):
+        return [_insert_arrays(v, arrays) for v in obj]
+    return obj
+
+
+def _as_bytes(arr):
+    """ a flat uint8 view of a contiguous array (sharing its memory) """
+    return arr.reshape(-1).view(np.uint8)
+
+
+def send_msg(conn, msg):
+    """ send a message down the given connection """
+    arrays = []
+    body = _extract_arrays(msg, arrays)
+    buffers = [_as_bytes(a) for a in arrays]
+    header = json.dumps({
+        'body': body,
+        'arrays': [[a.dtype.str, a.shape, zlib.crc32(b)] for a, b in zip(arrays, buffers)]
+    }).encode('utf-8')
+    # the length is duplicated so that a corrupted length is detected rather
+    # than causing the receiver to wait for the wrong number of bytes
+    conn.sendall(_PREFIX.pack(len(header), len(header), zlib.crc32(header)) + header)
+    for b in buffers:
+        if len(b) > 0:
+            conn.sendall(b)
+
+
+def recv_msg(conn):
+    """ receive a message from the given connection
+
+    Raises:
+        ValueError: if the message is corrupted
+        ConnectionError: if the connection closes before the message is complete
+    """
+    prefix = bytearray(_PREFIX.size)
+    recv_exactly_into(conn, prefix)
+    length, length_check, header_crc = _PREFIX.unpack(prefix)
+    if length != length_check or length > MAX_HEADER_SIZE:
+        raise ValueError('message length corrupted: {}/{}'.format(length, length_check))
+    header = bytearray(length)
+    recv_exactly_into(conn, header)
+    if zlib.crc32(header) != header_crc:
+        raise ValueError('header checksum failed')
+    header = json.loads(header.decode('utf-8'))
+
+    arrays = []
+    for dtype, shape, crc in header['arrays']:
+        arr = np.empty(shape, dtype=np.dtype(dtype))
+        buf = _as_bytes(arr)
+        recv_exactly_into(conn, buf)
+        if zlib.crc32(buf) != crc:
+            raise ValueError('array checksum failed')
+        arrays.append(arr)
+    return _insert_arrays(header['body'], arrays)
+
+
+def recv_exactly_into(conn, buf):
+    """ fill the given writable buffer with bytes read from the connection
+
+    Raises:
+        ConnectionError: if the connection closes before the buffer is full
+    """
+    view = memoryview(buf).cast('B')
+    pos = 0
+    while pos < len(view):
+        n = conn.recv_into(view[pos:])
+        if n == 0:
+            raise ConnectionError('connection closed in recv_exactly_into')
+        pos += n
+
+
+def _set_no_delay(conn):
+    """ send small messages immediately (without waiting to coalesce them) """
+    if conn.family in (socket.AF_INET, socket.AF_INET6):
+        conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+
+def connect(addr, timeout=LAST_RESORT_TIMEOUT):
+    """ connect to a message server
+
+    Args:
+        addr: `(host, port)` for TCP, or the path of a Unix socket
+        timeout: the timeout for connecting and for each subsequent socket operation
+    """
+    if isinstance(addr, str):
+        conn = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            conn.settimeout(timeout)
+            conn.connect(addr)
+        except OSError:
+            conn.close()
+            raise
+    else:
+        conn = socket.create_connection(addr, timeout=timeout)
+    _set_no_delay(conn)
+    return conn
+
+
+def serve_connection(conn, handle_request, idle_timeout=None, timeout=LAST_RESORT_TIMEOUT):
+    """ respond to the requests sent over a connection until it closes
+
+    Args:
+        conn: the connected socket
+        handle_request: a function which takes a request and returns the response
+        idle_timeout: the maximum time to wait between requests (None for no
+            limit, since clients keep their connections open while idle)
+        timeout: the maximum time to wait for each socket operation while
+            receiving a request or sending a response, so that a client which
+            stops part way through a message does not hold the connection forever
+    """
+    _set_no_delay(conn)
+    try:
+        while True:
+            conn.settimeout(idle_timeout)
+            if not conn.recv(1, socket.MSG_PEEK):
+                break  # the client disconnected
+            conn.settimeout(timeout)
+            request = recv_msg(conn)
+            conn.settimeout(None)  # the handler may take a while
+            response = handle_request(request)
+            conn.settimeout(timeout)
+            send_msg(conn, response)
+    except (OSError, ValueError):
+        pass  # the connection closed, broke or timed out: the client reconnects if it needs to
+
+
+class Client:
+    """ a persistent connection to a message server which reconnects if the
+    connection breaks
+
+    Note:
+        a request which is retried may be received more than once (if the
+        connection broke after the request was sent)
+
+    Note:
+        not thread safe, use a separate client for each thread
+    """
+    def __init__(self, addr, retry_time=0, retry_interval=0.5, timeout=LAST_RESORT_TIMEOUT):
+        """
+        Args:
+            addr: `(host, port)` of the server, or the path of a Unix socket
+            retry_time: how long to keep retrying in seconds if the server cannot
+                be reached or the interaction fails (0 for a single attempt)
+            retry_interval: the time to wait between attempts
+            timeout: the maximum time to wait for each socket operation, which
+                includes waiting for the server to respond (None for no limit)
+        """
+        self.addr = addr
+        self.timeout = timeout
+        self.retry_time = retry_time
+        self.retry_interval = retry_interval
+        self._conn = None
+
+    def request(self, msg, retry_time=None):
+        """ send a request to the server and return its response
+
+        Args:
+            retry_time: overrides `self.retry_time` if not None
+
+        Returns:
+            the response, or None if every attempt failed
+        """
+        retry_time = self.retry_time if retry_time is None else retry_time
+        give_up = time.time() + retry_time
+        while True:
+            try:
+                if self._conn is None:
+                    self._conn = connect(self.addr, self.timeout)
+                send_msg(self._conn, msg)
+                return recv_msg(self._conn)
+            except (OSError, ValueError):
+                # OSError: cannot connect or transmission error (including timeouts)
+                # ValueError: corrupted message
+                self.close()
+                if time.time() + self.retry_interval > give_up:
+                    return None
+                time.sleep(self.retry_interval)
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
@@ -3,14 +3,21 @@
 
 import numpy as np
 import json
+import asyncio
+import inspect
+import contextlib
 
 # local imports
 from .bounds import Bounds
 from .optimiser_presets import load_optimiser_preset
+from .utils import SpatialIndex, row_2d
+from .modules.eval_cache import mark_cache_hit
+from .modules.async_eval import TrialFailure
 
 
 class Optimiser:
-    def __init__(self, objective, desired_extremum, bounds, pre_phase_trials, settings_preset='default'):
+    def __init__(self, objective, desired_extremum, bounds, pre_phase_trials, settings_preset='default',
+                 batch_objective=None, max_batch_size=1000):
         """
         Args:
             objective: a function to be optimised, which accepts parameters
@@ -23,10 +30,30 @@ class Optimiser:
             desired_extremum: either 'min' or 'max' specifying whether the
                 objective function is to be maximised or minimised
             bounds: a list of tuples of (name, min, max) for each parameter of
-                the objective function
+                the objective function. Integer and categorical parameters
+                are also supported, see `Bounds`.
+            pre_phase_trials: the number of trials selected by
+                `pre_phase_select` before using Bayesian optimisation. If a
+                `pre_phase_exit` criterion is set then this is a maximum.
             settings_preset: the name of the preset optimiser settings to load with
                 `load_optimiser_preset()`. Pass None to leave the optimiser
                 uninitialised for full customisation.
+            batch_objective: None to call the objective function once per
+                trial with a keyword argument for each parameter. Otherwise the
+                objective function is vectorised and evaluates several trials
+                per call, either:
+
+                - `'arrays'`: with a keyword argument for each parameter which
+                  is an array with an element for each trial
+                - `'matrix'`: with a single `(n, d)` array of input points as
+                  rows (integer parameters are rounded and categorical
+                  parameters are given as the index of the category)
+
+                A vectorised objective function returns an array of `n` costs,
+                or a tuple of (costs, eval_infos) where eval_infos is a list of
+                `n` elements. Each result is recorded as an individual trial.
+            max_batch_size: the maximum number of trials to evaluate in a
+                single call to a vectorised objective function
         """
         self.objective = objective
         #TODO: internally, should use is_maximising or is_minimising where possible
@@ -35,13 +62,20 @@ class Optimiser:
         self.bounds = Bounds(bounds)
         assert pre_phase_trials > 0, 'a pre-phase is required'
         self.pre_phase_trials = pre_phase_trials
+        assert batch_objective in (None, 'arrays', 'matrix'), 'unknown batch_objective: {}'.format(batch_objective)
+        self.batch_objective = batch_objective
+        assert max_batch_size > 0
+        self.max_batch_size = max_batch_size
 
         # modules
         self.latent_space = None
         self.pre_phase_select = None
         self.fallback = None
+        self.pre_phase_exit = None  # criterion for finishing the pre-phase early (None to disable)
         self.aux_optimiser = None  # auxiliary optimiser to maximise the acquisition function
-        #self.async_eval = None#TODO
+        self.async_eval = None  # evaluate trials concurrently (None to evaluate sequentially)
+        self.eval_cache = None  # memoise objective function results (None to disable)
+        self.concurrency = None  # budget of cores for the phases of selecting trials (None for no limits)
         #self.parallel_strategy = None#TODO make sub-module of async-eval
         self.surrogate = None  # factory for creating surrogate models
         self.acquisition = None  # factory for creating acquisition functions
@@ -65,11 +99,25 @@ class Optimiser:
                 run) before stopping
             trial_xs: input points (in latent space) for the finished trials
             trial_ys: cost values for the finished trials
+            trial_nums: the trial numbers of the finished trials (in the order
+                that they finished, which may differ from the order they started
+                when evaluating asynchronously)
+            finished_index: a `SpatialIndex` of `trial_xs`, updated as trials
+                finish, for proximity queries (eg de-duplication)
+            pending_trials: a dictionary of trial number to input point (in
+                latent space) for the trials which have started evaluating but
+                not yet finished
+            failed_trials: the number of trials which failed to produce a
+                result (see `async_eval.TrialFailure`). These are not included
+                in `trial_xs` or `trial_ys`.
+            pre_phase_exited_at: the trial number of the first trial after the
+                pre-phase if it was finished early by `pre_phase_exit`, else None
         """
         def __init__(self):
             self.running = False
             self.started_trials = 0
             self.finished_trials = 0
+            self.failed_trials = 0
 
             # stopping conditions
             self.max_trials = 0
@@ -79,6 +127,10 @@ class Optimiser:
             #TODO (naming): these should be finished_xs and finished_ys
             self.trial_xs = []  # list of row vectors
             self.trial_ys = []  # list of scalars
+            self.trial_nums = []
+            self.finished_index = SpatialIndex()
+            self.pending_trials = {}
+            self.pre_phase_exited_at = None
 
         def check_consistency(self):
             """ check that the optimiser runtime data makes sense
@@ -86,13 +138,23 @@ class Optimiser:
             Raises:
                 AssertionError
             """
-            assert self.started_trials >= self.finished_trials
+            assert self.started_trials >= self.finished_trials + self.failed_trials
+            assert self.started_trials - self.finished_trials - self.failed_trials >= len(self.pending_trials)
             assert len(self.trial_xs) == len(self.trial_ys)
             assert len(self.trial_ys) == self.finished_trials
+            assert len(self.trial_nums) == self.finished_trials
+            assert len(self.finished_index) == self.finished_trials
 
-        def add_finished_trial(self, x, y):
+        def add_finished_trial(self, x, y, trial_num=None):
+            """
+            Args:
+                trial_num: the number of the finished trial. If None then the
+                    trials are assumed to finish in the order they started.
+            """
             self.trial_xs.append(x)
             self.trial_ys.append(y)
+            self.trial_nums.append(self.finished_trials if trial_num is None else trial_num)
+            self.finished_index.add(x)
             self.finished_trials += 1
 
     def __setattr__(self, name, value):
@@ -147,7 +209,7 @@ class Optimiser:
         assert self.initialised
         data = {
             'desired_extremum': self.desired_extremum,
-            'bounds': self.bounds.ordered,
+            'bounds': self.bounds.specification,
             'pre_phase_trials': self.pre_phase_trials,
             'latent_space': self.latent_space.save(include_runtime),
             'pre_phase_select': self.pre_phase_select.save(include_runtime),
@@ -161,9 +223,12 @@ class Optimiser:
                 'running': self.rt.running,
                 'started_trials': self.rt.started_trials,
                 'finished_trials': self.rt.finished_trials,
+                'failed_trials': self.rt.failed_trials,
                 'max_trials': self.rt.max_trials,
                 'trial_xs': self.rt.trial_xs[:],  # TODO: may need to make a copy of each elements
-                'trial_ys': self.rt.trial_ys[:]
+                'trial_ys': self.rt.trial_ys[:],
+                'trial_nums': self.rt.trial_nums[:],
+                'pre_phase_exited_at': self.rt.pre_phase_exited_at
             }
         return data
 
@@ -173,30 +238,48 @@ class Optimiser:
     def load_trials(self, trials):
         """
         Args:
-            trials (Recorder.Trial): a list of trials to load
+            trials (Recorder.Trial): a list of trials to load. Failed trials
+                (those with `'failed'` in their eval_info, see
+                `async_eval.TrialFailure`) are counted in `rt.failed_trials`.
         """
-        assert all(trial.x.shape == (1, len(self.bounds)) for trial in trials)
         assert not self.rt.running
 
         self.latent_space._set_input_bounds(self.bounds)
+        # trial points are stored in the latent space
+        num_latent = len(self.latent_space.get_latent_bounds())
+        assert all(trial.x.shape == (1, num_latent) for trial in trials)
         self._check_settings()
         rt = self.rt # runtime data
         rt.running = True
-        rt.max_trials = rt.finished_trials + len(trials)
+        rt.max_trials = rt.started_trials + len(trials)
 
         self._notify('run_started', rt.finished_trials, rt.max_trials)
-        trial_num = self.rt.finished_trials
+        trial_num = self.rt.started_trials
         for trial in trials:
             rt.started_trials += 1
             self._notify('selection_started', trial_num)
             self._notify('selection_finished', trial_num, trial.x, trial.selection_info)
             self._notify('evaluation_started', trial_num)
-            rt.add_finished_trial(trial.x, trial.y)
-            self._notify('evaluation_finished', trial_num, trial.y, trial.eval_info)
+            if isinstance(trial.eval_info, dict) and trial.eval_info.get('failed'):
+                rt.failed_trials += 1
+                self._notify('evaluation_failed', trial_num, trial.eval_info)
+            else:
+                rt.add_finished_trial(trial.x, trial.y, trial_num)
+                self._notify('evaluation_finished', trial_num, trial.y, trial.eval_info)
             trial_num += 1
         rt.running = False
         self._notify('run_finished')
 
+    def shutdown(self):
+        """ release the resources held by the modules of the optimiser (such as
+        the worker pools of `async_eval` and a `RestartPool` which the surrogate
+        created for itself) once it is no longer needed
+        """
+        assert not self.rt.running, 'cannot shut down while running'
+        for module in (self.surrogate, self.aux_optimiser, self.async_eval):
+            if hasattr(module, 'shutdown'):
+                module.shutdown()
+
     def get_incumbent(self, as_dict=False):
         """ get the current best trial
 
@@ -215,14 +298,13 @@ class Optimiser:
         x = rt.trial_xs[i]
         if as_dict:
             x = self._point_to_dict(self.latent_space.from_latent(x))
-        return i, x, rt.trial_ys[i]
+        return rt.trial_nums[i], x, rt.trial_ys[i]
 
     def run(self, max_trials):
-        self.run_sequential(max_trials)
-        #if self.async_eval is None:
-        #    self.run_sequential(max_trials)
-        #else:
-        #    raise NotImplementedError()
+        if self.async_eval is None:
+            self.run_sequential(max_trials)
+        else:
+            self.run_async(max_trials)
 
     def run_sequential(self, max_trials):
         """ Run the Bayesian optimisation for the given number of trials
@@ -236,29 +318,214 @@ class Optimiser:
         self._notify('run_started', rt.finished_trials, max_trials)
 
         while rt.finished_trials < max_trials:
-            trial_num = rt.started_trials
+            trials = self._select_batch(max_trials)
+            for trial_num, x in trials:
+                self._notify('evaluation_started', trial_num)
 
-            x = self._select_trial(trial_num)
-            params_dict = self._point_to_dict(self.latent_space.from_latent(x))
-            self._notify('evaluation_started', trial_num)
+            ys, eval_infos = self._evaluate([x for trial_num, x in trials])
 
-            rt.started_trials += 1
-            res = self.objective(**params_dict)
-            # the objective function may either return a float, or a tuple of (cost, eval_info)
-            y, eval_info = res if isinstance(res, tuple) else (res, None)
-            if isinstance(y, int):
-                y = float(y)
-            assert isinstance(y, float), 'objective function should return a float for the cost, instead: {}'.format(type(y))
+            for (trial_num, x), y, eval_info in zip(trials, ys, eval_infos):
+                del rt.pending_trials[trial_num]
+                rt.add_finished_trial(x, y, trial_num)
+                self._notify('evaluation_finished', trial_num, y, eval_info)
+            rt.check_consistency()
+
+        rt.running = False
+        self._notify('run_finished')
 
-            #TODO: assert that y is the correct type and not None, NaN or infinity
+    def run_async(self, max_trials):
+        """ Run the Bayesian optimisation for the given number of trials,
+        evaluating several trials concurrently using `async_eval`
 
-            rt.add_finished_trial(x, y)
-            self._notify('evaluation_finished', trial_num, y, eval_info)
+        The remaining pre-phase trials are selected up front and dispatched as
+        capacity becomes available. Bayesian optimisation trials are started
+        once `async_eval.pre_phase_quorum` of the pre-phase has finished.
+
+        Trials which fail (see `async_eval.TrialFailure`) count towards
+        `max_trials` and are reported to the listeners with `evaluation_failed`.
+        """
+        self.latent_space._set_input_bounds(self.bounds)
+        self._check_settings()
+        rt = self.rt  # runtime data
+        ae = self.async_eval
+        assert ae is not None
+        assert self.batch_objective is None, 'batch objectives are not supported with asynchronous evaluation'
+        assert not rt.running
+        rt.running = True
+        rt.max_trials = max_trials
+        self._notify('run_started', rt.finished_trials, max_trials)
+
+        pre_phase_xs = self._select_pre_phase_points(max_trials)
+        dispatched = {}  # trial_num to the parameters passed to the objective function
+
+        while rt.finished_trials + rt.failed_trials < max_trials:
+            while rt.started_trials < max_trials and ae.get_free_capacity() > 0:
+                trial_num = rt.started_trials
+                trial_type, x = self._next_concurrent_point(trial_num, pre_phase_xs, ae.pre_phase_quorum, max_trials)
+                if trial_type is None:
+                    break  # wait for more of the pre-phase to finish (or fail)
+                elif trial_type == 'bayes':
+                    x = self._select_trial(trial_num)
+                params_dict = self._start_concurrent_trial(trial_num, x)
+                if params_dict is not None:
+                    dispatched[trial_num] = params_dict
+                    ae.start_trial(trial_num, self.objective, params_dict)
+
+            for trial_num, res in ae.get_finished_trials(wait=True):
+                self._finish_concurrent_trial(trial_num, dispatched.pop(trial_num), res)
             rt.check_consistency()
 
         rt.running = False
         self._notify('run_finished')
 
+    async def run_asyncio(self, max_trials, concurrency, pre_phase_quorum=1.0):
+        """ Run the Bayesian optimisation for the given number of trials with
+        an `async def` objective function, keeping up to `concurrency`
+        evaluations in flight on the running event loop
+
+        Trial selection (which may take a while to fit the surrogate) runs in
+        the event loop's default executor so that the loop is never blocked.
+        Finished evaluations are only recorded between selections, so the
+        listeners are notified in the same order as with `run_sequential()`.
+
+        Usage: `asyncio.run(optimiser.run_asyncio(max_trials=50, concurrency=8))`
+
+        Args:
+            max_trials: the number of trials to run to
+            concurrency: the maximum number of objective function coroutines
+                to have in flight at once
+            pre_phase_quorum: the fraction of the pre-phase which must finish
+                before the first Bayesian optimisation trial is selected
+        """
+        assert concurrency >= 1 and 0 <= pre_phase_quorum <= 1
+        self.latent_space._set_input_bounds(self.bounds)
+        self._check_settings()
+        rt = self.rt  # runtime data
+        assert self.batch_objective is None, 'batch objectives are not supported with asynchronous evaluation'
+        assert not rt.running
+        rt.running = True
+        rt.max_trials = max_trials
+        self._notify('run_started', rt.finished_trials, max_trials)
+
+        loop = asyncio.get_running_loop()
+        pre_phase_xs = self._select_pre_phase_points(max_trials)
+        in_flight = {}  # task to (trial_num, parameters passed to the objective function)
+        try:
+            while rt.finished_trials + rt.failed_trials < max_trials:
+                while rt.started_trials < max_trials and len(in_flight) < concurrency:
+                    trial_num = rt.started_trials
+                    trial_type, x = self._next_concurrent_point(trial_num, pre_phase_xs, pre_phase_quorum, max_trials)
+                    if trial_type is None:
+                        break  # wait for more of the pre-phase to finish
+                    elif trial_type == 'bayes':
+                        x = await loop.run_in_executor(None, self._select_trial, trial_num)
+                    params_dict = self._start_concurrent_trial(trial_num, x)
+                    if params_dict is not None:
+                        coroutine = self.objective(**params_dict)
+                        assert inspect.isawaitable(coroutine), 'the objective function must be a coroutine function'
+                        in_flight[asyncio.ensure_future(coroutine)] = (trial_num, params_dict)
+
+                if in_flight:
+                    done, _ = await asyncio.wait(in_flight, return_when=asyncio.FIRST_COMPLETED)
+                    for task in sorted(done, key=lambda t: in_flight[t][0]):
+                        trial_num, params_dict = in_flight.pop(task)
+                        self._finish_concurrent_trial(trial_num, params_dict, task.result())
+                rt.check_consistency()
+        finally:
+            for task in in_flight:
+                task.cancel()
+
+        rt.running = False
+        self._notify('run_finished')
+
+    def _select_pre_phase_points(self, max_trials):
+        """ select the remaining pre-phase trials up front (they are
+        independent of one another)
+
+        Returns:
+            a list of latent points
+        """
+        num_pre_phase = min(self.pre_phase_trials, max_trials) - self.rt.started_trials
+        if num_pre_phase <= 0:
+            return []
+        lb = self.latent_space.get_latent_bounds()
+        X = self.latent_space.snap(self.pre_phase_select(num_points=num_pre_phase, latent_bounds=lb))
+        return [row_2d(x) for x in X]
+
+    def _next_concurrent_point(self, trial_num, pre_phase_xs, pre_phase_quorum, max_trials):
+        """ get the next trial to start when evaluating concurrently
+
+        Args:
+            pre_phase_xs: the pre-phase points which have not been started
+                (consumed by this method)
+            pre_phase_quorum: the fraction of the pre-phase which must finish
+                before Bayesian optimisation starts (in `[0, 1]`, at least one
+                result is always required)
+
+        Returns:
+            `(trial_type, x)`. `('pre_phase', x)` for the next pre-phase point,
+            `('bayes', None)` if the trial should be selected with
+            `_select_trial()` or `(None, None)` if no trial can be started until
+            more of the pre-phase finishes
+
+        Raises:
+            RuntimeError: if every trial so far failed and none are in progress,
+                so Bayesian optimisation has no results to start from
+        """
+        if pre_phase_xs and not self._in_pre_phase(trial_num):
+            del pre_phase_xs[:]  # the pre-phase was finished early
+        if pre_phase_xs:
+            self._notify('selection_started', trial_num)
+            x = pre_phase_xs.pop(0)
+            self._notify('selection_finished', trial_num, x, {'type': 'pre_phase'})
+            return 'pre_phase', x
+        quorum = max(1, int(np.ceil(pre_phase_quorum * min(self._num_pre_phase_trials(), max_trials))))
+        rt = self.rt
+        if rt.finished_trials + rt.failed_trials < quorum:
+            return None, None
+        if rt.finished_trials == 0:
+            if rt.started_trials > rt.failed_trials:
+                return None, None  # wait for a trial in progress to succeed
+            raise RuntimeError('all {} trials failed, so there are no results to start Bayesian optimisation '
+                               'from. Check the objective function (the failures were reported to the '
+                               'listeners with evaluation_failed)'.format(rt.failed_trials))
+        return 'bayes', None
+
+    def _start_concurrent_trial(self, trial_num, x):
+        """ start evaluating a selected trial, finishing it immediately if the
+        result is cached
+
+        Returns:
+            the parameters to pass to the objective function, or None if the
+            trial was a cache hit and has already finished
+        """
+        rt = self.rt
+        params_dict = self._point_to_dict(self.latent_space.from_latent(x))
+        self._notify('evaluation_started', trial_num)
+        rt.started_trials += 1
+        cached = None if self.eval_cache is None else self.eval_cache.get(params_dict)
+        if cached is not None:
+            rt.add_finished_trial(x, cached[0], trial_num)
+            self._notify('evaluation_finished', trial_num, *cached)
+            return None
+        rt.pending_trials[trial_num] = x
+        return params_dict
+
+    def _finish_concurrent_trial(self, trial_num, params_dict, res):
+        """ record the result (or `TrialFailure`) of a trial started with `_start_concurrent_trial()` """
+        rt = self.rt
+        if isinstance(res, TrialFailure):
+            del rt.pending_trials[trial_num]
+            rt.failed_trials += 1
+            self._notify('evaluation_failed', trial_num, res.eval_info)
+            return
+        y, eval_info = self._parse_result(res)
+        if self.eval_cache is not None:
+            self.eval_cache.put(params_dict, y, eval_info)
+        x = rt.pending_trials.pop(trial_num)
+        rt.add_finished_trial(x, y, trial_num)
+        self._notify('evaluation_finished', trial_num, y, eval_info)
+
     def _check_settings(self):
         """ check that the current optimiser settings make sense
 
@@ -278,7 +545,95 @@ class Optimiser:
         assert point.shape == (num_params,) or point.shape == (1, num_params), \
             'invalid point shape: {}'.format(point.shape)
         point = point.flatten()
-        return {self.bounds.ordered[i][0] : point[i] for i in range(num_params)}
+        names = self.bounds.names
+        return {names[i] : self.bounds.decode(names[i], point[i]) for i in range(num_params)}
+
+    def _points_to_arrays(self, points):
+        """ convert the given matrix of points (as rows, in the input space) to
+        a dictionary of parameter names to arrays of values
+        """
+        arrays = {}
+        for i, name in enumerate(self.bounds.names):
+            param_type = self.bounds.get_type(name)
+            column = points[:, i]
+            if param_type == 'integer':
+                column = np.round(column).astype(int)
+            elif param_type == 'categorical':
+                # the extra element prevents numpy from treating sequence categories as another dimension
+                categories = np.array(self.bounds.get_categories(name) + [None], dtype=object)[:-1]
+                column = categories[np.round(column).astype(int)]
+            arrays[name] = column
+        return arrays
+
+    def _parse_result(self, res):
+        """ split the return value of a (non-batch) objective function into (y, eval_info) """
+        # the objective function may either return a float, or a tuple of (cost, eval_info)
+        y, eval_info = res if isinstance(res, tuple) else (res, None)
+        if isinstance(y, int):
+            y = float(y)
+        assert isinstance(y, float), 'objective function should return a float for the cost, instead: {}'.format(type(y))
+        #TODO: assert that y is the correct type and not None, NaN or infinity
+        return y, eval_info
+
+    def _evaluate(self, xs):
+        """ evaluate the objective function at the given trial points (in the latent space)
+
+        Returns:
+            (ys, eval_infos): lists with an element for each point
+        """
+        cache = self.eval_cache
+        if self.batch_objective is None:
+            assert len(xs) == 1
+            params_dict = self._point_to_dict(self.latent_space.from_latent(xs[0]))
+            cached = None if cache is None else cache.get(params_dict)
+            if cached is not None:
+                return [cached[0]], [cached[1]]
+            y, eval_info = self._parse_result(self.objective(**params_dict))
+            if cache is not None:
+                cache.put(params_dict, y, eval_info)
+            return [y], [eval_info]
+
+        points = self.bounds.snap(self.latent_space.from_latent(np.vstack(xs)))
+        ys, eval_infos = [None] * len(xs), [None] * len(xs)
+        misses = list(range(len(xs)))
+        duplicates = {}  # index to the index of an identical miss earlier in the batch
+        if cache is not None:
+            params_dicts = [self._point_to_dict(p) for p in points]
+            misses = []
+            miss_keys = {}
+            for i, params_dict in enumerate(params_dicts):
+                key = cache.get_key(params_dict)
+                if key in miss_keys:
+                    duplicates[i] = miss_keys[key]
+                    continue
+                cached = cache.get(params_dict)
+                if cached is None:
+                    misses.append(i)
+                    miss_keys[key] = i
+                else:
+                    ys[i], eval_infos[i] = cached
+        if misses:
+            miss_ys, miss_infos = self._evaluate_batch_objective(points[misses])
+            for i, y, eval_info in zip(misses, miss_ys, miss_infos):
+                ys[i], eval_infos[i] = y, eval_info
+                if cache is not None:
+                    cache.put(params_dicts[i], y, eval_info)
+        for i, j in duplicates.items():
+            ys[i], eval_infos[i] = ys[j], mark_cache_hit(eval_infos[j])
+        return ys, eval_infos
+
+    def _evaluate_batch_objective(self, points):
+        """ call the vectorised objective function with the given points (in the input space) """
+        if self.batch_objective == 'matrix':
+            res = self.objective(points)
+        else:
+            res = self.objective(**self._points_to_arrays(points))
+        ys, eval_infos = res if isinstance(res, tuple) else (res, [None] * len(points))
+        ys = np.asarray(ys, dtype=float)
+        assert ys.shape == (len(points),), \
+            'objective function should return {} costs, instead: shape {}'.format(len(points), ys.shape)
+        assert len(eval_infos) == len(points), 'objective function should return an eval_info for each point'
+        return [float(y) for y in ys], list(eval_infos)
 
     def _notify(self, event, *args):
         """ Notify each listener of the given event
@@ -306,8 +661,25 @@ class Optimiser:
             raise NotImplementedError('unsupported acquisition function type: {}'.format(acq_type))
         return self.acquisition.construct_function(*acq_args)
 
+    def _num_pre_phase_trials(self):
+        """ the number of pre-phase trials, taking into account finishing early """
+        exited_at = self.rt.pre_phase_exited_at
+        return self.pre_phase_trials if exited_at is None else min(self.pre_phase_trials, exited_at)
+
+    def _in_pre_phase(self, trial_num):
+        """ whether the given trial belongs to the pre-phase (querying `pre_phase_exit` if necessary) """
+        rt = self.rt
+        if trial_num >= self._num_pre_phase_trials():
+            return False
+        elif (rt.pre_phase_exited_at is None and self.pre_phase_exit is not None and
+              trial_num > 0 and self.pre_phase_exit.should_exit(self, trial_num)):
+            rt.pre_phase_exited_at = trial_num
+            return False
+        else:
+            return True
+
     def _get_trial_type(self, trial_num):
-        if trial_num < self.pre_phase_trials:
+        if self._in_pre_phase(trial_num):
             return 'pre_phase'
         else:
             if self.fallback.fallback_is_planned(trial_num):
@@ -315,13 +687,79 @@ class Optimiser:
             else:
                 return 'bayes'
 
-    def _select_trial(self, trial_num):
-        """ Get the next input to evaluate """
+    def _select_batch(self, max_trials):
+        """ select the trials to evaluate with the next call to the objective function
+
+        Without a batch objective a single trial is selected. Otherwise trials
+        are selected until the next Bayesian optimisation trial (which requires
+        the results of every trial before it), since the other trials do not
+        depend on the results of one another. The selected trials are marked as
+        started.
+
+        Returns:
+            a list of `(trial_num, x)`
+        """
+        rt = self.rt
+        first = rt.started_trials
+        max_size = 1 if self.batch_objective is None else min(self.max_batch_size, max_trials - first)
+        trials = []
+
+        # the remaining pre-phase trials are selected with a single call to the selector
+        num_pre_phase = min(self._num_pre_phase_trials() - first, max_size)
+        if num_pre_phase > 1:
+            trial_nums = range(first, first + num_pre_phase)
+            for trial_num in trial_nums:
+                self._notify('selection_started', trial_num)
+            lb = self.latent_space.get_latent_bounds()
+            X = self.latent_space.snap(self.pre_phase_select(num_points=num_pre_phase, latent_bounds=lb))
+            for i, trial_num in enumerate(trial_nums):
+                trials.append((trial_num, X[i:i+1]))
+                rt.pending_trials[trial_num] = X[i:i+1]
+                self._notify('selection_finished', trial_num, X[i:i+1], {'type': 'pre_phase'})
+
+        while len(trials) < max_size:
+            trial_num = first + len(trials)
+            trial_type = self._get_trial_type(trial_num)
+            if trials and trial_type == 'bayes':
+                break  # requires the results of the trials before it
+            trials.append((trial_num, self._select_trial(trial_num, trial_type)))
+            # pending so that the selection of the next trial can take it into account
+            rt.pending_trials[trial_num] = trials[-1][1]
+
+        rt.started_trials += len(trials)
+        return trials
+
+    def _get_existing_index(self):
+        """ get a `SpatialIndex` of the finished and pending trials """
+        rt = self.rt
+        if not rt.pending_trials:
+            return rt.finished_index
+        return SpatialIndex(np.vstack([rt.finished_index.points] + list(rt.pending_trials.values())))
+
+    @contextlib.contextmanager
+    def _selection_phase(self, phase, selection_info):
+        """ apply the `concurrency` budget (if any) for a phase of selecting a
+        trial, recording the decision in the selection_info
+        """
+        if self.concurrency is None:
+            yield
+        else:
+            with self.concurrency.phase(self, phase) as allocation:
+                selection_info.setdefault('concurrency', []).append(allocation)
+                yield
+
+    def _select_trial(self, trial_num, trial_type=None):
+        """ Get the next input to evaluate
+
+        Args:
+            trial_num: the trial to select a point for
+            trial_type: the type of the trial if already known (see `_get_trial_type()`)
+        """
         rt = self.rt
         lb = self.latent_space.get_latent_bounds()
 
         self._notify('selection_started', trial_num)
-        trial_type = self._get_trial_type(trial_num)
+        trial_type = trial_type or self._get_trial_type(trial_num)
         selection_info = {'type': trial_type}
 
         if trial_type == 'pre_phase':
@@ -333,11 +771,13 @@ class Optimiser:
 
         elif trial_type == 'bayes':
             X, y = np.vstack(rt.trial_xs), np.array(rt.trial_ys)
-            model, fitting_info = self.surrogate.construct_model(trial_num, X, y)
+            with self._selection_phase('surrogate_fitting', selection_info):
+                model, fitting_info = self.surrogate.construct_model(trial_num, X, y)
             self._notify('surrogate_fitted', trial_num)
 
             acq_fun, acq_info = self._get_acquisition_function(trial_num, model)
-            x, maximisation_info = self.aux_optimiser(lb, acq_fun)
+            with self._selection_phase('acquisition_maximisation', selection_info):
+                x, maximisation_info = self.aux_optimiser(lb, acq_fun)
             self._notify('acquisition_maximised', trial_num)
 
             selection_info.update({'model': model,
@@ -345,60 +785,30 @@ class Optimiser:
                                    'acq_info': acq_info,
                                    'maximisation_info': maximisation_info})
 
-            if self.fallback.point_too_close(x, X):
+            # the maximiser may not have respected any discrete parameters
+            x = self.latent_space.snap(x)
+            existing = self._get_existing_index()
+            if self.fallback.point_too_close(x, existing):
                 # keep the selection info from the Bayes selection
                 selection_info.update({'type': 'fallback', 'fallback_reason': 'too_close', 'bayes_x': x})
-                x = self.fallback.select_trial(self, trial_num)
+                x = None
+                if self.fallback.local_penalty_radius is not None:
+                    # still informed by the surrogate, but steered away from the existing points
+                    with self._selection_phase('acquisition_maximisation', selection_info):
+                        penalised_x, penalised_info = self.aux_optimiser(lb, self.fallback.penalise(acq_fun, existing))
+                    selection_info['penalised_maximisation_info'] = penalised_info
+                    if penalised_x is not None:
+                        penalised_x = self.latent_space.snap(penalised_x)
+                        if not self.fallback.point_too_close(penalised_x, existing):
+                            selection_info['fallback_reason'] = 'too_close_penalised'
+                            x = penalised_x
+                if x is None:
+                    x = self.fallback.select_trial(self, trial_num)
 
         else:
             raise ValueError('unknown trial type: {}'.format(trial_type))
 
+        # a no-op for continuous latent spaces
+        x = self.latent_space.snap(x)
         self._notify('selection_finished', trial_num, x, selection_info)
         return x
-
-
-
-    #TODO: need to wait for pre_phase to finish completely before continuing when using async.
-
-
-    '''
-    def _next_async_trial(self, iteration):
-        if self.async_eval.has_pending_trials():
-            if self.plan.in_pre_phase(self.iteration):
-                return self.pre_phase_select(n), {}
-
-            # a parallel strategy is required
-            #TODO
-        else:
-            # no pending trials => behaviour the same as when running synchronously
-            return self._next_trial()
-
-    def run_async(self, max_trials):
-        self._check_configuration()
-        started = 0
-        trial_xs = []
-        trial_ys = []
-        while started < max_trials:
-            while self.async_eval.get_free_capacity() > 0 and started < max_trials:
-                x, extra_data = self._next_async_trial()
-                self.async_eval.start_trial(x)
-                started += 1
-
-            # wait until more trials can be started
-            self.async_eval.wait_for_capacity()
-            # then store any trials which finished in the meantime.
-            xs, ys = self.async_eval.get_finished_trials(wait=False)
-            trial_xs.extend(xs)
-            trial_ys.extend(ys)
-
-        # all trials have been started, now wait for them to finish
-        xs, ys = self.async_eval.get_finished_trials(wait=True)
-        trial_xs.extend(xs)
-        trial_ys.extend(ys)
-    '''
-
-
-
-
-
-
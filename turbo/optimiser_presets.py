@@ -9,10 +9,14 @@ def load_optimiser_preset(optimiser, name):
     if name == 'default':
         # this default should hopefully provide reasonable results in most situations
         # the Optimiser.Plan defaults are left alone
-        optimiser.latent_space = tm.NoLatentSpace()
         optimiser.pre_phase_select = tm.LHS_selector(num_total=optimiser.pre_phase_trials)
         optimiser.fallback = tm.Fallback(selector=tm.random_selector())
-        optimiser.aux_optimiser = tm.RandomAndQuasiNewton()
+        if optimiser.bounds.is_continuous():
+            optimiser.latent_space = tm.NoLatentSpace()
+            optimiser.aux_optimiser = tm.RandomAndQuasiNewton()
+        else:
+            optimiser.latent_space = tm.OneHotLatentSpace()
+            optimiser.aux_optimiser = tm.DiscreteRandomAndQuasiNewton()
         optimiser.surrogate = tm.GPySurrogate()
         '''
         optimiser.surrogate = tm.SciKitGPSurrogate(model_params=dict(
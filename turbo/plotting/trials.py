@@ -181,14 +181,15 @@ class DecodedTrial:
         self.is_bayes = bool(trial_type == 'bayes')
         self.is_fallback = bool(trial_type == 'fallback')
 
+        self.bayes_x = None
         if self.is_fallback:
             self.fallback_reason = info['fallback_reason']
-            if self.fallback_reason == 'too_close':
+            if self.fallback_reason in ('too_close', 'too_close_penalised'):
                 # the point chosen by Bayesian optimisation that was too close
                 # to an already tested point and so was discarded.
                 self.bayes_x = info['bayes_x']
 
-        self.has_surrogate = self.is_bayes or (self.is_fallback and self.fallback_reason == 'too_close')
+        self.has_surrogate = self.is_bayes or self.bayes_x is not None
         if self.has_surrogate:
             self.model = info['model']
             self.acq_fun = rec.get_acquisition_function(trial_num)
@@ -268,15 +269,15 @@ class DecodedParam:
         if plot_in_latent_space:
             # linear in the latent space, transform this back to get the points in the input space
             self.latent_range = opt.latent_space.linear_latent_range(param_name, divisions) # the input space range
-            self.input_range = np.array([opt.latent_space.param_from_latent(param_name, p) for p in self.latent_range])
+            self.input_range = opt.latent_space.param_from_latent(param_name, self.latent_range)
         else:
             # linear in the input space, transform this to get the points in the latent space
             self.input_range = np.linspace(*opt.bounds.get(param_name), num=divisions) # the input space range
-            self.latent_range = np.array([opt.latent_space.param_to_latent(param_name, p) for p in self.input_range])
+            self.latent_range = opt.latent_space.param_to_latent(param_name, self.input_range)
 
         self.plot_range = self.latent_range if plot_in_latent_space else self.input_range
         self.plot_bounds = latent_bounds.get(self.latent_name) if plot_in_latent_space else opt.bounds.get(param_name)
-        self.finished_vals = [self.get_plot_val(x) for x in finished_xs]
+        self.finished_vals = self.get_plot_vals(finished_xs)
         self.trial_val = self.get_plot_val(trial.x)
         self.label = 'parameter {}{}'.format(self.name, ' (latent space)' if plot_in_latent_space else '')
 
@@ -285,6 +286,15 @@ class DecodedParam:
         val = latent_point.flatten()[self.latent_index]
         return val if self._plot_in_latent_space else self._rec.optimiser.latent_space.param_from_latent(self.name, val)
 
+    def get_plot_vals(self, latent_points):
+        '''like `get_plot_val()` but for a list of latent space points, converted all at once '''
+        if len(latent_points) == 0:
+            return []
+        vals = np.vstack([row_2d(p) for p in latent_points])[:, self.latent_index]
+        if not self._plot_in_latent_space:
+            vals = self._rec.optimiser.latent_space.param_from_latent(self.name, vals)
+        return list(vals)
+
     def latent_line_through(self, point):
         '''generate a list of points which span the latent range of this
         parameter, forming a line and passing through the given point.
@@ -374,7 +384,7 @@ def plot_trial_1D(rec, param, trial_num, true_objective=None,
                 'n_sigma == "beta" only possible when using the UCB/LCB acquisition function'
             n_sigma = rec.trials[trial_num].selection_info['acq_info']['beta']
 
-    if t.is_fallback and t.fallback_reason == 'too_close':
+    if t.bayes_x is not None:
         # the value of the parameter for the point selected by Bayesian
         # optimisation that was discarded
         bayes_val = param.get_plot_val(t.bayes_x)
@@ -433,7 +443,7 @@ def plot_trial_1D(rec, param, trial_num, true_objective=None,
                  '*', markersize=10, color=Config.trial_marker_colors['incumbent'], zorder=10, markeredgewidth=0.5, markeredgecolor=Config.trial_edge_colors['incumbent'], label='incumbent')
 
     ax1.axvline(x=param.trial_val, linewidth=bar_width, color=bar_color)
-    if t.is_fallback and t.fallback_reason == 'too_close':
+    if t.bayes_x is not None:
         ax1.axvline(x=bayes_val, linewidth=bar_width, color='orange')
     ax1.plot(param.trial_val, t.trial.y, 'bo', markersize=6, alpha=0.4, markeredgecolor=Config.trial_edge_colors['bayes'], label='this trial')
 
@@ -478,7 +488,7 @@ def plot_trial_1D(rec, param, trial_num, true_objective=None,
                      alpha=0.3, color='palegreen')
 
     ax2.axvline(x=param.trial_val, linewidth=bar_width, color=bar_color)
-    if t.is_fallback and t.fallback_reason == 'too_close':
+    if t.bayes_x is not None:
         ax2.axvline(x=bayes_val, linewidth=bar_width, color='orange')
         ax2.plot(bayes_val, t.acq_x, '^', color='orange',
                  markersize=7, zorder=10)
@@ -577,7 +587,7 @@ def plot_trial_2D(rec, x_param, y_param, trial_num, true_objective=None,
         acq_points = t.acq_fun(params.latent_plane_points)
         acq = params.points_to_grid(acq_points)
 
-    if t.is_fallback and t.fallback_reason == 'too_close':
+    if t.bayes_x is not None:
         # the value of the parameter for the point selected by Bayesian
         # optimisation that was discarded
         bayes_x_val = x_param.get_plot_val(t.bayes_x)
@@ -637,7 +647,7 @@ def plot_trial_2D(rec, x_param, y_param, trial_num, true_objective=None,
                 markeredgecolor='black', markeredgewidth=1.0, markersize=10, zorder=11,
                 linestyle='None', label='this trial')
 
-        if t.is_fallback and t.fallback_reason == 'too_close':
+        if t.bayes_x is not None:
             ax.plot(bayes_x_val, bayes_y_val, marker='s', color='orange',
                 markeredgecolor='black', markeredgewidth=1.0, markersize=10,
                 linestyle='None', label='Bayes suggestion')
@@ -38,7 +38,10 @@ class Recorder(tm.Listener):
         plotting and the optimisation process itself.
 
     Attributes:
-        trials: a list of Trial objects recorded from the optimiser
+        trials: a dictionary of trial number to Trial objects recorded from the optimiser
+        failed_trials: a dictionary of trial number to Trial objects for the
+            trials which failed to produce a result. Their `eval_info`
+            describes the failure and `y` is None.
     """
     class Trial:
         def __init__(self):
@@ -49,9 +52,12 @@ class Recorder(tm.Listener):
             self.selection_time = None
             self.eval_info = None
             self.eval_time = None
+            self.cache_hit = False  # whether the result was taken from `Optimiser.eval_cache`
+            self.queue_time = None  # time waiting for resources before evaluation (excluded from eval_time)
 
         def __repr__(self):
-            attrs = ('trial_num', 'x', 'y', 'selection_info', 'selection_time', 'eval_info', 'eval_time')
+            attrs = ('trial_num', 'x', 'y', 'selection_info', 'selection_time', 'eval_info', 'eval_time',
+                     'cache_hit', 'queue_time')
             return 'Trial({})'.format(', '.join('{}={}'.format(k, getattr(self, k)) for k in attrs))
 
         def is_pre_phase(self):
@@ -100,6 +106,7 @@ class Recorder(tm.Listener):
         """
         self.runs = []
         self.trials = {}
+        self.failed_trials = {}
         self.description = description
         self.unfinished_trial_nums = set()
         self.optimiser = optimiser
@@ -164,6 +171,8 @@ class Recorder(tm.Listener):
 
     def get_summary(self):
         s = '{} trials over {} run{}\n'.format(len(self.trials), len(self.runs), 's' if len(self.runs) > 1 else '')
+        if self.failed_trials:
+            s += 'failed trials: {}\n'.format(sorted(self.failed_trials))
         for i, r in enumerate(self.runs):
             if r.is_finished():
                 s += 'run {}: {} trials in {}, started {}\n'.format(i, r.num_trials, tb.utils.duration_string(r.duration), r.start_date)
@@ -205,11 +214,28 @@ class Recorder(tm.Listener):
         t = self.trials[trial_num]
         t.y = y
         t.eval_info = eval_info
-        t.eval_time = time.time() - t.eval_time
+        t.queue_time = Recorder._get_queue_time(eval_info)
+        t.eval_time = time.time() - t.eval_time - (t.queue_time or 0)
+        t.cache_hit = tm.is_cache_hit(eval_info)
         self.unfinished_trial_nums.remove(trial_num)
         if self.autosave_filename is not None:
             self.save_compressed(self.autosave_filename, overwrite=True)
 
+    def evaluation_failed(self, trial_num, eval_info):
+        t = self.trials.pop(trial_num)
+        t.eval_info = eval_info
+        t.queue_time = Recorder._get_queue_time(eval_info)
+        t.eval_time = time.time() - t.eval_time - (t.queue_time or 0)
+        self.failed_trials[trial_num] = t
+        self.unfinished_trial_nums.remove(trial_num)
+        if self.autosave_filename is not None:
+            self.save_compressed(self.autosave_filename, overwrite=True)
+
+    @staticmethod
+    def _get_queue_time(eval_info):
+        """ the time the trial spent waiting for resources (see `turbo.modules.ResourceScheduler`) """
+        return eval_info.get('queue_time') if isinstance(eval_info, dict) else None
+
     def run_finished(self):
         r = self.runs[-1]
         r.finish()
@@ -242,7 +268,7 @@ class Recorder(tm.Listener):
 
     def get_data_for_trial(self, trial_num):
         #TODO: for async cannot assume that finished == all trials before trial_num
-        finished = [self.trials[n] for n in range(trial_num)]
+        finished = [self.trials[n] for n in range(trial_num) if n in self.trials]
         trial = self.trials[trial_num]
         return finished, trial
 
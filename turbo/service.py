@@ -0,0 +1,503 @@
+#!/usr/bin/env python3
+""" A service which hosts many optimisers (studies) and shares one pool of
+threads between them """
+
+import os
+import json
+import threading
+import traceback
+import socketserver
+import numpy as np
+from collections import OrderedDict, deque
+from concurrent.futures import Future
+
+from . import net
+from .optimiser import Optimiser
+from .recorder import Recorder
+from .modules.async_eval import TrialFailure
+
+
+class _FairPool:
+    """ a pool of threads which runs the tasks of several studies, taking turns
+    between the studies with queued tasks
+
+    The tasks of each study run in the order they were submitted, except that
+    an exclusive task (one which reads or modifies the optimiser of the study)
+    does not run at the same time as another exclusive task of the same study.
+    Rather than waiting, the thread runs the next task which can run (of the
+    same study or of another study).
+    """
+    def __init__(self, num_threads):
+        self._changed = threading.Condition()  # guards the state below
+        self._queues = OrderedDict()  # study name to deque of (function, future, exclusive), in turn order
+        self._busy = set()  # studies with an exclusive task running
+        self._stopping = False
+        self._threads = [threading.Thread(target=self._work, daemon=True) for _ in range(num_threads)]
+        for t in self._threads:
+            t.start()
+
+    def submit(self, study, function, exclusive):
+        """ queue `function()` to run as a task of the given study
+
+        Returns:
+            a `concurrent.futures.Future` for the result
+        """
+        future = Future()
+        with self._changed:
+            assert not self._stopping, 'the pool has been shut down'
+            self._queues.setdefault(study, deque()).append((function, future, exclusive))
+            self._changed.notify()
+        return future
+
+    def _next_task(self):
+        for study, queue in self._queues.items():
+            busy = study in self._busy
+            for i, task in enumerate(queue):
+                if not (busy and task[2]):
+                    del queue[i]
+                    self._queues.move_to_end(study)  # the other studies go first next time
+                    return study, task
+        return None, None
+
+    def _work(self):
+        while True:
+            with self._changed:
+                study, task = self._next_task()
+                while task is None:
+                    if self._stopping:
+                        return
+                    self._changed.wait()
+                    study, task = self._next_task()
+                function, future, exclusive = task
+                if exclusive:
+                    self._busy.add(study)
+            if future.set_running_or_notify_cancel():
+                try:
+                    future.set_result(function())
+                except BaseException as e:
+                    future.set_exception(e)
+            with self._changed:
+                if exclusive:
+                    self._busy.discard(study)
+                    self._changed.notify_all()
+
+    def shutdown(self):
+        """ finish the queued tasks then stop the threads """
+        with self._changed:
+            self._stopping = True
+            self._changed.notify_all()
+        for t in self._threads:
+            t.join()
+
+
+class _Study:
+    def __init__(self, name, optimiser, max_trials, concurrency, pre_phase_quorum, state_file):
+        self.name = name
+        self.optimiser = optimiser
+        self.max_trials = max_trials
+        self.concurrency = concurrency
+        self.pre_phase_quorum = pre_phase_quorum
+        self.state_file = state_file
+        self.pre_phase_xs = []  # the remaining pre-phase points, selected up front
+        self.params = {}  # trial_num to the parameters of the trials which have been asked for
+        self.trial_types = {}  # trial_num to 'pre_phase' or 'bayes' for the trials which have been asked for
+        self.num_active = 0  # selections and evaluations in progress (when the service evaluates the trials)
+        self.error = None  # the traceback of an error which stopped the study (when the service evaluates the trials)
+        self.finished = threading.Event()  # set once the study has finished or stopped with an error
+
+    def is_finished(self):
+        rt = self.optimiser.rt
+        return rt.finished_trials + rt.failed_trials >= self.max_trials
+
+
+class OptimisationService:
+    """ hosts many optimisers (studies) which share one pool of threads
+
+    Each study is either evaluated by the service (if its optimiser has an
+    objective function) or by clients which ask for trials and tell the
+    results, either in process with `ask()` and `tell()` or over a socket with a
+    `ServiceClient`.
+
+    The selection of trials (fitting the surrogate and maximising the
+    acquisition function) and the evaluation of trials are tasks which run on
+    the shared pool. The studies take turns to run their queued tasks, so a
+    study with many queued tasks does not hold back the others. Only one task
+    which uses the optimiser of a study runs at a time, but while a study is
+    fitting its surrogate, the other threads run the selections and evaluations
+    of other studies.
+
+    If selecting or recording a trial of a study which is evaluated by the
+    service raises an exception, the study stops: `wait()` raises an error and
+    the summary from `list_studies()` includes the traceback.
+
+    If a `state_dir` is given, the finished trials of each study are appended
+    to `state_dir/<name>.jsonl` as they arrive. A study which is added with the
+    same name later (eg after the service restarts) resumes from these trials
+    (including the failed trials). Trials which were asked for but not told
+    are lost.
+
+    Note:
+        threads are used so that the optimisers can be shared without copying.
+        The bulk of the numerical work (linear algebra and objective functions
+        which call other processes) releases the GIL.
+    """
+    def __init__(self, num_workers=None, address=None, state_dir=None):
+        """
+        Args:
+            num_workers: the number of threads in the shared pool (None for the number of cores)
+            address: the path of a Unix socket or `(host, port)` to listen for
+                `ServiceClient` connections on, or None to not listen
+            state_dir: the directory to store the trials of each study in, or
+                None to not persist the studies
+        """
+        self.num_workers = num_workers or os.cpu_count() or 1
+        self.state_dir = state_dir
+        if state_dir is not None:
+            os.makedirs(state_dir, exist_ok=True)
+        self._lock = threading.Lock()  # guards _studies and the num_active of each study
+        self._studies = {}
+        self._pool = _FairPool(self.num_workers)
+
+        self._server = None
+        self.address = None
+        if address is not None:
+            service = self
+
+            class Handler(socketserver.BaseRequestHandler):
+                def handle(self):
+                    net.serve_connection(self.request, service._handle)
+
+            if isinstance(address, str):
+                if os.path.exists(address):
+                    os.unlink(address)  # left behind by a previous service
+                self._server = _UnixServer(address, Handler)
+                self.address = address
+            else:
+                self._server = _TCPServer(address, Handler)
+                self.address = self._server.server_address[:2]
+            self._thread = threading.Thread(target=self._server.serve_forever, kwargs={'poll_interval': 0.1},
+                                            daemon=True)
+            self._thread.start()
+
+    def add_study(self, name, optimiser, max_trials, concurrency=1, pre_phase_quorum=1.0):
+        """ start hosting a study
+
+        Args:
+            name (str): a unique name for the study
+            optimiser: the optimiser for the study, which must not be running
+            max_trials: the number of trials to run the study to
+            concurrency: the maximum number of trials to evaluate at once (only
+                used if the optimiser has an objective function)
+            pre_phase_quorum: the fraction of the pre-phase which must finish
+                before Bayesian optimisation starts
+        """
+        assert concurrency >= 1 and 0 <= pre_phase_quorum <= 1
+        assert optimiser.batch_objective is None, 'batch objectives are not supported'
+        state_file = None if self.state_dir is None else os.path.join(self.state_dir, name + '.jsonl')
+        study = _Study(name, optimiser, max_trials, concurrency, pre_phase_quorum, state_file)
+        with self._lock:
+            assert name not in self._studies, 'a study called "{}" already exists'.format(name)
+            self._studies[name] = study
+        self._run_task(study, lambda: self._start_study(study))
+        if optimiser.objective is not None:
+            self._pump(study)
+
+    def create_study(self, name, desired_extremum, bounds, pre_phase_trials, max_trials, settings_preset='default'):
+        """ start hosting a study with a new optimiser which is evaluated by clients """
+        optimiser = Optimiser(None, desired_extremum, bounds, pre_phase_trials, settings_preset)
+        self.add_study(name, optimiser, max_trials)
+
+    def get_study(self, name):
+        """ get the optimiser of the given study (which must not be modified) """
+        return self._studies[name].optimiser
+
+    def list_studies(self):
+        """ get a summary of every study
+
+        Returns:
+            a dictionary of study name to a dictionary with the number of
+            `started`, `finished` and `failed` trials, `max_trials`, the
+            `incumbent` as `[trial_num, params, y]` (or None) and the `error`
+            which stopped the study (or None)
+        """
+        with self._lock:
+            studies = list(self._studies.values())
+        return {s.name: self._run_task(s, lambda s=s: self._summarise(s)) for s in studies}
+
+    def ask(self, name):
+        """ start the next trial of the given study
+
+        Returns:
+            a dictionary with the `'status'`: `'trial'` along with the
+            `'trial_num'` and `'params'` to evaluate, `'wait'` if no trial can
+            be started until more results are told, or `'finished'`
+        """
+        study = self._studies[name]
+        return self._run_task(study, lambda: self._ask(study))
+
+    def tell(self, name, trial_num, y, eval_info=None, error=None):
+        """ report the result of a trial of the given study
+
+        Args:
+            error: if not None, the trial failed (with the given error message)
+                and `y` is ignored
+        """
+        study = self._studies[name]
+        result = (y, eval_info) if error is None else TrialFailure('exception', error)
+        self._run_task(study, lambda: self._tell(study, trial_num, result))
+
+    def wait(self, name=None, timeout=None):
+        """ wait for the given study (or every study) to finish
+
+        Returns:
+            whether the studies have finished
+
+        Raises:
+            RuntimeError: if a study stopped because of an error
+        """
+        with self._lock:
+            studies = list(self._studies.values()) if name is None else [self._studies[name]]
+        finished = all(s.finished.wait(timeout) for s in studies)
+        for s in studies:
+            if s.error is not None:
+                raise RuntimeError('study "{}" stopped because of an error:\n{}'.format(s.name, s.error))
+        return finished
+
+    def shutdown(self):
+        """ stop listening and stop the pool (once the queued tasks have finished) """
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._thread.join()
+            if isinstance(self.address, str) and os.path.exists(self.address):
+                os.unlink(self.address)
+        self._pool.shutdown()
+
+    def _run_task(self, study, function):
+        """ run an exclusive task of the study on the pool and wait for the result """
+        return self._pool.submit(study.name, function, exclusive=True).result()
+
+    def _submit_background(self, study, function, exclusive):
+        """ run a task of the study on the pool without waiting for it,
+        stopping the study if the task raises an exception
+        """
+        def done(future):
+            e = future.exception()
+            if e is not None:
+                study.error = ''.join(traceback.format_exception(type(e), e, e.__traceback__))
+                study.finished.set()
+        self._pool.submit(study.name, function, exclusive).add_done_callback(done)
+
+    def _start_study(self, study):
+        opt = study.optimiser
+        assert not opt.rt.running
+        if study.state_file is not None and os.path.exists(study.state_file):
+            opt.load_trials(self._load_trials(study.state_file))
+        opt.latent_space._set_input_bounds(opt.bounds)
+        opt._check_settings()
+        opt.rt.running = True
+        opt.rt.max_trials = study.max_trials
+        opt._notify('run_started', opt.rt.finished_trials, study.max_trials)
+        study.pre_phase_xs = opt._select_pre_phase_points(study.max_trials)
+        self._check_finished(study)
+
+    def _ask(self, study):
+        opt = study.optimiser
+        rt = opt.rt
+        while rt.started_trials < study.max_trials:
+            trial_num = rt.started_trials
+            trial_type, x = opt._next_concurrent_point(trial_num, study.pre_phase_xs, study.pre_phase_quorum,
+                                                       study.max_trials)
+            if trial_type is None:
+                return {'status': 'wait'}
+            elif trial_type == 'bayes':
+                x = opt._select_trial(trial_num)
+            study.trial_types[trial_num] = trial_type
+            params = opt._start_concurrent_trial(trial_num, x)
+            if params is None:  # a cache hit
+                self._save_trial(study, trial_num, x, rt.trial_ys[-1])
+                self._check_finished(study)
+                continue
+            study.params[trial_num] = params
+            return {'status': 'trial', 'trial_num': trial_num, 'params': params}
+        return {'status': 'finished'}
+
+    def _tell(self, study, trial_num, result):
+        opt = study.optimiser
+        assert trial_num in study.params, 'trial {} was not asked for (or was already told)'.format(trial_num)
+        x = opt.rt.pending_trials[trial_num]
+        opt._finish_concurrent_trial(trial_num, study.params.pop(trial_num), result)
+        if isinstance(result, TrialFailure):
+            self._save_trial(study, trial_num, x, None, failure=result)
+        else:
+            self._save_trial(study, trial_num, x, opt.rt.trial_ys[-1])
+        opt.rt.check_consistency()
+        self._check_finished(study)
+
+    def _check_finished(self, study):
+        opt = study.optimiser
+        if study.is_finished() and opt.rt.running:
+            opt.rt.running = False
+            opt._notify('run_finished')
+            study.finished.set()
+
+    def _summarise(self, study):
+        rt = study.optimiser.rt
+        incumbent = None
+        if rt.finished_trials > 0:
+            i, x, y = study.optimiser.get_incumbent(as_dict=True)
+            incumbent = [i, x, y]
+        return {'started': rt.started_trials, 'finished': rt.finished_trials, 'failed': rt.failed_trials,
+                'max_trials': study.max_trials, 'incumbent': incumbent, 'error': study.error}
+
+    def _pump(self, study):
+        """ keep `study.concurrency` trials selecting or evaluating for a study which is evaluated by the service """
+        with self._lock:
+            num_new = study.concurrency - study.num_active
+            if study.finished.is_set() or num_new <= 0:
+                return
+            study.num_active += num_new
+        for _ in range(num_new):
+            self._submit_background(study, lambda: self._auto_select(study), exclusive=True)
+
+    def _auto_select(self, study):
+        evaluating = False
+        try:
+            res = self._ask(study)
+            if res['status'] == 'trial':
+                self._submit_background(study, lambda: self._auto_evaluate(study, res['trial_num'], res['params']),
+                                        exclusive=False)
+                evaluating = True
+        finally:
+            if not evaluating:
+                with self._lock:
+                    study.num_active -= 1  # started again once more results arrive
+
+    def _auto_evaluate(self, study, trial_num, params):
+        try:
+            result = study.optimiser.objective(**params)
+        except Exception:
+            result = TrialFailure('exception', traceback.format_exc())
+
+        def finish():
+            try:
+                self._tell(study, trial_num, result)
+            finally:
+                with self._lock:
+                    study.num_active -= 1
+            self._pump(study)
+        self._submit_background(study, finish, exclusive=True)
+
+    def _save_trial(self, study, trial_num, x, y, failure=None):
+        if study.state_file is None:
+            return
+        record = {'trial_num': trial_num, 'x': np.asarray(x).tolist(), 'y': None if failure else float(y),
+                  'type': study.trial_types.pop(trial_num, None)}
+        if failure is not None:
+            # failed trials count towards max_trials and the pre-phase quorum
+            record['failure'] = {'reason': failure.eval_info['reason'], 'error': str(failure.eval_info['error'])}
+        with open(study.state_file, 'a') as f:
+            f.write(json.dumps(record) + '\n')
+
+    @staticmethod
+    def _load_trials(filename):
+        trials = []
+        with open(filename, 'r') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue  # a partially written line from an interrupted service
+                t = Recorder.Trial()
+                t.trial_num = record['trial_num']
+                t.x = np.array(record['x'], dtype=float).reshape(1, -1)
+                t.y = record['y']
+                t.selection_info = {'type': record['type'], 'resumed': True}
+                if 'failure' in record:
+                    t.eval_info = dict(record['failure'], failed=True)
+                trials.append(t)
+        return trials
+
+    def _handle(self, msg):
+        """ handle a request from a `ServiceClient`
+
+        Returns:
+            the response
+        """
+        try:
+            if msg['type'] == 'ask':
+                return self.ask(msg['study'])
+            elif msg['type'] == 'tell':
+                self.tell(msg['study'], msg['trial_num'], msg['y'], msg.get('eval_info'), msg.get('error'))
+            elif msg['type'] == 'create_study':
+                self.create_study(msg['study'], msg['desired_extremum'], msg['bounds'], msg['pre_phase_trials'],
+                                  msg['max_trials'], msg.get('settings_preset', 'default'))
+            elif msg['type'] == 'list_studies':
+                return {'status': 'ok', 'studies': self.list_studies()}
+            else:
+                raise ValueError('unknown request type: {}'.format(msg['type']))
+            return {'status': 'ok'}
+        except Exception as e:
+            return {'status': 'error', 'error': '{}: {}'.format(type(e).__name__, e)}
+
+
+class _UnixServer(socketserver.ThreadingUnixStreamServer):
+    daemon_threads = True
+
+
+class _TCPServer(socketserver.ThreadingTCPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+
+
+class ServiceClient:
+    """ a connection to an `OptimisationService` for creating studies and
+    evaluating their trials with ask/tell
+
+    Note:
+        not thread safe, use a separate client for each thread
+    """
+    def __init__(self, address, retry_time=10.0):
+        """
+        Args:
+            address: the `address` of the service
+            retry_time: how long to keep trying to reach the service in seconds
+        """
+        # asking may wait for a surrogate to be fitted, so there is no timeout
+        self._client = net.Client(address, retry_time, timeout=None)
+
+    def _request(self, msg):
+        res = self._client.request(msg)
+        if res is None:
+            raise ConnectionError('cannot reach the optimisation service')
+        elif res['status'] == 'error':
+            raise RuntimeError(res['error'])
+        return res
+
+    def create_study(self, name, desired_extremum, bounds, pre_phase_trials, max_trials, settings_preset='default'):
+        """ see `OptimisationService.create_study()` """
+        self._request({'type': 'create_study', 'study': name, 'desired_extremum': desired_extremum,
+                       'bounds': bounds, 'pre_phase_trials': pre_phase_trials, 'max_trials': max_trials,
+                       'settings_preset': settings_preset})
+
+    def ask(self, name):
+        """ see `OptimisationService.ask()` """
+        return self._request({'type': 'ask', 'study': name})
+
+    def tell(self, name, trial_num, y, eval_info=None, error=None):
+        """ see `OptimisationService.tell()` """
+        self._request({'type': 'tell', 'study': name, 'trial_num': trial_num, 'y': y,
+                       'eval_info': eval_info, 'error': error})
+
+    def list_studies(self):
+        """ see `OptimisationService.list_studies()` """
+        return self._request({'type': 'list_studies'})['studies']
+
+    def close(self):
+        self._client.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
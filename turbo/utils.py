@@ -2,6 +2,7 @@
 
 import sys
 import numpy as np
+import scipy.spatial
 import os
 import dill  # regular pickle can't pickle lambdas (and has lots of other problems)
 import gzip
@@ -130,25 +131,157 @@ def close_to_any(x, xs, tol=1e-5):
     return np.any(np.sum((xs - x)**2, axis=1) <= tol) # squared Euclidean distance
 
 
-#TODO: test
 def unique_rows_close(arr, close_tolerance):
     """
     Returns:
         a subset of the rows of the given array which are further from each
-        other by at least the given closeness tolerance.
+        other by at least the given closeness tolerance (squared Euclidean
+        distance, like `close_to_any()`).
     """
     assert arr.shape[0] > 0
-    avoid = np.empty(shape=(0, arr.shape[1]))
+    avoid = SpatialIndex(num_dims=arr.shape[1])
+    radius = np.sqrt(close_tolerance)
     keep_rows = []
 
     for i, r in enumerate(arr):
-        r = row_2d(r)
-        if not close_to_any(r, avoid, close_tolerance):
-            avoid = np.append(avoid, r, axis=0)
+        if not avoid.any_within(r, radius):
+            avoid.add(r)
             keep_rows.append(i)
     return arr[keep_rows]
 
 
+class SpatialIndex:
+    """ An index over a growing set of points which answers proximity queries
+    ('is any point within a distance' and 'nearest neighbour') in roughly
+    logarithmic time.
+
+    k-d trees cannot be updated incrementally, so the points are split into
+    contiguous blocks following the binary representation of the number of
+    points (eg 13 points => blocks of 8, 4 and 1). Each block has its own tree
+    (except the last few points, which are searched by brute force),
+    and adding points only rebuilds the trees of the blocks which change. Each
+    point is involved in O(log n) rebuilds over the lifetime of the index and a
+    query searches O(log n) trees.
+
+    Note:
+        distances are Euclidean, unlike the tolerance of `close_to_any()`
+        which is a squared distance.
+    """
+    # fewer points than this are searched by brute force rather than a tree
+    min_tree_size = 64
+
+    def __init__(self, points=None, num_dims=None):
+        """
+        Args:
+            points: initial points to index `shape=(num_points, num_dims)`
+            num_dims: the number of dimensions of the points (inferred from
+                the first points added if not given)
+        """
+        self.num_dims = num_dims
+        self._data = None  # storage with spare capacity, only the first _n rows are used
+        self._n = 0
+        self._blocks = []  # list of (start, end, tree or None)
+        if points is not None:
+            self.add(points)
+
+    def __len__(self):
+        return self._n
+
+    def __getstate__(self):
+        # the trees are rebuilt when needed
+        state = self.__dict__.copy()
+        state['_blocks'] = []
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._update_blocks()
+
+    @property
+    def points(self):
+        """ the indexed points (as rows) in the order they were added """
+        if self._data is None:
+            return np.empty((0, self.num_dims or 0))
+        return self._data[:self._n]
+
+    def add(self, points):
+        """ add a point or matrix of points (as rows) to the index """
+        points = np.array(points, dtype=float, ndmin=2)
+        if self.num_dims is None:
+            self.num_dims = points.shape[1]
+        assert points.shape[1] == self.num_dims, 'different number of attributes'
+        n = self._n + points.shape[0]
+        if self._data is None or n > self._data.shape[0]:
+            capacity = max(n, 2 * (0 if self._data is None else self._data.shape[0]), 16)
+            data = np.empty((capacity, self.num_dims))
+            data[:self._n] = self.points
+            self._data = data
+        self._data[self._n:n] = points
+        self._n = n
+        self._update_blocks()
+
+    def _update_blocks(self):
+        """ rebuild the blocks which changed as a result of points being added """
+        existing = {(start, end): tree for start, end, tree in self._blocks}
+        blocks = []
+        start = 0
+        # blocks of (power of 2) * min_tree_size points each have a tree
+        num_chunks = self._n // self.min_tree_size
+        for bit in reversed(range(num_chunks.bit_length())):
+            if num_chunks & (1 << bit):
+                end = start + (1 << bit) * self.min_tree_size
+                tree = existing.get((start, end))
+                if tree is None:
+                    tree = scipy.spatial.cKDTree(self._data[start:end])
+                blocks.append((start, end, tree))
+                start = end
+        # the remaining (< min_tree_size) points are searched by brute force
+        if start < self._n:
+            blocks.append((start, self._n, None))
+        self._blocks = blocks
+
+    def nearest(self, X, max_distance=np.inf):
+        """ find the nearest indexed point to each of the given points
+
+        Args:
+            X: a point or matrix of points (as rows) to query
+            max_distance: points further than this are not considered, which
+                makes the query faster
+
+        Returns:
+            (distances, indices) arrays with an element for each row of `X`.
+            Where no point is found, the distance is infinity and the index is -1.
+        """
+        X = np.array(X, dtype=float, ndmin=2)
+        best_d = np.full(X.shape[0], np.inf)
+        best_i = np.full(X.shape[0], -1, dtype=int)
+        for start, end, tree in self._blocks:
+            if tree is None:
+                sq_dists = np.sum((X[:, np.newaxis, :] - self._data[np.newaxis, start:end, :])**2, axis=2)
+                i = np.argmin(sq_dists, axis=1)
+                d = np.sqrt(sq_dists[np.arange(X.shape[0]), i])
+                d[d > max_distance] = np.inf
+            else:
+                d, i = tree.query(X, k=1, distance_upper_bound=max_distance)
+            closer = d < best_d
+            best_d[closer] = d[closer]
+            best_i[closer] = i[closer] + start
+        return best_d, best_i
+
+    def any_within(self, X, radius):
+        """ whether any indexed point lies within the given Euclidean distance
+        (inclusive) of the given point, or of each row of the given matrix
+
+        Returns:
+            a bool for a single point `shape=(num_dims,)`, otherwise an array of bools
+        """
+        # loosen the bound so that points at exactly radius are included (the
+        # tree compares squared distances, so the bound must not underflow)
+        d, _ = self.nearest(X, max_distance=max(radius * (1 + 1e-9), 1e-100))
+        within = d <= radius
+        return bool(within[0]) if np.ndim(X) == 1 else within
+
+
 def remap(values, range_a, range_b):
     """ map the values which live in range_a to range_b
 